@@ -4,7 +4,70 @@ class Settings(BaseSettings):
     postgres_url: str
     openrouter_api_key: str
     llm_model: str = "mistralai/mistral-7b-instruct"
-    embedding_backend: str = "openai"
+    embedding_backend: str = "openai"  # "openai" or "local"
+    # Local (sentence-transformers) backend; 0 threads leaves the choice to torch / onnxruntime
+    local_embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    local_embedding_batch_size: int = 64
+    local_embedding_threads: int = 0
+    local_embedding_onnx: bool = False
+    local_embedding_onnx_file: str = ""
+    pg_pool_min: int = 1
+    pg_pool_max: int = 10
+    pg_pool_timeout: float = 10.0
+    pg_pool_idle_check_seconds: float = 30.0
+    use_profile_table: bool = False
+    ingest_jobs_dir: str = "../ingest_jobs"
+    # Parallel keyset-range readers; keep pg_pool_max above this
+    ingest_fetch_workers: int = 1
+    vector_backend: str = "chroma"  # "chroma" or "numpy"
+    chroma_path: str = "../chroma_db"
+    # HNSW graph degree and build/search beam widths (M and ef_construction apply to new collections)
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 100
+    hnsw_ef_search: int = 100
+    numpy_index_path: str = "../numpy_index"
+    # How often buffered writes are flushed; display fields go out with the vectors, whatever the backend
+    numpy_flush_seconds: float = 30.0
+    numpy_quantization: str = "none"  # "none" or "int8"
+    numpy_rescore_depth: int = 200
+    index_keep_versions: int = 2
+    # Display fields, stored column-wise outside the vector index
+    profile_store_path: str = "../profile_store"
+    # Share one numpy index between uvicorn workers; readers poll for new generations this often
+    multi_worker: bool = False
+    index_reload_seconds: float = 1.0
+    hybrid_search: bool = True
+    hybrid_search_depth: int = 50
+    rrf_k: int = 60
+    query_filters: bool = True
+    # Explain every /chat result in one LLM call instead of one call per candidate
+    batch_explanations: bool = True
+    # First-turn /chat also searches with the raw query while the rewrite runs, keeping the better results
+    speculative_search: bool = True
+    embedding_concurrency: int = 4
+    embedding_batch_tokens: int = 16000
+    embedding_batch_max_items: int = 256
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "../embedding_cache/embeddings.sqlite3"
+    embedding_cache_max_entries: int = 100_000
+    # In-process cache of query vectors; persist also reads/writes the on-disk cache on a miss
+    query_cache_enabled: bool = True
+    query_cache_max_entries: int = 10_000
+    query_cache_ttl_seconds: float = 3600.0
+    query_cache_persist: bool = True
+    # Concurrent query embeddings are sent as one batch after this window or at this many texts
+    query_batching: bool = True
+    query_batch_window_ms: float = 5.0
+    query_batch_max_size: int = 32
+    # One keep-alive connection pool for every OpenRouter call, LLM and embeddings alike
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_seconds: float = 30.0
+    # Deadlines: each LLM / query embedding call, and everything one /chat or /research request does
+    llm_timeout_seconds: float = 20.0
+    llm_max_retries: int = 1
+    embedding_timeout_seconds: float = 10.0
+    request_budget_seconds: float = 60.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,320 @@
+"""
+Vector store backend interface.
+
+A backend stores candidate vectors in named collections. Versioning is
+shared by every backend: full rebuilds go into a new collection
+(candidates_v1, candidates_v2, ...) and a pointer file names the one
+search reads. Backends only implement the per-collection primitives.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from database.fileio import replace_durably
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "candidates"
+# Other processes can write the same collection (e.g. Chroma under several
+# uvicorn workers), and only this process's writes invalidate its cache
+COUNT_TTL_SECONDS = 5.0
+_VERSION_RE = re.compile(rf"^{COLLECTION_NAME}_v(\d+)$")
+
+
+def version_of(name: str) -> int:
+    match = _VERSION_RE.match(name)
+    return int(match.group(1)) if match else 0
+
+
+class VectorStore(ABC):
+    backend = ""
+    # True when upserts are held in memory until flush(); False when they are durable on return
+    buffers_writes = False
+
+    def __init__(self, root: str, keep_versions: int):
+        self.root = Path(root)
+        self.keep_versions = keep_versions
+        self._pointer_path = self.root / "active_collection.json"
+        self._swap_lock = threading.Lock()
+        # Cached (count, monotonic time) per collection, dropped whenever that collection is written
+        self._counts: dict[str, tuple[int, float]] = {}
+        self._counts_generation = 0
+        self._counts_lock = threading.Lock()
+        self._active = self._open(self._read_pointer())
+
+    # ---- Per-collection primitives -------------------------------------
+
+    @abstractmethod
+    def _open(self, name: str) -> Any:
+        """Return a handle to the named collection, creating it if missing."""
+
+    @abstractmethod
+    def _get(self, name: str) -> Any:
+        """Return a handle to an existing collection, raising if it is missing."""
+
+    @abstractmethod
+    def _names(self) -> list[str]:
+        """Names of every collection the backend holds."""
+
+    @abstractmethod
+    def _drop(self, name: str):
+        ...
+
+    @abstractmethod
+    def _count(self, handle) -> int:
+        ...
+
+    @abstractmethod
+    def _upsert(self, handle, ids: list[str], embeddings: list[list[float]],
+                metadatas: list[dict], documents: list[str]):
+        ...
+
+    @abstractmethod
+    def _delete(self, handle, ids: list[str]):
+        ...
+
+    @abstractmethod
+    def _vector_pages(self, handle, page_size: int) -> Iterator[tuple[list[str], Any]]:
+        """Yield (ids, vectors) for every record, a page at a time."""
+
+    @abstractmethod
+    def _metadata_pages(self, handle, page_size: int) -> Iterator[list[tuple[str, dict]]]:
+        """Yield (id, metadata) pairs for every record, a page at a time."""
+
+    @abstractmethod
+    def _query_batch(self, handle, query_vectors: list[list[float]], top_k: int,
+                     where: Optional[dict]) -> list[list[tuple[str, float, dict]]]:
+        """
+        For each query vector, return up to top_k (id, cosine distance, metadata)
+        triples, nearest first, in a single call to the index.
+        """
+
+    def _query(self, handle, query_vector: list[float], top_k: int, where: Optional[dict]):
+        return self._query_batch(handle, [query_vector], top_k, where)[0]
+
+    def _query_many(self, handle, query_vectors: list[list[float]], top_k: int,
+                    wheres: list[Optional[dict]], exclude: set[str]) -> list[list[tuple[str, float, dict]]]:
+        """
+        Per-query filters and a shared exclusion set. Queries that share a
+        filter go to the index together, over-fetching by the size of the
+        exclusion set so excluded ids can be dropped afterwards.
+        """
+        groups: dict[str, list[int]] = defaultdict(list)
+        for i, where in enumerate(wheres):
+            groups[json.dumps(where, sort_keys=True, default=str)].append(i)
+
+        depth = min(top_k + len(exclude), self._cached_count(handle))
+        results: list[list] = [[] for _ in query_vectors]
+        for positions in groups.values():
+            hits = self._query_batch(handle, [query_vectors[i] for i in positions], depth, wheres[positions[0]])
+            for i, found in zip(positions, hits):
+                results[i] = [h for h in found if h[0] not in exclude][:top_k]
+        return results
+
+    @abstractmethod
+    def _fetch(self, handle, ids: list[str], where: Optional[dict]) -> list[tuple[str, list[float], dict]]:
+        """Return (id, vector, metadata) for the given ids that exist and match `where`."""
+
+    @abstractmethod
+    def _sample(self, handle) -> tuple[str, list[float]]:
+        """Return any one stored (id, vector) pair, used for the self-query check."""
+
+    def flush(self, force: bool = False) -> bool:
+        """
+        Persist pending writes. Returns True once everything upserted so far
+        is durable; backends that write through always return True.
+        """
+        return True
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Pick up writes and collection swaps made by other processes. Returns
+        True when this process's view changed; backends that share no state
+        between processes never change and return False.
+        """
+        return False
+
+    # ---- Active collection ---------------------------------------------
+
+    def _handle(self, collection: str = None):
+        return self._get(collection) if collection else self._active
+
+    def count(self, collection: str = None) -> int:
+        return self._cached_count(self._handle(collection))
+
+    def _cached_count(self, handle) -> int:
+        now = time.monotonic()
+        with self._counts_lock:
+            cached = self._counts.get(handle.name)
+            generation = self._counts_generation
+        if cached is not None and now - cached[1] < COUNT_TTL_SECONDS:
+            return cached[0]
+        total = self._count(handle)
+        with self._counts_lock:
+            # Skip caching if a write landed while we were counting
+            if generation == self._counts_generation:
+                self._counts[handle.name] = (total, now)
+        return total
+
+    def _invalidate_count(self, name: str = None):
+        with self._counts_lock:
+            self._counts_generation += 1
+            if name is None:
+                self._counts.clear()
+            else:
+                self._counts.pop(name, None)
+
+    def upsert(self, ids, embeddings, metadatas, documents, collection: str = None):
+        handle = self._handle(collection)
+        try:
+            self._upsert(handle, ids, embeddings, metadatas, documents)
+        finally:
+            self._invalidate_count(handle.name)
+
+    def delete(self, ids: list[str]):
+        if ids:
+            handle = self._active
+            try:
+                self._delete(handle, ids)
+            finally:
+                self._invalidate_count(handle.name)
+
+    def metadata_pages(self, page_size: int = 5000) -> Iterator[list[tuple[str, dict]]]:
+        return self._metadata_pages(self._active, page_size)
+
+    def vector_pages(self, page_size: int = 5000) -> Iterator[tuple[list[str], Any]]:
+        return self._vector_pages(self._active, page_size)
+
+    def query(self, query_vector: list[float], top_k: int, where: dict = None) -> list[tuple[str, float, dict]]:
+        return self.query_many([query_vector], top_k, [where])[0]
+
+    def query_many(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int,
+        wheres: list[Optional[dict]] = None,
+        exclude: set[str] = None,
+    ) -> list[list[tuple[str, float, dict]]]:
+        """One result list per query vector; ids in `exclude` never come back."""
+        # Hold one reference so a concurrent swap can't split this query across versions
+        handle = self._active
+        total = self._cached_count(handle)
+        if total == 0 or not query_vectors:
+            return [[] for _ in query_vectors]
+        wheres = wheres or [None] * len(query_vectors)
+        return self._query_many(handle, query_vectors, min(top_k, total), wheres, exclude or set())
+
+    def index_stats(self, recall_samples: int = 0, top_k: int = 10) -> dict:
+        """
+        Size and layout of the active collection. Backends with an
+        approximate first stage also report `recall_at_k` against exact
+        search when `recall_samples` > 0.
+        """
+        return {
+            "backend": self.backend,
+            "collection": self._active.name,
+            "vectors": self._cached_count(self._active),
+        }
+
+    def fetch(self, ids: list[str], where: dict = None) -> list[tuple[str, list[float], dict]]:
+        if not ids:
+            return []
+        return self._fetch(self._active, ids, where)
+
+    def wipe(self):
+        with self._swap_lock:
+            name = self._active.name
+            self._drop(name)
+            # Recreate so the app can keep using the active handle
+            self._active = self._open(name)
+            self._invalidate_count()
+
+    # ---- Versions --------------------------------------------------------
+
+    def active_collection(self) -> str:
+        return self._active.name
+
+    def list_versions(self) -> list[str]:
+        """All candidate collections, oldest first."""
+        names = [n for n in self._names() if n == COLLECTION_NAME or _VERSION_RE.match(n)]
+        return sorted(names, key=version_of)
+
+    def begin_rebuild(self) -> str:
+        """Create an empty shadow collection for a full rebuild and return its name."""
+        with self._swap_lock:
+            next_version = max((version_of(n) for n in self.list_versions()), default=0) + 1
+            name = f"{COLLECTION_NAME}_v{next_version}"
+            self._open(name)
+        logger.info("Created shadow collection %s", name)
+        return name
+
+    def activate(self, collection: str, expected_count: int = None):
+        """
+        Validate a finished shadow collection and make it the one search reads.
+        Raises ValueError and leaves the active collection untouched if the
+        shadow looks incomplete.
+        """
+        self.flush(force=True)
+        shadow = self._get(collection)
+        self._validate(shadow, expected_count)
+
+        with self._swap_lock:
+            previous = self._active.name
+            self._write_pointer(collection)
+            self._active = shadow
+        logger.info("Activated collection %s (previous: %s)", collection, previous)
+        self._prune_versions()
+
+    def rollback(self) -> str:
+        """Re-activate the newest version older than the active one."""
+        current = version_of(self._active.name)
+        older = [n for n in self.list_versions() if version_of(n) < current]
+        if not older:
+            raise ValueError("No previous index version to roll back to")
+        self.activate(older[-1])
+        return older[-1]
+
+    def drop_collection(self, collection: str):
+        if collection == self._active.name:
+            raise ValueError(f"Refusing to drop the active collection {collection}")
+        self._drop(collection)
+        self._invalidate_count(collection)
+        logger.info("Dropped collection %s", collection)
+
+    def _validate(self, shadow, expected_count: int = None):
+        total = self._count(shadow)
+        if total == 0:
+            raise ValueError(f"Collection {shadow.name} is empty")
+        if expected_count is not None and total != expected_count:
+            raise ValueError(f"Collection {shadow.name} holds {total} vectors, expected {expected_count}")
+
+        # The index must answer a query: a stored vector should find itself
+        sample_id, vector = self._sample(shadow)
+        hits = self._query(shadow, vector, 1, None)
+        if not hits or hits[0][0] != sample_id:
+            raise ValueError(f"Collection {shadow.name} failed the self-query check")
+
+    def _prune_versions(self):
+        active_version = version_of(self._active.name)
+        older = [n for n in self.list_versions() if version_of(n) < active_version]
+        for name in older[: max(len(older) - self.keep_versions, 0)]:
+            self.drop_collection(name)
+
+    def _read_pointer(self) -> str:
+        try:
+            return json.loads(self._pointer_path.read_text())["collection"]
+        except FileNotFoundError:
+            # Indexes built before versioning live in the plain collection
+            return COLLECTION_NAME
+
+    def _write_pointer(self, name: str):
+        self._pointer_path.parent.mkdir(parents=True, exist_ok=True)
+        # Durable before activate() returns, so a swap or rollback survives a power cut
+        replace_durably(self._pointer_path, json.dumps({"collection": name, "activated_at": time.time()}))
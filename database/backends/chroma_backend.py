@@ -0,0 +1,106 @@
+"""
+ChromaDB backend: one persistent client, HNSW collections with cosine space.
+
+M and ef_construction are fixed when a collection is created, so new
+values apply from the next full rebuild; ef_search is also updated on
+collections that already exist.
+"""
+
+import logging
+from typing import Iterator, Optional
+
+import chromadb
+
+from database.backends.base import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaStore(VectorStore):
+    backend = "chroma"
+
+    def __init__(self, path: str, keep_versions: int, m: int = 16, ef_construction: int = 100, ef_search: int = 100):
+        self._client = chromadb.PersistentClient(path=path)
+        self._hnsw = {
+            "hnsw:space": "cosine",
+            "hnsw:M": m,
+            "hnsw:construction_ef": ef_construction,
+            "hnsw:search_ef": ef_search,
+        }
+        super().__init__(path, keep_versions)
+
+    def _open(self, name: str):
+        collection = self._client.get_or_create_collection(name=name, metadata=self._hnsw)
+        self._apply_ef_search(collection)
+        return collection
+
+    def _apply_ef_search(self, collection):
+        ef_search = self._hnsw["hnsw:search_ef"]
+        try:
+            if collection.configuration["hnsw"]["ef_search"] != ef_search:
+                collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+                logger.info("Set ef_search=%d on collection %s", ef_search, collection.name)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            # Older Chroma releases can't change search parameters after creation
+            logger.warning("Could not update ef_search on %s: %s", collection.name, e)
+
+    def _get(self, name: str):
+        return self._client.get_collection(name)
+
+    def _names(self) -> list[str]:
+        return [c if isinstance(c, str) else c.name for c in self._client.list_collections()]
+
+    def _drop(self, name: str):
+        self._client.delete_collection(name)
+
+    def _count(self, handle) -> int:
+        return handle.count()
+
+    def _upsert(self, handle, ids, embeddings, metadatas, documents):
+        handle.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def _delete(self, handle, ids):
+        handle.delete(ids=ids)
+
+    def _vector_pages(self, handle, page_size: int) -> Iterator[tuple[list[str], list[list[float]]]]:
+        offset = 0
+        while True:
+            page = handle.get(include=["embeddings"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["embeddings"]
+            offset += len(page["ids"])
+
+    def _metadata_pages(self, handle, page_size: int) -> Iterator[list[tuple[str, dict]]]:
+        offset = 0
+        while True:
+            page = handle.get(include=["metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield list(zip(page["ids"], page["metadatas"]))
+            offset += len(page["ids"])
+
+    def _query_batch(self, handle, query_vectors, top_k: int, where: Optional[dict]):
+        kwargs = {
+            "query_embeddings": query_vectors,
+            "n_results": top_k,
+            "include": ["metadatas", "distances"],
+        }
+        if where:
+            kwargs["where"] = where
+        results = handle.query(**kwargs)
+        return [
+            list(zip(ids, distances, metadatas))
+            for ids, distances, metadatas in zip(results["ids"], results["distances"], results["metadatas"])
+        ]
+
+    def _fetch(self, handle, ids, where: Optional[dict]):
+        kwargs = {"ids": ids, "include": ["embeddings", "metadatas"]}
+        if where:
+            kwargs["where"] = where
+        page = handle.get(**kwargs)
+        return list(zip(page["ids"], page["embeddings"], page["metadatas"]))
+
+    def _sample(self, handle):
+        sample = handle.get(limit=1, include=["embeddings"])
+        return sample["ids"][0], list(sample["embeddings"][0])
@@ -0,0 +1,588 @@
+"""
+Exact in-process vector search over a NumPy matrix.
+
+Each collection is a directory of generations:
+
+    <root>/<collection>/CURRENT              live generation and its row count
+    <root>/<collection>/g<k>/vectors.f32     L2-normalized float32 rows
+    <root>/<collection>/g<k>/records.jsonl   one [id, metadata] line per row
+
+The live generation is memory-mapped read-only, so a freshly started
+worker serves queries straight from the page cache. The first write
+copies the matrix into memory. flush() appends rows added since the last
+flush to the live generation, or writes a new generation when flushed
+rows were changed or deleted; the files are fsynced before CURRENT is
+replaced, so a crash leaves the previous state intact, and readers only
+look at the rows CURRENT counts.
+
+Search is a single matrix-vector product followed by argpartition, which
+gives exact cosine top-k. With int8 quantization on, the first-stage scan
+runs over a per-dimension scaled int8 copy of the matrix (a quarter of
+the memory) and only the best `rescore_depth` rows are re-scored against
+the memory-mapped float vectors. Metadata filters use Chroma's `where` syntax
+and are evaluated as boolean masks over lazily built metadata columns;
+masks are cached until the next write.
+
+Several processes (uvicorn workers) can share one root: the mappings are
+read-only, so the page cache holds a single copy of the vectors and int8
+codes however many workers map them. With `reload_seconds` set, readers
+poll the pointer file and CURRENT and remap when another process flushes
+or swaps collections; only one process should write at a time.
+"""
+
+import json
+import logging
+import shutil
+import threading
+import time
+from functools import reduce
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from database.backends.base import VectorStore
+from database.fileio import append_durably, fsync_dir, replace_durably, stamp, write_durably
+
+logger = logging.getLogger(__name__)
+
+_MAX_CACHED_MASKS = 256
+QUANTIZATION_MODES = ("none", "int8")
+# Rows converted to float at a time during the int8 scan, bounding scratch memory
+_SCAN_CHUNK = 16384
+
+
+class _Collection:
+    """One named collection: the vector matrix plus row-aligned ids and metadata."""
+
+    def __init__(self, name: str, path: Path, quantize: bool = False):
+        self.name = name
+        self.path = path
+        self.quantize = quantize
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.dim = 0
+        self.ids: list[str] = []
+        self.metadatas: list[dict] = []
+        self.rows: dict[str, int] = {}
+        # `_buf` may hold spare capacity; only the first `size` rows are live
+        self._buf = np.empty((0, 0), dtype=np.float32)
+        self.size = 0
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        # Bumped on every write so stale columns and masks are never reused
+        self.version = 0
+        self._columns: dict[str, np.ndarray] = {}
+        self._masks: dict[str, np.ndarray] = {}
+        # (codes, scale, version) of the int8 copy, when quantization is on
+        self._quantized: Optional[tuple[np.ndarray, np.ndarray, int]] = None
+        # Stamp of the CURRENT file this view was loaded from, to notice other writers
+        self._current: Optional[tuple[int, int]] = None
+        # Rows (and bytes of records.jsonl) already durable in the live generation
+        self.flushed = 0
+        self._records_bytes = 0
+        # Set once a write touches a flushed row, so the next flush cannot just append
+        self._rewrite = False
+        self._load()
+
+    # ---- Persistence -----------------------------------------------------
+
+    def _load(self):
+        self.generation, self.dim, self.size = 0, 0, 0
+        self.ids, self.metadatas, self.rows = [], [], {}
+        self._buf = np.empty((0, 0), dtype=np.float32)
+        self._quantized = None
+        self.flushed, self._records_bytes, self._rewrite = 0, 0, False
+        self._current = stamp(self.path / "CURRENT")
+        if self._current is None:
+            return
+        current = (self.path / "CURRENT").read_text().strip()
+        if current.startswith("{"):
+            pointer = json.loads(current)
+            gen_dir = self.path / pointer["generation"]
+            self.dim = pointer["dim"]
+            self._records_bytes = pointer["records_bytes"]
+            with open(gen_dir / "records.jsonl", "rb") as f:
+                # Bytes past the pointer belong to an append that has not been committed yet
+                lines = f.read(self._records_bytes).splitlines()
+            records = [json.loads(line) for line in lines[: pointer["rows"]]]
+            self.ids = [cid for cid, _ in records]
+            self.metadatas = [metadata for _, metadata in records]
+        else:
+            # Written before appends: one records.json per generation, replaced by the next flush
+            gen_dir = self.path / current
+            records = json.loads((gen_dir / "records.json").read_text())
+            self.dim = records["dim"]
+            self.ids = records["ids"]
+            self.metadatas = records["metadatas"]
+            self._rewrite = True
+        self.generation = int(gen_dir.name[1:])
+        self.rows = {cid: i for i, cid in enumerate(self.ids)}
+        self.size = self.flushed = len(self.ids)
+        self._map(gen_dir)
+
+    def _map(self, gen_dir: Path):
+        if not self.size:
+            return
+        self._buf = np.memmap(gen_dir / "vectors.f32", dtype=np.float32, mode="r", shape=(self.size, self.dim))
+        if self.quantize and (gen_dir / "codes.i8").exists():
+            # Mapped rather than read so every process serving this generation shares the pages
+            codes = np.memmap(gen_dir / "codes.i8", dtype=np.int8, mode="r", shape=(self.size, self.dim))
+            self._quantized = (codes, np.fromfile(gen_dir / "scale.f32", dtype=np.float32), self.version)
+
+    def reload(self) -> bool:
+        """Map the newest generation if another process flushed one; False when already current."""
+        with self.lock:
+            if self.dirty or stamp(self.path / "CURRENT") == self._current:
+                # Never drop this process's own unflushed writes
+                return False
+            self.version += 1
+            for attempt in range(3):
+                try:
+                    self._load()
+                    break
+                except FileNotFoundError:
+                    # The writer replaced that generation while we read it; follow CURRENT again
+                    if attempt == 2:
+                        raise
+            self._columns = {}
+            self._masks = {}
+        logger.info("Reloaded %s generation %d | vectors=%d", self.name, self.generation, self.size)
+        return True
+
+    def flush(self):
+        """
+        Make every write durable and map the collection back read-only.
+        Rows added since the last flush are appended to the live generation;
+        a write that changed or removed flushed rows rewrites the collection
+        as a new generation. Either way the data is fsynced before CURRENT
+        is replaced to point at it, so a crash leaves the previous state.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            old = None
+            gen_dir = self.path / f"g{self.generation}"
+            scale = gen_dir / "scale.f32"
+            if self._rewrite or not self.flushed or (self.quantize and not scale.exists()):
+                old, gen_dir = gen_dir, self.path / f"g{self.generation + 1}"
+                records_bytes = self._write_generation(gen_dir)
+            else:
+                records_bytes = self._append(gen_dir, np.fromfile(scale, dtype=np.float32) if self.quantize else None)
+            pointer = {"generation": gen_dir.name, "rows": self.size, "dim": self.dim, "records_bytes": records_bytes}
+            replace_durably(self.path / "CURRENT", json.dumps(pointer))
+            self._current = stamp(self.path / "CURRENT")
+
+            appended = self.size - self.flushed
+            self.generation = int(gen_dir.name[1:])
+            self.flushed, self._records_bytes, self._rewrite = self.size, records_bytes, False
+            self.dirty = False
+            self.last_flush = time.monotonic()
+            self._map(gen_dir)
+        if old is None:
+            logger.info("Flushed %s generation %d | appended=%d vectors=%d", self.name, self.generation, appended, self.size)
+            return
+        # Queries holding the old mapping keep their pages until they finish
+        shutil.rmtree(old, ignore_errors=True)
+        logger.info("Flushed %s generation %d | rewritten vectors=%d", self.name, self.generation, self.size)
+
+    def _write_generation(self, gen_dir: Path) -> int:
+        """Write every row into a fresh generation directory; returns the size of its records file."""
+        gen_dir.mkdir(parents=True, exist_ok=True)
+        write_durably(gen_dir / "vectors.f32", self.matrix)
+        if self.quantize and self.size:
+            codes, scale = _quantize(self.matrix)
+            write_durably(gen_dir / "codes.i8", codes)
+            write_durably(gen_dir / "scale.f32", scale)
+        records = _records(self.ids, self.metadatas)
+        write_durably(gen_dir / "records.jsonl", records)
+        fsync_dir(gen_dir)
+        return len(records)
+
+    def _append(self, gen_dir: Path, scale: Optional[np.ndarray]) -> int:
+        """Append the rows added since the last flush to the live generation; returns the new records size."""
+        new = self.matrix[self.flushed :]
+        append_durably(gen_dir / "vectors.f32", self.flushed * self.dim * 4, new)
+        if scale is not None:
+            # The generation's scale is kept, so outliers clip until the next rewrite rescales
+            codes = np.clip(np.rint(new / scale), -127, 127).astype(np.int8)
+            append_durably(gen_dir / "codes.i8", self.flushed * self.dim, codes)
+        records = _records(self.ids[self.flushed :], self.metadatas[self.flushed :])
+        append_durably(gen_dir / "records.jsonl", self._records_bytes, records)
+        return self._records_bytes + len(records)
+
+    # ---- Writes ----------------------------------------------------------
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._buf[: self.size]
+
+    def upsert(self, ids: list[str], embeddings: list[list[float]], metadatas: list[dict]):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self.lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Collection {self.name} holds {self.dim}-dim vectors, got {vectors.shape[1]}")
+
+            new = [cid for cid in dict.fromkeys(ids) if cid not in self.rows]
+            self._reserve(self.size + len(new))
+            for cid in new:
+                self.rows[cid] = self.size
+                self.ids.append(cid)
+                self.metadatas.append({})
+                self.size += 1
+            for cid, vector, metadata in zip(ids, vectors, metadatas):
+                row = self.rows[cid]
+                # Flushed rows are only ever appended to, so changing one needs a rewrite
+                self._rewrite = self._rewrite or row < self.flushed
+                self._buf[row] = vector
+                self.metadatas[row] = metadata
+            self._touch()
+
+    def delete(self, ids: list[str]):
+        with self.lock:
+            drop = [self.rows[cid] for cid in ids if cid in self.rows]
+            if not drop:
+                return
+            keep = np.ones(self.size, dtype=bool)
+            keep[drop] = False
+            self._rewrite = self._rewrite or min(drop) < self.flushed
+            # Build fresh arrays so queries running on the old ones are unaffected
+            self._buf = self.matrix[keep]
+            self.ids = [cid for cid, k in zip(self.ids, keep) if k]
+            self.metadatas = [m for m, k in zip(self.metadatas, keep) if k]
+            self.rows = {cid: i for i, cid in enumerate(self.ids)}
+            self.size = len(self.ids)
+            self._touch()
+
+    def _reserve(self, rows: int):
+        """Make the buffer writable with room for `rows` rows, growing geometrically."""
+        if isinstance(self._buf, np.memmap) or rows > self._buf.shape[0]:
+            capacity = max(rows, int(self._buf.shape[0] * 1.5), 1024)
+            buf = np.empty((capacity, self.dim), dtype=np.float32)
+            if self.size:
+                buf[: self.size] = self.matrix
+            self._buf = buf
+
+    def _touch(self):
+        self.dirty = True
+        self.version += 1
+        self._columns = {}
+        self._masks = {}
+
+    # ---- Reads -----------------------------------------------------------
+
+    def quantized(self, version: int) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """
+        The int8 codes and per-dimension scale for `version`, or None when
+        quantization is off or the collection has unflushed writes (the
+        codes are rebuilt at the next flush; until then search is exact).
+        """
+        if not self.quantize:
+            return None
+        with self.lock:
+            if self._quantized is None or self._quantized[2] != self.version:
+                if self.dirty or not self.size:
+                    return None
+                # Quantization was switched on for an index built without it
+                codes, scale = _quantize(self.matrix)
+                self._quantized = (codes, scale, self.version)
+            codes, scale, quantized_version = self._quantized
+        return (codes, scale) if quantized_version == version else None
+
+    def snapshot(self):
+        """Consistent (matrix, ids, metadatas, version) for one query."""
+        with self.lock:
+            return self.matrix, self.ids, self.metadatas, self.version
+
+    def mask(self, where: dict, metadatas: list[dict], size: int, version: int) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self.lock:
+            cached = self._masks.get(key) if version == self.version else None
+        if cached is not None:
+            return cached
+        mask = _evaluate(where, lambda name: self._column(name, metadatas, size, version))
+        with self.lock:
+            if version == self.version and len(self._masks) < _MAX_CACHED_MASKS:
+                self._masks[key] = mask
+        return mask
+
+    def _column(self, name: str, metadatas: list[dict], size: int, version: int) -> np.ndarray:
+        with self.lock:
+            column = self._columns.get(name) if version == self.version else None
+        if column is None:
+            # Appends after the snapshot grow the list in place; only its first `size` rows apply
+            column = np.empty(size, dtype=object)
+            column[:] = [metadatas[i].get(name) for i in range(size)]
+            with self.lock:
+                if version == self.version:
+                    self._columns[name] = column
+        return column
+
+
+class NumpyStore(VectorStore):
+    backend = "numpy"
+    buffers_writes = True
+
+    def __init__(
+        self,
+        path: str,
+        keep_versions: int,
+        flush_seconds: float,
+        quantization: str = "none",
+        rescore_depth: int = 200,
+        reload_seconds: Optional[float] = None,
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization {quantization!r} (expected one of {QUANTIZATION_MODES})")
+        self.flush_seconds = flush_seconds
+        self.quantization = quantization
+        self.rescore_depth = rescore_depth
+        # Set when several processes share the directory: how often to look for their writes
+        self.reload_seconds = reload_seconds
+        self._last_refresh = time.monotonic()
+        self._collections: dict[str, _Collection] = {}
+        self._collections_lock = threading.Lock()
+        Path(path).mkdir(parents=True, exist_ok=True)
+        super().__init__(path, keep_versions)
+
+    def _open(self, name: str) -> _Collection:
+        with self._collections_lock:
+            if name not in self._collections:
+                path = self.root / name
+                path.mkdir(parents=True, exist_ok=True)
+                self._collections[name] = _Collection(name, path, quantize=self.quantization == "int8")
+            return self._collections[name]
+
+    def _get(self, name: str) -> _Collection:
+        if name not in self._collections and not (self.root / name).is_dir():
+            raise ValueError(f"Collection {name} does not exist")
+        return self._open(name)
+
+    def _names(self) -> list[str]:
+        return [p.name for p in self.root.iterdir() if p.is_dir()]
+
+    def _drop(self, name: str):
+        with self._collections_lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    def _count(self, handle: _Collection) -> int:
+        return handle.size
+
+    def _upsert(self, handle: _Collection, ids, embeddings, metadatas, documents):
+        handle.upsert(ids, embeddings, metadatas)
+
+    def _delete(self, handle: _Collection, ids):
+        handle.delete(ids)
+
+    def _vector_pages(self, handle: _Collection, page_size: int):
+        matrix, ids, _, _ = handle.snapshot()
+        for start in range(0, len(matrix), page_size):
+            yield ids[start : start + page_size], matrix[start : start + page_size]
+
+    def _metadata_pages(self, handle: _Collection, page_size: int) -> Iterator[list[tuple[str, dict]]]:
+        _, ids, metadatas, _ = handle.snapshot()
+        for start in range(0, len(ids), page_size):
+            yield list(zip(ids[start : start + page_size], metadatas[start : start + page_size]))
+
+    def _query_batch(self, handle: _Collection, query_vectors, top_k: int, where: Optional[dict]):
+        return self._query_many(handle, query_vectors, top_k, [where] * len(query_vectors), set())
+
+    def _query_many(self, handle: _Collection, query_vectors, top_k: int, wheres, exclude):
+        matrix, ids, metadatas, version = handle.snapshot()
+        queries = _normalize(np.asarray(query_vectors, dtype=np.float32))
+        with handle.lock:
+            excluded = [handle.rows[cid] for cid in exclude if cid in handle.rows]
+        excluded = [r for r in excluded if r < len(matrix)]
+
+        results = []
+        for rows, scores in self._rank(handle, matrix, metadatas, version, queries, top_k, wheres, excluded):
+            # Same convention as Chroma's cosine space: distance = 1 - cosine similarity
+            results.append([(ids[r], float(1 - s), metadatas[r]) for r, s in zip(rows, scores)])
+        return results
+
+    def _rank(self, handle: _Collection, matrix, metadatas, version, queries, top_k, wheres, excluded,
+              exact: bool = False) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Yield (rows, cosine similarities) of the top_k rows for each query, best first."""
+        quantized = None if exact else handle.quantized(version)
+        if quantized is not None:
+            scores = _approximate_scores(*quantized, queries)
+        else:
+            # One (queries x rows) product for the whole batch
+            scores = queries @ matrix.T
+
+        for query, row_scores, where in zip(queries, scores, wheres):
+            if where:
+                row_scores[~handle.mask(where, metadatas, len(matrix), version)] = -np.inf
+            if excluded:
+                row_scores[excluded] = -np.inf
+            if quantized is not None:
+                candidates = _top(row_scores, max(self.rescore_depth, top_k))
+                # Sorted so re-scoring reads the mapped float matrix front to back
+                candidates = np.sort(candidates[row_scores[candidates] != -np.inf])
+                row_scores = matrix[candidates] @ query
+                order = _top(row_scores, top_k)
+                yield candidates[order], row_scores[order]
+            else:
+                rows = _top(row_scores, top_k)
+                rows = rows[row_scores[rows] != -np.inf]
+                yield rows, row_scores[rows]
+
+    def index_stats(self, recall_samples: int = 0, top_k: int = 10) -> dict:
+        handle = self._active
+        matrix, _, metadatas, version = handle.snapshot()
+        quantized = handle.quantized(version)
+        stats = {
+            **super().index_stats(),
+            "dimension": handle.dim,
+            "quantization": "int8" if quantized is not None else "none",
+            "full_precision_bytes": int(matrix.nbytes),
+            "full_precision_mapped": isinstance(handle._buf, np.memmap),
+            # What the first-stage scan keeps resident and reads per query
+            "scan_bytes": int(sum(a.nbytes for a in quantized)) if quantized is not None else int(matrix.nbytes),
+        }
+        if quantized is not None and recall_samples and len(matrix):
+            stats["recall_at_k"] = self._estimate_recall(handle, matrix, metadatas, version, recall_samples, top_k)
+            stats["recall_k"] = top_k
+        return stats
+
+    def _estimate_recall(self, handle: _Collection, matrix, metadatas, version, samples: int, top_k: int) -> float:
+        """Fraction of the exact top_k that the quantized path also returns, over synthetic queries."""
+        rng = np.random.default_rng(0)
+        # Blend two stored vectors per query so no query sits exactly on a row
+        pairs = rng.integers(0, len(matrix), size=(samples, 2))
+        queries = _normalize(matrix[pairs[:, 0]] + matrix[pairs[:, 1]])
+        wheres = [None] * samples
+        k = min(top_k, len(matrix))
+        exact = self._rank(handle, matrix, metadatas, version, queries, k, wheres, [], exact=True)
+        approx = self._rank(handle, matrix, metadatas, version, queries, k, wheres, [])
+        hits = sum(len(set(e.tolist()) & set(a.tolist())) for (e, _), (a, _) in zip(exact, approx))
+        return round(hits / (samples * k), 4)
+
+    def _fetch(self, handle: _Collection, ids, where: Optional[dict]):
+        matrix, all_ids, metadatas, version = handle.snapshot()
+        with handle.lock:
+            rows = [handle.rows[cid] for cid in ids if cid in handle.rows]
+        rows = [r for r in rows if r < len(matrix)]
+        if where:
+            mask = handle.mask(where, metadatas, len(matrix), version)
+            rows = [r for r in rows if mask[r]]
+        return [(all_ids[r], matrix[r], metadatas[r]) for r in rows]
+
+    def _sample(self, handle: _Collection):
+        matrix, ids, _, _ = handle.snapshot()
+        return ids[0], matrix[0].tolist()
+
+    def flush(self, force: bool = False) -> bool:
+        durable = True
+        for handle in list(self._collections.values()):
+            if handle.dirty and (force or time.monotonic() - handle.last_flush >= self.flush_seconds):
+                handle.flush()
+            durable = durable and not handle.dirty
+        return durable
+
+    def refresh(self, force: bool = False) -> bool:
+        if self.reload_seconds is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.reload_seconds:
+            return False
+        self._last_refresh = now
+
+        changed = False
+        with self._swap_lock:
+            name = self._read_pointer()
+            if name != self._active.name:
+                # Another process activated a rebuild or rolled back
+                self._active = self._open(name)
+                changed = True
+            handle = self._active
+        if handle.reload() or changed:
+            self._invalidate_count()
+            return True
+        return False
+
+
+
+def _records(ids: list[str], metadatas: list[dict]) -> bytes:
+    """One `[id, metadata]` JSON line per row; json.dumps escapes newlines inside values."""
+    return "".join(json.dumps([cid, metadata]) + "\n" for cid, metadata in zip(ids, metadatas)).encode("utf-8")
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, largest first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _quantize(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension int8 quantization: matrix ≈ codes * scale."""
+    peak = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, len(matrix), _SCAN_CHUNK):
+        np.maximum(peak, np.abs(matrix[start : start + _SCAN_CHUNK]).max(axis=0), out=peak)
+    scale = np.where(peak == 0, 1, peak / 127).astype(np.float32)
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, len(matrix), _SCAN_CHUNK):
+        codes[start : start + _SCAN_CHUNK] = np.rint(matrix[start : start + _SCAN_CHUNK] / scale)
+    return codes, scale
+
+
+def _approximate_scores(codes: np.ndarray, scale: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Approximate cosine scores of every row for each query, from the int8 codes."""
+    scaled = queries * scale
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), _SCAN_CHUNK):
+        chunk = codes[start : start + _SCAN_CHUNK].astype(np.float32)
+        scores[:, start : start + len(chunk)] = scaled @ chunk.T
+    return scores
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _evaluate(where: dict, column) -> np.ndarray:
+    """Turn a Chroma-style `where` filter into a boolean row mask."""
+    masks = []
+    for key, value in where.items():
+        if key == "$and":
+            masks.append(reduce(np.logical_and, (_evaluate(w, column) for w in value)))
+        elif key == "$or":
+            masks.append(reduce(np.logical_or, (_evaluate(w, column) for w in value)))
+        elif isinstance(value, dict):
+            masks.extend(_compare(column(key), op, operand) for op, operand in value.items())
+        else:
+            masks.append(_compare(column(key), "$eq", value))
+    return reduce(np.logical_and, masks)
+
+
+def _compare(values: np.ndarray, op: str, operand) -> np.ndarray:
+    if op == "$eq":
+        return values == operand
+    if op == "$ne":
+        return values != operand
+    if op in ("$in", "$nin"):
+        members = set(operand)
+        hit = np.fromiter((v in members for v in values), dtype=bool, count=len(values))
+        return hit if op == "$in" else ~hit
+    if op in ("$contains", "$not_contains"):
+        # List-valued metadata, e.g. the language set
+        hit = np.fromiter((isinstance(v, list) and operand in v for v in values), dtype=bool, count=len(values))
+        return hit if op == "$contains" else ~hit
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        numbers = np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            if op == "$gt":
+                return numbers > operand
+            if op == "$gte":
+                return numbers >= operand
+            if op == "$lt":
+                return numbers < operand
+            return numbers <= operand
+    raise ValueError(f"Unsupported filter operator {op}")
@@ -0,0 +1,70 @@
+"""
+Durable file writes and pointer files for the on-disk stores.
+
+A store only counts data as flushed once it survives a power cut, so every
+data file is fsynced before the pointer file that references it is
+replaced, and the directory is fsynced after the replace so the rename
+itself is on disk. Readers in other processes notice the replace through
+`stamp()`.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+Data = Union[bytes, np.ndarray]
+
+
+def write_durably(path: Path, data: Data):
+    """Write `data` as the whole of `path` and fsync it."""
+    with open(path, "wb") as f:
+        _write(f, data)
+
+
+def append_durably(path: Path, committed: int, data: Data):
+    """
+    Append `data` after the first `committed` bytes of `path` and fsync it.
+    Anything past `committed` is left over from an append that crashed
+    before its pointer was swapped, and is overwritten.
+    """
+    with open(path, "r+b" if path.exists() else "w+b") as f:
+        f.truncate(committed)
+        f.seek(committed)
+        _write(f, data)
+
+
+def replace_durably(path: Path, text: str):
+    """Atomically replace the pointer file `path` with `text`, then fsync its directory."""
+    tmp = path.with_name(path.name + ".tmp")
+    write_durably(tmp, text.encode("utf-8"))
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def stamp(path: Path) -> Optional[tuple[int, int]]:
+    """Identity of a pointer file; it is replaced, never rewritten, so this changes on every flush."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def fsync_dir(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write(f, data: Data):
+    if isinstance(data, np.ndarray):
+        # Streams the array instead of copying it into one bytes object first
+        data.tofile(f)
+    else:
+        f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
@@ -0,0 +1,95 @@
+"""
+In-memory BM25 inverted index over candidate metadata.
+
+Embedding search is weak on exact tokens ("Kubernetes", "Arabic",
+"Dubai"), so vectorstore.search fuses these lexical hits with the vector
+hits. Only short, token-heavy fields are indexed; free-text fields like
+the job description stay with the embedding.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+INDEXED_FIELDS = ("skills", "top_skills", "current_title", "languages", "city", "country")
+
+# Keeps tokens like "c++", "c#" and "node.js" whole
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    return [t.rstrip(".") for t in _TOKEN_RE.findall(text.lower())]
+
+
+def document_tokens(metadata: dict) -> Counter:
+    return Counter(t for name in INDEXED_FIELDS for t in tokenize(str(metadata.get(name) or "")))
+
+
+class LexicalIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: dict[str, dict[str, int]] = {}
+        self._docs: dict[str, Counter] = {}
+        self._lengths: dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, ids: list[str], metadatas: list[dict]):
+        with self._lock:
+            for cid, metadata in zip(ids, metadatas):
+                self._remove(cid)
+                terms = document_tokens(metadata)
+                self._docs[cid] = terms
+                self._lengths[cid] = sum(terms.values())
+                self._total_length += self._lengths[cid]
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[cid] = tf
+
+    def remove(self, ids: list[str]):
+        with self._lock:
+            for cid in ids:
+                self._remove(cid)
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            self._lengths = {}
+            self._total_length = 0
+
+    def _remove(self, cid: str):
+        terms = self._docs.pop(cid, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(cid)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[cid]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, text: str, top_k: int) -> list[tuple[str, float]]:
+        """Return up to top_k (id, BM25 score) pairs, best first."""
+        terms = set(tokenize(text))
+        scores: dict[str, float] = {}
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for cid, tf in postings.items():
+                    norm = tf + K1 * (1 - B + B * self._lengths[cid] / avg_length)
+                    scores[cid] = scores.get(cid, 0.0) + idf * tf * (K1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
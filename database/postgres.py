@@ -1,39 +1,127 @@
 
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from config import settings
-from models.candidate import CandidateProfile
+from models.candidate import CandidateProfile, CandidateRecord
 
 logger = logging.getLogger(__name__)
 
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of waiting when it is exhausted,
+# so borrowers queue on this semaphore first
+_slots: Optional[threading.BoundedSemaphore] = None
+# When each pooled connection was last handed back, keyed by id(conn)
+_last_used: dict[int, float] = {}
+
+
+def open_pool():
+    """Open the shared connection pool. Called once at app startup."""
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            return
+        try:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                settings.pg_pool_min,
+                settings.pg_pool_max,
+                settings.postgres_url,
+                keepalives=1,
+                keepalives_idle=30,
+            )
+        except Exception as e:
+            logger.error("Failed to connect to PostgreSQL: %s", e)
+            raise
+        _slots = threading.BoundedSemaphore(settings.pg_pool_max)
+    logger.info("PostgreSQL pool opened | min=%d max=%d", settings.pg_pool_min, settings.pg_pool_max)
 
-def get_connection():
-    try:
-        conn = psycopg2.connect(settings.postgres_url)
-        return conn
-    except Exception as e:
-        logger.error("Failed to connect to PostgreSQL: %s", e)
-        raise
 
+def close_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            return
+        _pool.closeall()
+        _pool = None
+        _slots = None
+        _last_used.clear()
+    logger.info("PostgreSQL pool closed")
 
-def fetch_all_candidates() -> list[CandidateProfile]:
+
+@contextmanager
+def get_connection():
     """
-    Pull every candidate with their skills, education, languages,
-    and work history all joined together.
+    Borrow a pooled connection for the duration of the block.
+    Connections that sat idle longer than pg_pool_idle_check_seconds are
+    pinged first and replaced if the server dropped them.
     """
-    logger.info("Fetching all candidates from PostgreSQL")
+    if _pool is None:
+        open_pool()
+    pool, slots = _pool, _slots
 
+    if not slots.acquire(timeout=settings.pg_pool_timeout):
+        raise psycopg2.pool.PoolError(
+            f"No PostgreSQL connection available after {settings.pg_pool_timeout}s"
+        )
+    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    except Exception as e:
-        logger.error("Could not open DB cursor: %s", e)
-        raise
+        conn = _checkout(pool)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken or bool(conn.closed))
+            if broken:
+                _last_used.pop(id(conn), None)
+    finally:
+        slots.release()
 
-    try:
-        #I used a JOIN query to pull everything needed into one flat row per candidate. since the DB is fully normalized
-        cur.execute("""
+
+def _checkout(pool: psycopg2.pool.ThreadedConnectionPool):
+    """Take a connection from the pool, discarding any that fail a health check."""
+    for _ in range(settings.pg_pool_max + 1):
+        conn = pool.getconn()
+        idle = time.monotonic() - _last_used.get(id(conn), time.monotonic())
+        if not conn.closed and idle < settings.pg_pool_idle_check_seconds:
+            return conn
+        try:
+            if conn.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except Exception as e:
+            logger.warning("Discarding stale PostgreSQL connection: %s", e)
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+    raise psycopg2.pool.PoolError("Could not obtain a healthy PostgreSQL connection")
+
+
+PROFILE_TABLE = "candidate_profiles"
+PROFILE_COLUMNS = CandidateRecord._fields
+_ID = PROFILE_COLUMNS.index("id")
+_NAME = PROFILE_COLUMNS.index("name")
+_YEARS = PROFILE_COLUMNS.index("years_of_experience")
+
+#I used a JOIN query to pull everything needed into one flat row per candidate. since the DB is fully normalized
+CANDIDATE_PROFILE_SQL = """
                     WITH
                         -- Aggregate all skills per candidate in one pass
                         all_skills AS (SELECT cs.candidate_id,
@@ -42,6 +130,7 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                                                                                                    FILTER (WHERE cs.proficiency_level = 'Expert') AS top_skills
                                        FROM candidate_skills cs
                                                 JOIN skills s ON s.id = cs.skill_id
+                                       {scope_cs}
                                        GROUP BY cs.candidate_id),
 
                         -- Aggregate work history per candidate in one pass
@@ -52,6 +141,7 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                                              ) AS work_history
                                       FROM work_experience we
                                                JOIN companies comp ON comp.id = we.company_id
+                                      {scope_we}
                                       GROUP BY we.candidate_id),
 
                         -- Aggregate education per candidate in one pass
@@ -64,6 +154,7 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                                              JOIN degrees d ON d.id = e.degree_id
                                              JOIN fields_of_study fos ON fos.id = e.field_of_study_id
                                              JOIN institutions inst ON inst.id = e.institution_id
+                                    {scope_e}
                                     GROUP BY e.candidate_id),
 
                         -- Aggregate languages per candidate in one pass
@@ -75,6 +166,7 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                                      FROM candidate_languages cl
                                               JOIN languages l ON l.id = cl.language_id
                                               JOIN proficiency_levels pl ON pl.id = cl.proficiency_level_id
+                                     {scope_cl}
                                      GROUP BY cl.candidate_id),
 
                         -- Get only the most recent current job per candidate
@@ -88,7 +180,7 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                     FROM work_experience we
                         JOIN companies comp
                     ON comp.id = we.company_id
-                    WHERE we.is_current = true
+                    WHERE we.is_current = true {scope_current}
                     ORDER BY we.candidate_id, we.start_date DESC
                         )
 
@@ -116,43 +208,203 @@ def fetch_all_candidates() -> list[CandidateProfile]:
                              LEFT JOIN work_hist wh ON wh.candidate_id = c.id
                              LEFT JOIN edu_agg ed ON ed.candidate_id = c.id
                              LEFT JOIN lang_agg la ON la.candidate_id = c.id
-                    ORDER BY c.created_at DESC
-                    """)
-        rows = cur.fetchall()
-    except Exception as e:
-        logger.error("SQL query failed: %s", e)
-        raise
-    finally:
-        cur.close()
-        conn.close()
+                    {where}
+                    ORDER BY c.id
+                    """
 
-    logger.info("SQL returned %d rows", len(rows))
 
-    candidates = []
+def profile_query(where: str = "", scope: str = None) -> str:
+    """
+    Build the flat-profile query. `scope` is a subquery returning candidate
+    ids; when given, every aggregate only reads rows for those candidates
+    instead of the whole database.
+    """
+    def restrict(alias: str, keyword: str = "WHERE") -> str:
+        return f"{keyword} {alias}.candidate_id IN ({scope})" if scope else ""
+
+    if scope and not where:
+        where = f"WHERE c.id IN ({scope})"
+    return CANDIDATE_PROFILE_SQL.format(
+        scope_cs=restrict("cs"),
+        scope_we=restrict("we"),
+        scope_e=restrict("e"),
+        scope_cl=restrict("cl"),
+        scope_current=restrict("we", "AND"),
+        where=where,
+    )
+
+
+def _profile_table_query(where: str = "") -> str:
+    return f"SELECT {', '.join(PROFILE_COLUMNS)} FROM {PROFILE_TABLE} {where} ORDER BY id"
+
+
+def _to_profiles(rows) -> tuple[list[CandidateProfile], int]:
+    profiles = []
     skipped = 0
     for row in rows:
         try:
-            candidates.append(CandidateProfile(**dict(row)))
+            profiles.append(CandidateProfile(**dict(row)))
         except Exception as e:
             skipped += 1
             logger.warning("Skipping malformed row id=%s: %s", row.get("id"), e)
+    return profiles, skipped
+
+
+def _to_records(rows: list[tuple]) -> tuple[list[CandidateRecord], int]:
+    """
+    Map tuple rows positionally onto CandidateRecord. Only the fields the
+    column types don't already guarantee are checked.
+    """
+    records = []
+    skipped = 0
+    make = CandidateRecord._make
+    for row in rows:
+        if row[_ID] is None or row[_NAME] is None:
+            skipped += 1
+            logger.warning("Skipping malformed row id=%s: missing id or name", row[_ID])
+            continue
+        years = row[_YEARS]
+        if years is not None and type(years) is not int:
+            try:
+                row = (*row[:_YEARS], int(years), *row[_YEARS + 1:])
+            except (TypeError, ValueError) as e:
+                skipped += 1
+                logger.warning("Skipping malformed row id=%s: %s", row[_ID], e)
+                continue
+        records.append(make(row))
+    return records, skipped
+
+
+def iter_candidates(
+    batch_size: int = 500,
+    after_id: str = None,
+    until_id: str = None,
+) -> Iterator[list[CandidateRecord]]:
+    """
+    Stream candidates in id order through a server-side (named) cursor so
+    memory stays flat no matter how large the candidates table gets.
+    Rows come back as plain tuples and are decoded positionally.
+    Reads the materialized profile table when use_profile_table is on.
+    Only ids in (after_id, until_id] are read, which is how checkpoints
+    resume and how parallel fetches split the table.
+    """
+    logger.info(
+        "Streaming candidates from PostgreSQL | batch_size=%d after_id=%s until_id=%s",
+        batch_size, after_id, until_id,
+    )
+    conditions, params = [], {}
+    if after_id is not None:
+        conditions.append("id > %(after_id)s")
+        params["after_id"] = after_id
+    if until_id is not None:
+        conditions.append("id <= %(until_id)s")
+        params["until_id"] = until_id
+    if settings.use_profile_table:
+        sql = _profile_table_query(f"WHERE {' AND '.join(conditions)}" if conditions else "")
+    else:
+        # The range goes into every aggregate, so each partition only aggregates its own ids
+        scope = f"SELECT id FROM candidates WHERE {' AND '.join(conditions)}" if conditions else None
+        sql = profile_query(scope=scope)
+
+    fetched = 0
+    skipped = 0
+    with get_connection() as conn:
+        try:
+            cur = conn.cursor(name="candidate_stream")
+            cur.itersize = batch_size
+        except Exception as e:
+            logger.error("Could not open DB cursor: %s", e)
+            raise
+
+        try:
+            try:
+                cur.execute(sql, params or None)
+            except Exception as e:
+                logger.error("SQL query failed: %s", e)
+                raise
+
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                fetched += len(rows)
+
+                batch, bad = _to_records(rows)
+                skipped += bad
+                if batch:
+                    yield batch
+        finally:
+            cur.close()
 
     if skipped:
         logger.warning("Skipped %d malformed rows during fetch", skipped)
+    logger.info("SQL streamed %d rows", fetched)
 
-    logger.info("Returning %d valid candidates", len(candidates))
-    return candidates
+
+def fetch_profiles(ids: list[str]) -> list[CandidateProfile]:
+    """Flat profiles for a set of candidate ids, without scanning everyone else."""
+    if not ids:
+        return []
+    if settings.use_profile_table:
+        sql = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM {PROFILE_TABLE} WHERE id = ANY(%(ids)s)"
+    else:
+        sql = profile_query(scope="SELECT id FROM candidates WHERE id::text = ANY(%(ids)s)")
+    try:
+        with get_connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(sql, {"ids": list(ids)})
+            profiles, _ = _to_profiles(cur.fetchall())
+        return profiles
+    except Exception as e:
+        logger.error("Failed to fetch profiles for %d candidates: %s", len(ids), e)
+        raise
+
+
+def partition_candidates(parts: int) -> list[tuple[Optional[str], Optional[str]]]:
+    """
+    Split the candidate id space into `parts` keyset ranges of roughly
+    equal size, returned as (after_id, until_id) pairs for iter_candidates.
+    """
+    if parts <= 1:
+        return [(None, None)]
+    table = PROFILE_TABLE if settings.use_profile_table else "candidates"
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            total = cur.fetchone()[0]
+            step = max(-(-total // parts), 1)
+            cur.execute(
+                f"SELECT id::text FROM (SELECT id, row_number() OVER (ORDER BY id) AS rn FROM {table}) t "
+                f"WHERE rn %% %s = 0 ORDER BY rn",
+                (step,),
+            )
+            cuts = [row[0] for row in cur.fetchall()][: parts - 1]
+    except Exception as e:
+        logger.error("Failed to partition candidates: %s", e)
+        raise
+
+    bounds = [None, *cuts, None]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    logger.info("Partitioned %d candidates into %d ranges", total, len(ranges))
+    return ranges
+
+
+def fetch_candidate_ids() -> set[str]:
+    logger.debug("Fetching all candidate ids")
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id::text FROM candidates")
+            return {row[0] for row in cur.fetchall()}
+    except Exception as e:
+        logger.error("Failed to fetch candidate ids: %s", e)
+        raise
 
 
 def count_candidates() -> int:
     logger.debug("Counting candidates in DB")
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM candidates")
-        result = cur.fetchone()[0]
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM candidates")
+            result = cur.fetchone()[0]
         logger.debug("Total candidates in DB: %d", result)
         return result
     except Exception as e:
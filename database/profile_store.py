@@ -0,0 +1,282 @@
+"""
+Columnar store for the candidate fields that results display.
+
+The vector index only keeps ids and the fields `where` clauses filter
+on. Names, titles, skills, education and the rest live here, keyed by
+candidate id, and are read only for the rows a caller actually shows.
+
+Each collection (named after its vector collection) is a list of
+immutable segments:
+
+    <root>/<collection>/MANIFEST            segment names, oldest first
+    <root>/<collection>/s<k>/ids.json       row ids, and ids this segment deletes
+    <root>/<collection>/s<k>/<field>.bin    UTF-8 values of one field, back to back
+    <root>/<collection>/s<k>/<field>.off    int64 offsets: row i is bin[off[i]:off[i + 1]]
+
+Column files are memory-mapped, so a lookup touches only the pages of
+the fields and rows it reads, and every worker shares them through the
+page cache. Writes are buffered and flushed as a new segment whose rows
+override older ones; the newest segments are merged when there are too
+many of them, and all of them when most of their rows are stale. A segment is fsynced
+before the MANIFEST that lists it is replaced.
+"""
+
+import json
+import logging
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from database.fileio import fsync_dir, replace_durably, stamp, write_durably
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_FIELDS = (
+    "name",
+    "headline",
+    "current_title",
+    "current_company",
+    "industry",
+    "city",
+    "country",
+    "skills",
+    "top_skills",
+    "education",
+    "languages",
+    "email",
+)
+# Segments per collection before a flush merges them
+_MAX_SEGMENTS = 8
+
+
+class _Segment:
+    """One flushed batch of rows, every column mapped read-only."""
+
+    def __init__(self, path: Path):
+        records = json.loads((path / "ids.json").read_text())
+        self.name = path.name
+        self.ids: list[str] = records["ids"]
+        self.deleted: list[str] = records["deleted"]
+        # Mapped up front: a merge may remove the directory while this process still reads it
+        self._columns = {field: _map_column(path, field) for field in DISPLAY_FIELDS}
+
+    def value(self, field: str, row: int) -> str:
+        blob, offsets = self._columns[field]
+        return bytes(blob[offsets[row] : offsets[row + 1]]).decode("utf-8")
+
+    @staticmethod
+    def write(path: Path, ids: list[str], profiles: list[dict], deleted: list[str]):
+        path.mkdir(parents=True, exist_ok=True)
+        for field in DISPLAY_FIELDS:
+            values = [str(p.get(field) or "").encode("utf-8") for p in profiles]
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(v) for v in values], out=offsets[1:])
+            write_durably(path / f"{field}.bin", b"".join(values))
+            write_durably(path / f"{field}.off", offsets)
+        write_durably(path / "ids.json", json.dumps({"ids": ids, "deleted": deleted}).encode("utf-8"))
+        fsync_dir(path)
+
+
+class _ProfileCollection:
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.segments: list[_Segment] = []
+        # id -> (segment, row) of its newest flushed version
+        self.rows: dict[str, tuple[_Segment, int]] = {}
+        # Unflushed writes; None marks a delete
+        self.pending: dict[str, Optional[dict]] = {}
+        self._manifest: Optional[tuple[int, int]] = None
+        self._load()
+
+    # ---- Persistence -----------------------------------------------------
+
+    def _load(self):
+        self._manifest = stamp(self.path / "MANIFEST")
+        segments = []
+        if self._manifest is not None:
+            names = json.loads((self.path / "MANIFEST").read_text())["segments"]
+            segments = [_Segment(self.path / name) for name in names]
+        self.segments = segments
+        self.rows = {}
+        for segment in segments:
+            self._apply(segment)
+
+    def _apply(self, segment: _Segment):
+        for row, cid in enumerate(segment.ids):
+            self.rows[cid] = (segment, row)
+        for cid in segment.deleted:
+            self.rows.pop(cid, None)
+
+    def reload(self) -> bool:
+        """Pick up segments another process flushed; False when already current."""
+        with self.lock:
+            if self.pending or stamp(self.path / "MANIFEST") == self._manifest:
+                return False
+            for attempt in range(3):
+                try:
+                    self._load()
+                    break
+                except FileNotFoundError:
+                    # A merge removed a segment while we read the manifest; read it again
+                    if attempt == 2:
+                        raise
+        return True
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            upserts = [cid for cid, profile in self.pending.items() if profile is not None]
+            deleted = [cid for cid, profile in self.pending.items() if profile is None]
+            segment = self._write_segment(upserts, [self.pending[cid] for cid in upserts], deleted)
+            self.segments.append(segment)
+            self._apply(segment)
+            self.pending = {}
+            old = self._merge()
+
+            # Segments are on disk before the manifest that lists them
+            replace_durably(self.path / "MANIFEST", json.dumps({"segments": [s.name for s in self.segments]}))
+            self._manifest = stamp(self.path / "MANIFEST")
+        for stale in old:
+            shutil.rmtree(self.path / stale.name, ignore_errors=True)
+        logger.info("Flushed profiles %s | segment=%s rows=%d merged=%d",
+                    self.path.name, segment.name, len(upserts), len(old))
+
+    def _merge(self) -> list[_Segment]:
+        """
+        Merge segments once most stored rows are stale (all of them) or there
+        are too many (the newest, while the next older one is at most twice
+        their size, so a row is rewritten O(log n) times however small the
+        flushes are). Returns the segments merged away.
+        """
+        stored = sum(len(s.ids) for s in self.segments)
+        if stored - len(self.rows) > len(self.rows):
+            start = 0
+        elif len(self.segments) > _MAX_SEGMENTS:
+            start = len(self.segments) - 2
+            while start > 0 and len(self.segments[start - 1].ids) <= 2 * sum(len(s.ids) for s in self.segments[start:]):
+                start -= 1
+        else:
+            return []
+
+        merged = self.segments[start:]
+        names = {s.name for s in merged}
+        ids = [cid for cid, (segment, _) in self.rows.items() if segment.name in names]
+        # Deletes only matter while older segments may still hold the id
+        deleted = [] if start == 0 else sorted({cid for s in merged for cid in s.deleted} - set(ids))
+        segment = self._write_segment(ids, [self._read(cid, DISPLAY_FIELDS) for cid in ids], deleted)
+        self.segments = self.segments[:start] + [segment]
+        self.rows = {}
+        for kept in self.segments:
+            self._apply(kept)
+        return merged
+
+    def _write_segment(self, ids: list[str], profiles: list[dict], deleted: list[str]) -> _Segment:
+        number = max((int(s.name[1:]) for s in self.segments), default=0) + 1
+        _Segment.write(self.path / f"s{number}", ids, profiles, deleted)
+        return _Segment(self.path / f"s{number}")
+
+    # ---- Reads and writes ------------------------------------------------
+
+    def upsert(self, ids: list[str], profiles: list[dict]):
+        with self.lock:
+            for cid, profile in zip(ids, profiles):
+                self.pending[cid] = {field: profile.get(field) or "" for field in DISPLAY_FIELDS}
+
+    def delete(self, ids: list[str]):
+        with self.lock:
+            for cid in ids:
+                self.pending[cid] = None
+
+    def get(self, ids: Iterable[str], fields: Iterable[str]) -> dict[str, dict]:
+        with self.lock:
+            found = {}
+            for cid in ids:
+                profile = self._read(cid, fields)
+                if profile is not None:
+                    found[cid] = profile
+            return found
+
+    def _read(self, cid: str, fields: Iterable[str]) -> Optional[dict]:
+        if cid in self.pending:
+            profile = self.pending[cid]
+            return None if profile is None else {field: profile[field] for field in fields}
+        location = self.rows.get(cid)
+        if location is None:
+            return None
+        segment, row = location
+        return {field: segment.value(field, row) for field in fields}
+
+
+class ProfileStore:
+    """Display fields per vector collection, looked up by candidate id."""
+
+    def __init__(self, root: str, reload_seconds: Optional[float] = None):
+        self.root = Path(root)
+        # Seconds between checks for segments flushed by other workers; None when this process is the only one
+        self.reload_seconds = reload_seconds
+        self._last_refresh = time.monotonic()
+        self._collections: dict[str, _ProfileCollection] = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str) -> _ProfileCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = _ProfileCollection(self.root / name)
+            return self._collections[name]
+
+    def upsert(self, collection: str, ids: list[str], profiles: list[dict]):
+        self._collection(collection).upsert(ids, profiles)
+
+    def delete(self, collection: str, ids: list[str]):
+        self._collection(collection).delete(ids)
+
+    def get(self, collection: str, ids: Iterable[str], fields: Iterable[str] = DISPLAY_FIELDS) -> dict[str, dict]:
+        """Map each stored id to a dict of the requested fields; unknown ids are left out."""
+        return self._collection(collection).get(ids, tuple(fields))
+
+    def flush(self):
+        """
+        Flush every collection with buffered writes. There is no timer of
+        its own: the vector store facade calls this before the vectors it
+        buffers are flushed, and before every upsert into a backend that
+        writes through.
+        """
+        for handle in list(self._collections.values()):
+            handle.flush()
+
+    def refresh(self, collection: str, force: bool = False) -> bool:
+        if self.reload_seconds is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.reload_seconds:
+            return False
+        self._last_refresh = now
+        return self._collection(collection).reload()
+
+    def drop(self, collection: str):
+        with self._lock:
+            self._collections.pop(collection, None)
+            shutil.rmtree(self.root / collection, ignore_errors=True)
+
+    def prune(self, keep: set[str]):
+        """Drop the profiles of every collection not in `keep`."""
+        if not self.root.is_dir():
+            return
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name not in keep:
+                self.drop(path.name)
+                logger.info("Dropped profiles of pruned collection %s", path.name)
+
+
+def _map_column(path: Path, field: str) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.memmap(path / f"{field}.off", dtype=np.int64, mode="r")
+    # np.memmap refuses empty files, which an all-blank column produces
+    if offsets[-1] == 0:
+        return np.empty(0, dtype=np.uint8), offsets
+    return np.memmap(path / f"{field}.bin", dtype=np.uint8, mode="r"), offsets
@@ -0,0 +1,139 @@
+"""
+Materialized flat-profile table.
+
+candidate_profiles holds the output of the five-CTE profile query, one row
+per candidate, so ingest and profile lookups read it directly instead of
+re-aggregating skills, work history, education and languages every time.
+
+Row triggers on the per-candidate tables record changed ids in the
+candidate_profile_changes log, and refresh_profiles() rebuilds only those
+rows. Renaming a skill or company marks every candidate that references
+it. Edits to the other lookup tables (cities, countries, degrees,
+institutions, fields of study, languages, proficiency levels) are rare
+and need refresh_profiles(full=True).
+"""
+
+import logging
+
+from database.postgres import PROFILE_TABLE, get_connection, profile_query
+
+logger = logging.getLogger(__name__)
+
+# (table, column holding the candidate id)
+_CANDIDATE_TABLES = [
+    ("candidates", "id"),
+    ("candidate_skills", "candidate_id"),
+    ("work_experience", "candidate_id"),
+    ("education", "candidate_id"),
+    ("candidate_languages", "candidate_id"),
+]
+
+# (lookup table, link table, link column) — a rename fans out to every linked candidate
+_LOOKUP_TABLES = [
+    ("skills", "candidate_skills", "skill_id"),
+    ("companies", "work_experience", "company_id"),
+]
+
+_SETUP_SQL = """
+CREATE TABLE IF NOT EXISTS candidate_profile_changes AS
+    SELECT id AS candidate_id, now() AS changed_at FROM candidates WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS candidate_profile_changes_pk
+    ON candidate_profile_changes (candidate_id);
+
+CREATE OR REPLACE FUNCTION candidate_profile_mark_dirty() RETURNS trigger AS $$
+DECLARE
+    log_sql text := format(
+        'INSERT INTO candidate_profile_changes (candidate_id, changed_at)
+         SELECT ($1).%I, clock_timestamp()
+         ON CONFLICT (candidate_id) DO UPDATE SET changed_at = EXCLUDED.changed_at',
+        TG_ARGV[0]);
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        EXECUTE log_sql USING OLD;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE log_sql USING NEW;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION candidate_profile_mark_linked_dirty() RETURNS trigger AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO candidate_profile_changes (candidate_id, changed_at)
+         SELECT DISTINCT candidate_id, clock_timestamp() FROM %I WHERE %I = ($1).id
+         ON CONFLICT (candidate_id) DO UPDATE SET changed_at = EXCLUDED.changed_at',
+        TG_ARGV[0], TG_ARGV[1]) USING NEW;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def ensure_profile_table():
+    """Create the profile table, change log and triggers if they are missing."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NULL", (PROFILE_TABLE,))
+        created = cur.fetchone()[0]
+
+        cur.execute(_SETUP_SQL)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} AS "
+            f"SELECT q.*, now() AS updated_at FROM ({profile_query()}) q WITH NO DATA"
+        )
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {PROFILE_TABLE}_pk ON {PROFILE_TABLE} (id)")
+
+        for table, column in _CANDIDATE_TABLES:
+            cur.execute(f"DROP TRIGGER IF EXISTS candidate_profile_dirty ON {table}")
+            cur.execute(
+                f"CREATE TRIGGER candidate_profile_dirty AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION candidate_profile_mark_dirty('{column}')"
+            )
+        for table, link_table, link_column in _LOOKUP_TABLES:
+            cur.execute(f"DROP TRIGGER IF EXISTS candidate_profile_dirty ON {table}")
+            cur.execute(
+                f"CREATE TRIGGER candidate_profile_dirty AFTER UPDATE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION candidate_profile_mark_linked_dirty('{link_table}', '{link_column}')"
+            )
+        conn.commit()
+    logger.info("Profile table %s ready", PROFILE_TABLE)
+
+    if created:
+        refresh_profiles(full=True)
+
+
+def refresh_profiles(full: bool = False) -> int:
+    """
+    Fold pending changes into the profile table and return how many
+    candidates were rebuilt. `full=True` rebuilds every row.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        # Serialise refreshes across workers
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (PROFILE_TABLE,))
+
+        if full:
+            cur.execute(f"TRUNCATE {PROFILE_TABLE}")
+            cur.execute(f"INSERT INTO {PROFILE_TABLE} SELECT q.*, now() FROM ({profile_query()}) q")
+            refreshed = cur.rowcount
+            cur.execute("TRUNCATE candidate_profile_changes")
+        else:
+            cur.execute(
+                "CREATE TEMP TABLE _claimed ON COMMIT DROP AS "
+                "SELECT candidate_id, changed_at FROM candidate_profile_changes"
+            )
+            cur.execute("SELECT COUNT(*) FROM _claimed")
+            refreshed = cur.fetchone()[0]
+            if refreshed:
+                # Changes logged after we claimed the batch stay for the next refresh
+                cur.execute(
+                    "DELETE FROM candidate_profile_changes ch USING _claimed cl "
+                    "WHERE ch.candidate_id = cl.candidate_id AND ch.changed_at <= cl.changed_at"
+                )
+                cur.execute(f"DELETE FROM {PROFILE_TABLE} WHERE id IN (SELECT candidate_id::text FROM _claimed)")
+                scope = "SELECT candidate_id FROM _claimed"
+                cur.execute(f"INSERT INTO {PROFILE_TABLE} SELECT q.*, now() FROM ({profile_query(scope=scope)}) q")
+        conn.commit()
+
+    logger.info("Profile table refreshed | full=%s candidates=%d", full, refreshed)
+    return refreshed
@@ -1,84 +1,454 @@
 """
-Thin wrapper around ChromaDB.
+Vector store facade.
 Stores candidate vectors + metadata, and searches them.
+
+The backend is chosen by `settings.vector_backend`:
+  - "chroma": ChromaDB HNSW collections (approximate search)
+  - "numpy":  exact brute-force cosine search over a memory-mapped matrix
+
+When hybrid search is on and a query text is given, search also runs a
+BM25 lookup over the short metadata fields and merges both rankings with
+reciprocal-rank fusion.
+
+Full rebuilds go into a versioned shadow collection (candidates_v1,
+candidates_v2, ...). Search keeps serving the active collection until the
+shadow is complete and validated, then a pointer file is swapped
+atomically. Older versions are kept around for fast rollback.
+
+Index metadata is kept lean: the content hash plus the filter fields.
+Display fields live in a columnar profile store next to each collection;
+search results carry only ids, scores and filter fields until hydrate()
+fills in what the caller is about to show. Profiles missing from the
+store are read back from PostgreSQL by id.
+
+With `settings.multi_worker`, every uvicorn worker maps the same numpy
+index read-only and reads go through refresh(), which remaps it once
+another worker's ingest flushes a generation or swaps the collection.
 """
 
-import chromadb
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from config import settings
+from database.backends.base import VectorStore
+from database.lexical_index import INDEXED_FIELDS, LexicalIndex
+from database.postgres import fetch_profiles
+from database.profile_store import DISPLAY_FIELDS, ProfileStore
+from models.candidate import CandidateProfile, CandidateRecord
+
+logger = logging.getLogger(__name__)
+
 
-from models.candidate import CandidateProfile
+def _create_store() -> VectorStore:
+    if settings.multi_worker and settings.vector_backend != "numpy":
+        # Each worker would open its own Chroma client and copy of the HNSW graph
+        raise ValueError("MULTI_WORKER needs VECTOR_BACKEND=numpy, the only backend workers can share")
+    if settings.vector_backend == "chroma":
+        from database.backends.chroma_backend import ChromaStore
+        return ChromaStore(
+            settings.chroma_path,
+            settings.index_keep_versions,
+            m=settings.hnsw_m,
+            ef_construction=settings.hnsw_ef_construction,
+            ef_search=settings.hnsw_ef_search,
+        )
+    if settings.vector_backend == "numpy":
+        from database.backends.numpy_backend import NumpyStore
+        return NumpyStore(
+            settings.numpy_index_path,
+            settings.index_keep_versions,
+            settings.numpy_flush_seconds,
+            quantization=settings.numpy_quantization,
+            rescore_depth=settings.numpy_rescore_depth,
+            reload_seconds=settings.index_reload_seconds if settings.multi_worker else None,
+        )
+    raise ValueError(f"Unknown vector backend {settings.vector_backend!r} (expected 'chroma' or 'numpy')")
 
-COLLECTION_NAME = "candidates"
 
-# One persistent client for the whole app
-_client = chromadb.PersistentClient(path="../chroma_db")
-_collection = _client.get_or_create_collection(
-    name=COLLECTION_NAME,
-    metadata={"hnsw:space": "cosine"},
+# One store for the whole app
+_store = _create_store()
+logger.info("Vector store backend: %s | active=%s", settings.vector_backend, _store.active_collection())
+
+_profiles = ProfileStore(
+    settings.profile_store_path,
+    reload_seconds=settings.index_reload_seconds if settings.multi_worker else None,
 )
 
+# Both stores flush together on one timer, see flush()
+_last_flush = time.monotonic()
+_flush_lock = threading.Lock()
+
+# Profile fields the LLM rerank and short result listings need
+SUMMARY_FIELDS = ("name", "current_title", "city", "country", "skills")
+
+# Normalized, typed copies of the fields `where` clauses filter on
+FILTER_COUNTRY = "filter_country"
+FILTER_CITY = "filter_city"
+FILTER_INDUSTRY = "filter_industry"
+FILTER_LANGUAGES = "filter_languages"
+FILTER_YEARS = "years_of_experience"
+_VOCABULARY_FIELDS = (FILTER_COUNTRY, FILTER_CITY, FILTER_INDUSTRY, FILTER_LANGUAGES)
+
+# BM25 index and filter vocabulary of the active collection, built from its metadata on first use
+_lexical = LexicalIndex()
+_vocabulary: dict[str, set[str]] = {name: set() for name in _VOCABULARY_FIELDS}
+# Bumped whenever the vocabulary changes so readers can cache what they derive from it
+_vocabulary_version = 0
+_vocabulary_snapshot: tuple[int, dict[str, frozenset[str]]] = (-1, {})
+_derived_ready = False
+_derived_lock = threading.RLock()
+
+
+def _lexical_index() -> LexicalIndex:
+    if not _derived_ready:
+        _rebuild_derived()
+    return _lexical
+
+
+def filter_vocabulary() -> tuple[int, dict[str, frozenset[str]]]:
+    """
+    (version, values) where values holds every normalized value of each
+    filter field in the active collection. The version changes whenever
+    the values do.
+    """
+    global _vocabulary_snapshot
+    refresh()
+    if not _derived_ready:
+        _rebuild_derived()
+    with _derived_lock:
+        if _vocabulary_snapshot[0] != _vocabulary_version:
+            _vocabulary_snapshot = (_vocabulary_version, {k: frozenset(v) for k, v in _vocabulary.items()})
+        return _vocabulary_snapshot
+
 
-def upsert_candidates(candidates: list[CandidateProfile], embeddings: list[list[float]]):
-    _collection.upsert(
-        ids=[c.id for c in candidates],
+def refresh(force: bool = False) -> bool:
+    """
+    Pick up index writes made by other worker processes; a no-op unless
+    several workers share the index. Returns True if the view changed, in
+    which case the lexical index and vocabulary are rebuilt on next use.
+    """
+    global _derived_ready
+    changed = _store.refresh(force)
+    # Profiles follow the index; check them whenever the index is checked
+    changed = _profiles.refresh(_store.active_collection(), force) or changed
+    if not changed:
+        return False
+    with _derived_lock:
+        _derived_ready = False
+    return True
+
+
+def _rebuild_derived():
+    global _derived_ready
+    with _derived_lock:
+        _lexical.clear()
+        _clear_vocabulary()
+        active = _store.active_collection()
+        for page in _store.metadata_pages():
+            ids = [cid for cid, _ in page]
+            metadatas = [m or {} for _, m in page]
+            # Indexes built before the profile store still carry these fields in their metadata
+            profiles = _profiles.get(active, ids, INDEXED_FIELDS)
+            _lexical.add(ids, [{**m, **profiles.get(cid, {})} for cid, m in zip(ids, metadatas)])
+            _add_vocabulary(metadatas)
+        _derived_ready = True
+    logger.info("Lexical index built | collection=%s documents=%d", _store.active_collection(), len(_lexical))
+
+
+def _add_vocabulary(metadatas: list[dict]):
+    global _vocabulary_version
+    with _derived_lock:
+        before = sum(len(v) for v in _vocabulary.values())
+        for metadata in metadatas:
+            for name in _VOCABULARY_FIELDS:
+                value = metadata.get(name)
+                if isinstance(value, list):
+                    _vocabulary[name].update(value)
+                elif value:
+                    _vocabulary[name].add(value)
+        if sum(len(v) for v in _vocabulary.values()) != before:
+            _vocabulary_version += 1
+
+
+def _clear_vocabulary():
+    global _vocabulary_version
+    with _derived_lock:
+        for values in _vocabulary.values():
+            values.clear()
+        _vocabulary_version += 1
+
+
+def upsert_candidates(
+    candidates: list[CandidateProfile | CandidateRecord],
+    embeddings: list[list[float]],
+    content_hashes: list[str] = None,
+    collection: str = None,
+):
+    """Upsert into the active collection, or into a shadow build when `collection` is given."""
+    hashes = content_hashes or [""] * len(candidates)
+    ids = [c.id for c in candidates]
+    metadatas = [_build_metadata(c, h) for c, h in zip(candidates, hashes)]
+    profiles = [_build_profile(c) for c in candidates]
+    _profiles.upsert(collection or _store.active_collection(), ids, profiles)
+    if not _store.buffers_writes:
+        # The upsert makes the content hashes durable, and ingest skips ids whose hash
+        # matches, so their profiles must already be on disk when it returns
+        _profiles.flush()
+    _store.upsert(
+        ids=ids,
         embeddings=embeddings,
-        metadatas=[_build_metadata(c) for c in candidates],
-        documents=[c.headline or c.name for c in candidates],
+        metadatas=metadatas,
+        documents=None,
+        collection=collection,
     )
+    # Shadow builds get their lexical index when they are activated
+    if collection is None or collection == _store.active_collection():
+        _lexical.add(ids, profiles)
+        _add_vocabulary(metadatas)
 
 
-def search(query_vector: list[float], top_k: int = 5 , where: dict = None) -> list[dict]:
-    if _collection.count() == 0:
-        return []
+def flush(force: bool = False) -> bool:
+    """
+    Persist buffered writes, at most every NUMPY_FLUSH_SECONDS unless
+    forced. Returns True once everything upserted so far is durable, which
+    is when ingest may record a checkpoint; False while the next flush is
+    not due yet.
+    """
+    global _last_flush
+    with _flush_lock:
+        if not force and time.monotonic() - _last_flush < settings.numpy_flush_seconds:
+            return False
+        # Profiles first: a worker that maps the new vectors must find their profiles on disk.
+        # Backends that write through had their profiles flushed by upsert_candidates already.
+        _profiles.flush()
+        durable = _store.flush(force=True)
+        _last_flush = time.monotonic()
+        return durable
+
+
+def get_content_hashes(page_size: int = 5000) -> dict[str, str]:
+    """
+    Map every indexed candidate id to the content hash it was embedded from.
+    Records indexed before hashes were stored come back as "".
+    """
+    hashes = {}
+    for page in _store.metadata_pages(page_size):
+        for cid, metadata in page:
+            hashes[cid] = (metadata or {}).get("content_hash", "")
+    return hashes
+
+
+def delete_candidates(ids: list[str]):
+    _store.delete(ids)
+    _profiles.delete(_store.active_collection(), ids)
+    _lexical.remove(ids)
+
+
+def hydrate(results: list[dict], fields: tuple[str, ...] = DISPLAY_FIELDS) -> list[dict]:
+    """
+    Add profile `fields` to search results from the active collection's
+    profile store. Call it on the rows about to be shown (SUMMARY_FIELDS
+    for a rerank prompt, everything for the final top-k), not on every hit.
+    """
+    active = _store.active_collection()
+    profiles = _profiles.get(active, [r["id"] for r in results], fields)
+    # Profiles of indexes built before the store are already in the result metadata
+    missing = [r["id"] for r in results if r["id"] not in profiles and "name" not in r]
+    if missing:
+        profiles.update(_recover_profiles(active, missing, fields))
+    return [{**profiles.get(r["id"], {}), **r} for r in results]
+
+
+def _recover_profiles(collection: str, ids: list[str], fields: tuple[str, ...]) -> dict[str, dict]:
+    """
+    Read profiles the store lost (e.g. a crash before they were flushed)
+    back from PostgreSQL and put them back into the store.
+    """
+    logger.warning("Profiles missing for %d search results, reading them from PostgreSQL", len(ids))
+    try:
+        found = fetch_profiles(ids)
+    except Exception as e:
+        logger.error("Could not recover profiles: %s", e)
+        return {}
+    profiles = [_build_profile(c) for c in found]
+    _profiles.upsert(collection, [c.id for c in found], profiles)
+    return {c.id: {field: p[field] for field in fields} for c, p in zip(found, profiles)}
 
-    kwargs = {
-        "query_embeddings": [query_vector],
-        "n_results": min(top_k, _collection.count()),
-        "include": ["metadatas", "distances"],
-    }
-    if where:
-        kwargs["where"] = where
-    results = _collection.query(**kwargs)
 
-    matches = []
-    for cid, metadata, distance in zip(
-        results["ids"][0],
-        results["metadatas"][0],
-        results["distances"][0],
-    ):
-        similarity = round(1 - (distance / 2), 4)  # cosine distance → similarity
-        matches.append({"id": cid, "score": similarity, **metadata})
+def search(query_vector: list[float], top_k: int = 5 , where: dict = None, query_text: str = None) -> list[dict]:
+    """
+    Return the top_k candidates for a query vector, best first.
+    With `query_text`, vector and BM25 rankings are fused; "score" stays the
+    cosine similarity either way.
+    """
+    return search_many([query_vector], top_k, [where], [query_text])[0]
 
 
-    return matches
+def search_many(
+    query_vectors: list[list[float]],
+    top_k: int = 5,
+    wheres: list[Optional[dict]] = None,
+    query_texts: list[Optional[str]] = None,
+    exclude: set[str] = None,
+) -> list[list[dict]]:
+    """
+    Run several searches in one pass over the index, one result list per
+    query vector. Each query may carry its own filter and query text, and
+    ids in `exclude` (e.g. candidates already shown) are left out of every list.
+    """
+    wheres = wheres or [None] * len(query_vectors)
+    query_texts = query_texts or [None] * len(query_vectors)
+    exclude = exclude or set()
+    hybrid = [settings.hybrid_search and bool(text) for text in query_texts]
+    depth = max(top_k, settings.hybrid_search_depth) if any(hybrid) else top_k
 
+    refresh()
+    results = []
+    all_hits = _store.query_many(query_vectors, depth, wheres, exclude)
+    for query_vector, where, query_text, is_hybrid, vector_hits in zip(query_vectors, wheres, query_texts, hybrid, all_hits):
+        matches = {}
+        for cid, distance, metadata in vector_hits:
+            similarity = round(1 - (distance / 2), 4)  # cosine distance → similarity
+            matches[cid] = {"id": cid, "score": similarity, **metadata}
+        if not is_hybrid:
+            results.append(list(matches.values())[:top_k])
+            continue
 
-def count() -> int:
-    return _collection.count()
+        lexical_hits = [
+            cid for cid, _ in _lexical_index().search(query_text, depth + len(exclude))
+            if cid not in exclude
+        ][:depth]
+        # Lexical-only hits still need their metadata, the filter check and a cosine score
+        query = _unit(query_vector)
+        for cid, vector, metadata in _store.fetch([c for c in lexical_hits if c not in matches], where):
+            matches[cid] = {"id": cid, "score": _similarity(query, vector), **metadata}
+
+        ranked = _fuse([[cid for cid, _, _ in vector_hits], [c for c in lexical_hits if c in matches]])
+        results.append([matches[cid] for cid in ranked[:top_k]])
+    return results
+
+
+def similarities(query_vector: list[float], ids: list[str]) -> dict[str, float]:
+    """Score stored candidates against a query vector, on the scale of search results' "score"."""
+    query = _unit(query_vector)
+    return {cid: _similarity(query, vector) for cid, vector, _ in _store.fetch(list(ids))}
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1)
+
+
+def _similarity(query: np.ndarray, vector) -> float:
+    """Cosine similarity mapped to [0, 1]; `query` must be unit length."""
+    vector = np.asarray(vector, dtype=np.float32)
+    cosine = float(vector @ query) / (float(np.linalg.norm(vector)) or 1)
+    return round((1 + cosine) / 2, 4)
+
+
+def _fuse(rankings: list[list[str]]) -> list[str]:
+    """Reciprocal-rank fusion: each list adds 1 / (k + rank) to an id's score."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1 / (settings.rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def count(collection: str = None) -> int:
+    refresh()
+    return _store.count(collection)
+
+
+def vector_pages(page_size: int = 5000):
+    """Yield (ids, vectors) pages of the active collection."""
+    return _store.vector_pages(page_size)
+
+
+def index_stats(recall_samples: int = 0, top_k: int = 10) -> dict:
+    refresh()
+    return _store.index_stats(recall_samples, top_k)
+
+
+def active_collection() -> str:
+    refresh()
+    return _store.active_collection()
+
+
+def list_versions() -> list[str]:
+    """All candidate collections, oldest first."""
+    return _store.list_versions()
+
+
+def begin_rebuild() -> str:
+    """Create an empty shadow collection for a full rebuild and return its name."""
+    return _store.begin_rebuild()
+
+
+def activate(collection: str, expected_count: int = None):
+    """
+    Validate a finished shadow collection and make it the one search reads.
+    Raises ValueError and leaves the active collection untouched if the
+    shadow looks incomplete.
+    """
+    _profiles.flush()
+    _store.activate(collection, expected_count)
+    # The store pruned old versions; their profiles go with them
+    _profiles.prune(set(_store.list_versions()))
+    _rebuild_derived()
+
+
+def rollback() -> str:
+    """Re-activate the newest version older than the active one."""
+    restored = _store.rollback()
+    _rebuild_derived()
+    return restored
+
+
+def drop_collection(collection: str):
+    _store.drop_collection(collection)
+    _profiles.drop(collection)
 
 
 def wipe():
-    _client.delete_collection(COLLECTION_NAME)
-    # Recreate so the app can keep using _collection reference
-    global _collection
-    _collection = _client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"},
-    )
+    _profiles.drop(_store.active_collection())
+    _store.wipe()
+    _lexical.clear()
+    _clear_vocabulary()
+
+
+def normalize_filter_value(value: str) -> str:
+    return " ".join((value or "").lower().split())
 
 
-def _build_metadata(c: CandidateProfile) -> dict:
-    return {
-        "name":               c.name or "",
-        "headline":           c.headline or "",
-        "current_title":      c.current_title or "",
-        "current_company":    c.current_company or "",
-        "industry":           c.industry or "",
-        "city":               c.city or "",
-        "country":            c.country or "",
-        "years_of_experience": c.years_of_experience or 0,
-        "skills":             c.skills or "",
-        "top_skills":         c.top_skills or "",
-        "education":          (c.education or "")[:400],
-        "languages":          c.languages or "",
-        "email":              c.email or "",
+def parse_languages(languages: str) -> list[str]:
+    """'Arabic (Native), English (Fluent)' → ['arabic', 'english']"""
+    names = (normalize_filter_value(re.sub(r"\(.*?\)", "", part)) for part in (languages or "").split(","))
+    return sorted({n for n in names if n})
+
+
+def _build_metadata(c: CandidateProfile | CandidateRecord, content_hash: str = "") -> dict:
+    """Only what filters, incremental ingest and the vocabulary need; display fields go to the profile store."""
+    metadata = {
+        "years_of_experience": int(c.years_of_experience or 0),
+        "content_hash":       content_hash,
+        FILTER_COUNTRY:       normalize_filter_value(c.country),
+        FILTER_CITY:          normalize_filter_value(c.city),
+        FILTER_INDUSTRY:      normalize_filter_value(c.industry),
     }
+    # Chroma rejects empty lists, so candidates without languages omit the key
+    languages = parse_languages(c.languages)
+    if languages:
+        metadata[FILTER_LANGUAGES] = languages
+    return metadata
+
+
+def _build_profile(c: CandidateProfile | CandidateRecord) -> dict:
+    profile = {name: getattr(c, name) or "" for name in DISPLAY_FIELDS}
+    profile["education"] = profile["education"][:400]
+    return profile
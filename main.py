@@ -1,9 +1,14 @@
 import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
+from config import settings
+from database import postgres, profile_table
 from routes import ingest, chat, health, research
+from services import embeddings, http_pool, ingest_jobs
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,7 +16,30 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-app = FastAPI(title="InfoQuest - Expert Network Search")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        postgres.open_pool()
+        if settings.use_profile_table:
+            profile_table.ensure_profile_table()
+    except Exception as e:
+        # Keep serving search; the pool is retried on first use
+        logging.getLogger(__name__).error("PostgreSQL setup failed at startup: %s", e)
+    if settings.embedding_backend == "local":
+        # Load the weights now rather than on the first /chat request
+        try:
+            embeddings.load_model()
+        except Exception as e:
+            logging.getLogger(__name__).error("Local embedding model failed to load at startup: %s", e)
+    ingest_jobs.recover_jobs()
+    yield
+    ingest_jobs.shutdown_jobs()
+    postgres.close_pool()
+    await http_pool.aclose()
+
+
+app = FastAPI(title="InfoQuest - Expert Network Search", lifespan=lifespan)
 
 app.include_router(ingest.router)
 app.include_router(chat.router)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import NamedTuple, Optional
 
 class CandidateProfile(BaseModel):
     id: str
@@ -20,6 +20,30 @@ class CandidateProfile(BaseModel):
     job_description: Optional[str] = None
 
 
+class CandidateRecord(NamedTuple):
+    """
+    Tuple-backed profile used on the bulk ingest path. Fields are in the
+    same order as the profile query's columns, so a database row maps onto
+    it positionally with no per-row dict or validation overhead.
+    """
+    id: str
+    name: str
+    headline: Optional[str] = None
+    email: Optional[str] = None
+    years_of_experience: Optional[int] = None
+    city: Optional[str] = None
+    country: Optional[str] = None
+    current_title: Optional[str] = None
+    current_company: Optional[str] = None
+    industry: Optional[str] = None
+    job_description: Optional[str] = None
+    work_history: Optional[str] = None
+    skills: Optional[str] = None
+    top_skills: Optional[str] = None
+    education: Optional[str] = None
+    languages: Optional[str] = None
+
+
 class CandidateResult(BaseModel):
     id: str
     name: str
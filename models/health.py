@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -5,3 +7,15 @@ class HealthResponse(BaseModel):
     status: str
     candidates_in_db: int
     candidates_indexed: int
+
+
+class QueryCacheStatsResponse(BaseModel):
+    enabled: bool
+    entries: int = 0
+    max_entries: int = 0
+    ttl_seconds: float = 0.0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    hit_rate: Optional[float] = None
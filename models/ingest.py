@@ -1,9 +1,46 @@
+from datetime import datetime
+from typing import Optional
+
 from pydantic import BaseModel
 
 class IngestRequest(BaseModel):
     force_reingest: bool = False
+    incremental: bool = True
 
 class IngestResponse(BaseModel):
+    job_id: str
     status: str
     total_processed: int
-    message: str
\ No newline at end of file
+    message: str
+    fetched: int = 0
+    embedded: int = 0
+    failed: int = 0
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    expected_total: Optional[int] = None
+    rows_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    checkpoints: list[Optional[str]] = []
+    target_collection: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class IndexVersionsResponse(BaseModel):
+    active: str
+    versions: list[str]
+
+
+class IndexStatsResponse(BaseModel):
+    backend: str
+    collection: str
+    vectors: int
+    dimension: Optional[int] = None
+    quantization: str = "none"
+    full_precision_bytes: Optional[int] = None
+    full_precision_mapped: Optional[bool] = None
+    scan_bytes: Optional[int] = None
+    # Share of the exact top-k the quantized path also returns
+    recall_at_k: Optional[float] = None
+    recall_k: Optional[int] = None
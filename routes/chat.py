@@ -1,13 +1,22 @@
 import uuid
+import json
 import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
 from models.candidate import CandidateResult
 from models.chat import ChatResponse, ChatRequest
-from services.embeddings import embed_query
-from database.vectorstore import search, count
+from services.embedding_coalescer import embed_query_async
+from services.embeddings import normalize_query
+from database.vectorstore import SUMMARY_FIELDS, count, hydrate, search, similarities
+from config import settings
 from services import llm
+from services.deadlines import cancel_on_disconnect, request_deadline, stream_until_disconnect
+from services.query_constraints import extract_constraints
+from services.stage_graph import StageGraph
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -15,19 +24,107 @@ conversations: dict[str, list[dict]] = {}
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Search for candidates using natural language.
     Pass a conversation_id to continue a previous session.
     """
+    return await cancel_on_disconnect(http_request, _chat(request))
+
+
+async def _chat(request: ChatRequest) -> ChatResponse:
+    cid, history = _start(request)
+    deadline = request_deadline()
+
+    async def explain(rerank: list[dict]) -> list[dict]:
+        enriched = await _explain(request.query, rerank, deadline) if rerank else []
+        logger.info("Explanations generated for %d candidates", len(enriched))
+        return enriched
+
+    # The summary prompt only names the candidates, so it runs alongside the explanations
+    async def summary(rerank: list[dict]) -> Optional[str]:
+        if not rerank:
+            return None
+        try:
+            return await llm.summarise(request.query, rerank, deadline)
+        except Exception as e:
+            logger.warning("Summary generation failed: %s", e)
+            return _fallback_summary(rerank)
+
+    graph = _retrieval_graph(request, history, deadline)
+    graph.add("explain", explain, after=("rerank",))
+    graph.add("summary", summary, after=("rerank",))
+    stages = await _run(graph)
+
+    if not stages["rerank"]:
+        return _no_results(request, cid)
+    return _finish(request, cid, stages["explain"], stages["summary"])
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    POST /chat as Server-Sent Events. After search and rerank the stream
+    sends `candidates`, then one `explanation` per candidate as it is
+    written and `summary` text deltas as the LLM streams them, interleaved,
+    and finally `done` carrying the same ChatResponse POST /chat returns.
+    """
+    cid, history = _start(request)
+    # The budget covers the whole stream, not just the part before it starts
+    deadline = request_deadline()
+    stages = await cancel_on_disconnect(http_request, _run(_retrieval_graph(request, history, deadline)))
+    return StreamingResponse(
+        stream_until_disconnect(http_request, _stream(request, cid, stages["rerank"], deadline)),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream(request: ChatRequest, cid: str, results: list[dict], deadline: float) -> AsyncIterator[str]:
+    if not results:
+        yield _event("done", _no_results(request, cid).model_dump(mode="json"))
+        return
+
+    yield _event("candidates", {
+        "conversation_id": cid,
+        "candidates": [_to_candidate(r).model_dump(mode="json") for r in results],
+    })
+
+    enriched = list(results)
+    parts: list[str] = []
+    failed = False
+
+    async def explanation_events() -> AsyncIterator[str]:
+        async for position, explanation in _explanations(request.query, results, deadline):
+            enriched[position] = {**results[position], **explanation}
+            yield _event("explanation", {"id": results[position]["id"], **explanation})
+        logger.info("Explanations streamed for %d candidates", len(enriched))
+
+    async def summary_events() -> AsyncIterator[str]:
+        nonlocal failed
+        try:
+            async for delta in llm.stream_summary(request.query, results, deadline):
+                parts.append(delta)
+                yield _event("summary", {"delta": delta})
+        except Exception as e:
+            logger.warning("Summary streaming failed: %s", e)
+            failed = True
+
+    async for event in _merge(explanation_events(), summary_events()):
+        yield event
+
+    summary = _fallback_summary(enriched) if failed else "".join(parts).strip()
+    yield _event("done", _finish(request, cid, enriched, summary).model_dump(mode="json"))
+
+
+def _start(request: ChatRequest) -> tuple[str, list[dict]]:
     logger.info("Chat request | query='%s' conversation_id=%s", request.query, request.conversation_id)
 
     if count() == 0:
         logger.warning("Chat called but vector store is empty")
         raise HTTPException(status_code=503, detail="No candidates indexed yet. Run POST /ingest first.")
 
-    loop = asyncio.get_event_loop()
-
     cid = request.conversation_id or str(uuid.uuid4())
     if cid not in conversations:
         conversations[cid] = []
@@ -35,88 +132,260 @@ async def chat(request: ChatRequest):
     else:
         logger.info("Continuing conversation | conversation_id=%s turns=%d", cid, len(conversations[cid]))
 
-    history = conversations[cid]
+    return cid, conversations[cid]
+
+
+def _retrieval_graph(request: ChatRequest, history: list[dict], deadline: float) -> StageGraph:
+    """
+    Stages from the user's query to the reranked, hydrated top_k (the
+    `rerank` result). A first turn has no history to resolve, so the raw
+    query is searched speculatively while the rewrite runs, and whichever
+    result list sits closer to the rewritten query goes to the rerank.
+    """
+    speculate = settings.speculative_search and not history
+    graph = StageGraph()
+
+    async def rewrite() -> str:
+        try:
+            rewritten = await llm.rewrite_query(request.query, history, deadline)
+            logger.info("Query rewritten | original='%s' rewritten='%s'", request.query, rewritten)
+            return rewritten
+        except Exception as e:
+            logger.warning("Query rewrite failed, using original query: %s", e)
+            return request.query
+
+    # Hard constraints come from what the user typed, not the expanded rewrite
+    async def constraints() -> Optional[dict]:
+        where = extract_constraints(request.query).to_where() if settings.query_filters else None
+        if where:
+            logger.info("Query constraints | where=%s", where)
+        return where
+
+    async def search_raw(constraints: Optional[dict]) -> list[dict]:
+        return await _search(request.query, request.top_k, constraints, deadline)
+
+    async def embed_rewritten(rewrite: str) -> Optional[list[float]]:
+        if speculate and normalize_query(rewrite) == normalize_query(request.query):
+            return None  # same query, search_raw already has the results
+        return await _embed(rewrite, deadline)
+
+    async def search_rewritten(
+        rewrite: str, embed_rewritten: Optional[list[float]], constraints: Optional[dict]
+    ) -> Optional[list[dict]]:
+        if embed_rewritten is None:
+            return None
+        return await _search(rewrite, request.top_k, constraints, deadline, embed_rewritten)
+
+    async def pick(
+        search_rewritten: Optional[list[dict]],
+        embed_rewritten: Optional[list[float]],
+        constraints: Optional[dict],
+        search_raw: Optional[list[dict]] = None,
+    ) -> list[dict]:
+        if search_rewritten is not None and search_raw is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, _better, search_raw, search_rewritten, request.top_k, embed_rewritten
+            )
+        if search_rewritten is not None:
+            return search_rewritten
+        if search_raw is not None:
+            return search_raw
+        # The rewrite matched the raw query but the speculative search failed
+        return await _search(request.query, request.top_k, constraints, deadline)
+
+    async def rerank(pick: list[dict]) -> list[dict]:
+        try:
+            try:
+                results = await llm.rerank_candidates(
+                    request.query, hydrate(pick, SUMMARY_FIELDS), request.top_k, deadline
+                )
+            except TimeoutError:
+                logger.warning("Rerank timed out, keeping the search order")
+                results = pick[: request.top_k]
+            # Only the candidates that survived the rerank need their full profile
+            results = hydrate(results)
+            logger.info("Vector search returned %d results", len(results))
+        except Exception as e:
+            logger.error("Vector search failed: %s", e)
+            raise HTTPException(status_code=500, detail=f"Search failed: {e}")
+        if not results:
+            logger.info("No results found for query='%s'", request.query)
+        return results
+
+    graph.add("rewrite", rewrite)
+    graph.add("constraints", constraints)
+    graph.add("embed_rewritten", embed_rewritten, after=("rewrite",))
+    graph.add("search_rewritten", search_rewritten, after=("rewrite", "embed_rewritten", "constraints"))
+    if speculate:
+        graph.add("search_raw", search_raw, after=("constraints",), speculative=True)
+        graph.add("pick", pick, after=("search_rewritten", "embed_rewritten", "constraints", "search_raw"))
+    else:
+        graph.add("pick", pick, after=("search_rewritten", "embed_rewritten", "constraints"))
+    graph.add("rerank", rerank, after=("pick",))
+    return graph
+
 
+async def _run(graph: StageGraph) -> dict:
     try:
-        rewritten = await loop.run_in_executor(
-            None, llm.rewrite_query, request.query, history
-        )
-        logger.info("Query rewritten | original='%s' rewritten='%s'", request.query, rewritten)
-    except Exception as e:
-        logger.warning("Query rewrite failed, using original query: %s", e)
-        rewritten = request.query
+        return await graph.run()
+    finally:
+        logger.info("Chat stages | %s", graph.format_timings())
 
+
+async def _embed(query_text: str, deadline: float) -> list[float]:
     try:
-        query_vector = await loop.run_in_executor(None, embed_query, rewritten)
+        return await embed_query_async(query_text, deadline)
+    except TimeoutError:
+        logger.error("Embedding timed out | query='%s'", query_text)
+        raise HTTPException(status_code=504, detail="Embedding timed out")
     except Exception as e:
         logger.error("Embedding failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Embedding failed: {e}")
 
+
+async def _search(
+    query_text: str, top_k: int, where: Optional[dict], deadline: float, query_vector: list[float] = None
+) -> list[dict]:
+    """Embed one query, unless its vector is given, and return 2 x top_k fused results for the rerank."""
+    if query_vector is None:
+        query_vector = await _embed(query_text, deadline)
+
+    def run() -> list[dict]:
+        results = search(query_vector, top_k=top_k * 2, where=where, query_text=query_text)
+        if where and not results:
+            logger.info("No candidates match the query constraints, searching without them")
+            results = search(query_vector, top_k=top_k * 2, query_text=query_text)
+        return results
+
     try:
-        raw_results = search(query_vector, top_k=request.top_k * 4)
-        results = await loop.run_in_executor(
-            None, llm.rerank_candidates, request.query, raw_results, request.top_k
-        )
-        logger.info("Vector search returned %d results", len(results))
+        return await asyncio.get_event_loop().run_in_executor(None, run)
     except Exception as e:
         logger.error("Vector search failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Search failed: {e}")
 
-    if not results:
-        logger.info("No results found for query='%s'", request.query)
-        return ChatResponse(
-            conversation_id=cid,
-            query=request.query,
-            candidates=[],
-            summary="No matching candidates found. Try broadening your search.",
-        )
+
+def _better(raw: list[dict], rewritten: list[dict], top_k: int, query_vector: list[float]) -> list[dict]:
+    """
+    The result list whose top_k sit closer to the rewritten query; ties go
+    to the rewrite. Each list's own scores are against its own query, and
+    its order is fused with BM25, so both are re-scored against the one
+    rewritten query vector and the best top_k by cosine are compared.
+    """
+    scores = similarities(query_vector, list({r["id"]: None for r in raw + rewritten}))
+
+    def strength(results: list[dict]) -> float:
+        head = sorted((scores.get(r["id"], 0.0) for r in results), reverse=True)[:top_k]
+        return sum(head) / len(head) if head else 0.0
+
+    raw_strength, rewritten_strength = strength(raw), strength(rewritten)
+    logger.info("Speculative search | raw=%.4f rewritten=%.4f", raw_strength, rewritten_strength)
+    return raw if raw_strength > rewritten_strength else rewritten
+
+
+async def _explain(query: str, results: list[dict], deadline: float) -> list[dict]:
+    if settings.batch_explanations:
+        explanations = await llm.explain_matches(query, results, deadline)
+        return [{**r, **explanation} for r, explanation in zip(results, explanations)]
+
+    enriched = list(results)
+    async for position, explanation in _explanations(query, results, deadline):
+        enriched[position] = {**results[position], **explanation}
+    return enriched
+
+
+async def _explanations(query: str, results: list[dict], deadline: float) -> AsyncIterator[tuple[int, dict]]:
+    """Yield (position, explanation) for every result in the order they are ready."""
+    if settings.batch_explanations:
+        async for item in llm.stream_explanations(query, results, deadline):
+            yield item
+        return
 
     semaphore = asyncio.Semaphore(3)
-    async def explain_one(r: dict) -> dict:
+
+    async def explain_one(position: int, r: dict) -> tuple[int, dict]:
         async with semaphore:
             try:
-                explanation = await loop.run_in_executor(
-                    None, llm.explain_match, request.query, r
-                )
-                return {**r, **explanation}
+                return position, await llm.explain_match(query, r, deadline)
             except Exception as e:
                 logger.warning("explain_match failed for candidate %s: %s", r.get("id"), e)
-                return {
-                    **r,
+                return position, {
                     "why_match": f"Relevant based on {r.get('top_skills') or r.get('skills') or 'experience'}.",
                     "highlights": [r.get("current_title", ""), r.get("industry", ""), r.get("skills", "")[:80]],
                 }
 
-    enriched = await asyncio.gather(*[explain_one(r) for r in results])
-    logger.info("Explanations generated for %d candidates", len(enriched))
+    for finished in asyncio.as_completed([explain_one(i, r) for i, r in enumerate(results)]):
+        yield await finished
+
+
+async def _merge(*streams: AsyncIterator) -> AsyncIterator:
+    """Yield the items of several async iterators in the order they are produced."""
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
 
+    async def pump(stream: AsyncIterator):
+        try:
+            async for item in stream:
+                await queue.put((item, None))
+        except Exception as e:
+            await queue.put((end, e))
+        else:
+            await queue.put((end, None))
+
+    pumps = [asyncio.ensure_future(pump(stream)) for stream in streams]
     try:
-        summary = await loop.run_in_executor(
-            None, llm.summarise, request.query, list(enriched)
-        )
-    except Exception as e:
-        logger.warning("Summary generation failed: %s", e)
-        summary = f"Found {len(enriched)} candidates matching your search."
-
-    candidates = [
-        CandidateResult(
-            id=r["id"],
-            name=r.get("name", ""),
-            headline=r.get("headline") or None,
-            current_title=r.get("current_title") or None,
-            current_company=r.get("current_company") or None,
-            location=", ".join(filter(None, [r.get("city"), r.get("country")])) or None,
-            industry=r.get("industry") or None,
-            years_of_experience=r.get("years_of_experience") or None,
-            skills=r.get("skills") or None,
-            languages=r.get("languages") or None,
-            education=r.get("education") or None,
-            relevance_score=r["score"],
-            why_match=r.get("why_match", ""),
-            highlights=[h for h in r.get("highlights", []) if h],
-        )
-        for r in enriched
-    ]
+        remaining = len(pumps)
+        while remaining:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is end:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in pumps:
+            task.cancel()
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _fallback_summary(enriched: list[dict]) -> str:
+    return f"Found {len(enriched)} candidates matching your search."
+
+
+def _no_results(request: ChatRequest, cid: str) -> ChatResponse:
+    return ChatResponse(
+        conversation_id=cid,
+        query=request.query,
+        candidates=[],
+        summary="No matching candidates found. Try broadening your search.",
+    )
+
+
+def _to_candidate(r: dict) -> CandidateResult:
+    return CandidateResult(
+        id=r["id"],
+        name=r.get("name", ""),
+        headline=r.get("headline") or None,
+        current_title=r.get("current_title") or None,
+        current_company=r.get("current_company") or None,
+        location=", ".join(filter(None, [r.get("city"), r.get("country")])) or None,
+        industry=r.get("industry") or None,
+        years_of_experience=r.get("years_of_experience") or None,
+        skills=r.get("skills") or None,
+        languages=r.get("languages") or None,
+        education=r.get("education") or None,
+        relevance_score=r["score"],
+        why_match=r.get("why_match", ""),
+        highlights=[h for h in r.get("highlights", []) if h],
+    )
+
+
+def _finish(request: ChatRequest, cid: str, enriched: list[dict], summary: str) -> ChatResponse:
+    candidates = [_to_candidate(r) for r in enriched]
 
     conversations[cid].append({"role": "user", "content": request.query})
     conversations[cid].append({"role": "assistant", "content": summary})
@@ -128,4 +397,4 @@ async def chat(request: ChatRequest):
         query=request.query,
         candidates=candidates,
         summary=summary,
-    )
\ No newline at end of file
+    )
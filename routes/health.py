@@ -3,7 +3,8 @@ import logging
 from fastapi import APIRouter
 from database.postgres import count_candidates
 from database.vectorstore import count
-from models.health import HealthResponse
+from models.health import HealthResponse, QueryCacheStatsResponse
+from services.embeddings import query_cache_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -29,3 +30,12 @@ async def health():
         candidates_in_db=in_db,
         candidates_indexed=indexed,
     )
+
+
+@router.get("/health/query-cache", response_model=QueryCacheStatsResponse)
+async def query_cache():
+    """Counters of the in-process query embedding cache, for sizing QUERY_CACHE_MAX_ENTRIES."""
+    stats = query_cache_stats()
+    if stats is None:
+        return QueryCacheStatsResponse(enabled=False)
+    return QueryCacheStatsResponse(enabled=True, **stats)
@@ -1,64 +1,121 @@
 import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
-from database.postgres import fetch_all_candidates
-from models.ingest import IngestRequest, IngestResponse
-from services.embeddings import build_candidate_text, embed_texts
-from database.vectorstore import upsert_candidates, wipe
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from database import vectorstore
+from models.ingest import IngestRequest, IngestResponse, IndexVersionsResponse, IndexStatsResponse
+from services import ingest_jobs
+from services.ingest_jobs import IngestJob, JobConflict
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/ingest", response_model=IngestResponse)
+@router.post("/ingest", response_model=IngestResponse, status_code=202)
 async def ingest(request: IngestRequest = IngestRequest()):
     """
-    Pull all candidates from Postgres embed them and store in ChromaDB.
+    Start a background job that streams all candidates from Postgres,
+    embeds them and stores them in ChromaDB. Poll GET /ingest/{job_id}
+    for progress. In incremental mode only new or changed profiles are
+    re-embedded and candidates removed from Postgres are dropped.
+    force_reingest builds a fresh collection and swaps it in when done.
     """
-    logger.info("Ingest started | force_reingest=%s", request.force_reingest)
+    logger.info("Ingest requested | force_reingest=%s incremental=%s", request.force_reingest, request.incremental)
+    try:
+        job = ingest_jobs.start_job(request.force_reingest, request.incremental)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _to_response(job)
+
+
+@router.get("/ingest/{job_id}", response_model=IngestResponse)
+async def ingest_status(job_id: str):
+    job = ingest_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingest job {job_id} not found")
+    return _to_response(job)
+
+
+@router.post("/ingest/{job_id}/resume", response_model=IngestResponse, status_code=202)
+async def ingest_resume(job_id: str):
+    """Resume a cancelled, failed or interrupted job from its last checkpoint."""
+    try:
+        job = ingest_jobs.resume_job(job_id)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingest job {job_id} not found")
+    return _to_response(job)
+
+
+@router.delete("/ingest/{job_id}", response_model=IngestResponse)
+async def ingest_cancel(job_id: str):
+    """Cancel a running job. It stops after the current batch and can be resumed later."""
+    try:
+        job = ingest_jobs.cancel_job(job_id)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingest job {job_id} not found")
+    return _to_response(job)
+
+
+@router.get("/index/versions", response_model=IndexVersionsResponse)
+async def index_versions():
+    return IndexVersionsResponse(active=vectorstore.active_collection(), versions=vectorstore.list_versions())
+
+
+@router.get("/index/stats", response_model=IndexStatsResponse)
+async def index_stats(recall_samples: int = Query(20, ge=0, le=1000), k: int = Query(10, ge=1, le=100)):
+    """Memory footprint of the active index and, for quantized search, its recall against exact search."""
     loop = asyncio.get_event_loop()
+    stats = await loop.run_in_executor(None, vectorstore.index_stats, recall_samples, k)
+    return IndexStatsResponse(**stats)
 
-    if request.force_reingest:
-        logger.info("Wiping existing vector store")
-        try:
-            wipe()
-        except Exception as e:
-            logger.error("Failed to wipe vector store: %s", e)
-            raise HTTPException(status_code=500, detail=f"Failed to wipe vector store: {e}")
 
+@router.post("/index/rollback", response_model=IndexVersionsResponse)
+async def index_rollback():
+    """Switch search back to the previous index version."""
     try:
-        candidates = await loop.run_in_executor(None, fetch_all_candidates)
-    except Exception as e:
-        logger.error("Failed to fetch candidates from Postgres: %s", e)
-        raise HTTPException(status_code=503, detail=f"Database error: {e}")
-
-    if not candidates:
-        logger.warning("No candidates found in database")
-        raise HTTPException(status_code=404, detail="No candidates found in database")
-
-    logger.info("Fetched %d candidates from Postgres", len(candidates))
-
-    BATCH = 64
-    total = 0
-    failed = 0
-
-    for i in range(0, len(candidates), BATCH):
-        batch = candidates[i : i + BATCH]
-        try:
-            texts = [build_candidate_text(c) for c in batch]
-            vectors = await loop.run_in_executor(None, embed_texts, texts)
-            upsert_candidates(batch, vectors)
-            total += len(batch)
-            logger.info("Ingested %d / %d candidates", total, len(candidates))
-        except Exception as e:
-            failed += len(batch)
-            logger.error("Failed to embed/upsert batch at index %d: %s", i, e)
-
-    logger.info("Ingest complete | processed=%d failed=%d", total, failed)
+        with ingest_jobs.index_writer():
+            restored = vectorstore.rollback()
+    except (JobConflict, ValueError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info("Rolled back index to %s", restored)
+    return IndexVersionsResponse(active=restored, versions=vectorstore.list_versions())
+
+
+def _to_response(job: IngestJob) -> IngestResponse:
+    stats = job.stats
+    if job.error:
+        message = job.error
+    elif job.status == "done":
+        message = f"Indexed {stats.upserted} candidates successfully."
+    elif job.status == "partial":
+        message = (f"Indexed {stats.upserted} candidates. {stats.failed} failed — check logs, "
+                   f"then retry them with POST /ingest/{job.id}/resume.")
+    elif job.status in ("cancelled", "interrupted"):
+        message = f"Stopped after {stats.upserted} candidates. Resume with POST /ingest/{job.id}/resume."
+    else:
+        message = f"Indexed {stats.upserted} candidates so far."
 
     return IngestResponse(
-        status="done" if failed == 0 else "partial",
-        total_processed=total,
-        message=f"Indexed {total} candidates successfully." if failed == 0
-                else f"Indexed {total} candidates. {failed} failed — check logs.",
-    )
\ No newline at end of file
+        job_id=job.id,
+        status=job.status,
+        total_processed=stats.upserted,
+        message=message,
+        fetched=stats.fetched,
+        embedded=stats.embedded,
+        failed=stats.failed,
+        added=stats.added,
+        updated=stats.updated,
+        unchanged=stats.unchanged,
+        deleted=stats.deleted,
+        expected_total=job.expected_total,
+        rows_per_second=job.rows_per_second,
+        eta_seconds=job.eta_seconds,
+        checkpoints=job.checkpoints,
+        target_collection=job.target_collection,
+        started_at=datetime.fromtimestamp(job.started_at) if job.started_at else None,
+        finished_at=datetime.fromtimestamp(job.finished_at) if job.finished_at else None,
+    )
@@ -1,26 +1,31 @@
-import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 
 from models.research import ResearchRequest, ResearchResponse, IterationLog
 from models.candidate import CandidateResult
-from services.embeddings import embed_query
-from database.vectorstore import search, count
+from services.embedding_coalescer import embed_query_async
+from database.vectorstore import SUMMARY_FIELDS, count, hydrate, search_many
 from services import llm
+from services.deadlines import cancel_on_disconnect, request_deadline
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.post("/research", response_model=ResearchResponse)
-async def research(request: ResearchRequest):
+async def research(request: ResearchRequest, http_request: Request):
+    return await cancel_on_disconnect(http_request, _research(request))
+
+
+async def _research(request: ResearchRequest) -> ResearchResponse:
 
     logger.info("ReAct research started | query='%s'", request.query)
 
     if count() == 0:
         raise HTTPException(status_code=503, detail="No candidates indexed. Run POST /ingest first.")
 
-    loop = asyncio.get_event_loop()
+    # Shared by every iteration; once it runs out the agent stops and the final rerank falls back to scores
+    deadline = request_deadline()
 
     all_candidates: dict[str, dict] = {}
     trace: list[IterationLog] = []
@@ -33,15 +38,18 @@ async def research(request: ResearchRequest):
         logger.info("ReAct iteration %d | total_collected=%d", iteration, len(all_candidates))
 
         try:
-            step = await loop.run_in_executor(
-                None,
-                llm.react_agent_step,
+            step = await llm.react_agent_step(
                 request.query,
                 history,
                 len(all_candidates),
                 iteration,
                 request.max_iterations,
+                deadline,
             )
+        except TimeoutError:
+            logger.warning("react_agent_step timed out at iteration %d", iteration)
+            stop_reason = "timed_out"
+            break
         except Exception as e:
             logger.error("react_agent_step failed: %s", e)
             stop_reason = "agent_error"
@@ -74,15 +82,16 @@ async def research(request: ResearchRequest):
 
         elif action == "search":
             try:
-                query_vector = await loop.run_in_executor(None, embed_query, action_input)
+                query_vector = await embed_query_async(action_input, deadline)
             except Exception as e:
                 logger.error("Embedding failed at iteration %d: %s", iteration, e)
                 observation = "Embedding failed — could not execute search."
                 new_count = 0
             else:
-                raw_results = search(query_vector, top_k=20)
-
-                new_results = [r for r in raw_results if r["id"] not in all_candidates]
+                # Skip candidates earlier iterations already collected
+                new_results = hydrate(search_many(
+                    [query_vector], top_k=20, query_texts=[action_input], exclude=set(all_candidates)
+                )[0], SUMMARY_FIELDS)
                 for r in new_results:
                     all_candidates[r["id"]] = r
 
@@ -121,18 +130,18 @@ async def research(request: ResearchRequest):
 
     if all_list:
         try:
-            final_results = await loop.run_in_executor(
-                None,
-                llm.rerank_candidates,
+            final_results = await llm.rerank_candidates(
                 request.query,
                 all_list,
-                min(len(all_list), 10)
+                min(len(all_list), 10),
+                deadline,
             )
         except Exception as e:
             logger.warning("Final rerank failed, sorting by score: %s", e)
             final_results = sorted(all_list, key=lambda r: r.get("score", 0), reverse=True)[:10]
     else:
         final_results = []
+    final_results = hydrate(final_results)
 
     candidates = [
         CandidateResult(
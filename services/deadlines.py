@@ -0,0 +1,112 @@
+"""
+Latency budgets for requests that fan out into LLM and embedding calls.
+
+A route takes `request_deadline()` when it starts and hands it to every
+call it makes. Each call then waits at most its own timeout or what is
+left of the request's budget, whichever is shorter, and is cancelled,
+closing its HTTP request, when that runs out. `cancel_on_disconnect`
+and `stream_until_disconnect` cancel a route's outstanding work as soon
+as its client goes away.
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's latency budget ran out before a call could start."""
+
+
+def request_deadline() -> float:
+    """Event loop time by which a request started now must be done."""
+    return asyncio.get_running_loop().time() + settings.request_budget_seconds
+
+
+def call_timeout(limit: float, deadline: Optional[float]) -> float:
+    """Seconds one call may take: `limit`, cut short by the request deadline."""
+    if deadline is None:
+        return limit
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request latency budget exhausted")
+    return min(limit, remaining)
+
+
+async def within(awaitable: Awaitable[T], limit: float, deadline: Optional[float]) -> T:
+    """Await `awaitable`, cancelling it once `call_timeout(limit, deadline)` has passed."""
+    try:
+        timeout = call_timeout(limit, deadline)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except TimeoutError:
+        raise TimeoutError(f"No response within {timeout:.1f}s") from None
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await a route's work, cancelling it (and every call it is waiting on)
+    if the client disconnects first. The request body must already be read.
+    """
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_disconnected(request))
+    try:
+        done, _ = await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if work not in done:
+        work.cancel()
+        logger.info("Client disconnected, cancelled %s", request.url.path)
+        # Nobody reads it; 499 is the usual "client closed request" status in access logs
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return work.result()
+
+
+async def stream_until_disconnect(request: Request, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Yield from `stream`, closing it if the client disconnects while it is
+    still working on its next item. Starlette on its own only notices when
+    the next item fails to send.
+    """
+    watcher = asyncio.ensure_future(_disconnected(request))
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(stream))
+            done, _ = await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if step not in done:
+                logger.info("Client disconnected, cancelled %s", request.url.path)
+                return
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        watcher.cancel()
+        if step is not None and not step.done():
+            step.cancel()
+            # The generator can only be closed once the step running inside it has stopped
+            await asyncio.gather(step, return_exceptions=True)
+        await stream.aclose()
+
+
+async def _disconnected(request: Request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
@@ -0,0 +1,170 @@
+"""
+On-disk embedding cache.
+
+Vectors are keyed by a hash of (model name, exact input text) and stored
+as packed float32 rows in SQLite, so wipes, vector store schema changes
+and restarts never pay for the same embedding twice. The cache is
+bounded: once it holds more than `max_entries` rows, the least recently
+used ones are evicted.
+
+Query vectors also go through QueryVectorCache, a small in-process LRU
+with a TTL, because /chat and /research embed the same short queries
+over and over and even a SQLite round-trip is wasted on those.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_CHUNK = 500
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model: str, max_entries: int):
+        self.model = model
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key       BLOB PRIMARY KEY,
+                vector    BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Upper bound on the row count (replaced keys are counted twice) so
+        # the real COUNT(*) only runs when eviction might be needed
+        self._approx_count = len(self)
+        logger.info("Embedding cache opened | path=%s entries=%d", path, self._approx_count)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: list[str]) -> list[Optional[list[float]]]:
+        """Return the cached vector for each text, or None where it is missing."""
+        keys = [self.key(t) for t in texts]
+        found: dict[bytes, list[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                chunk = keys[i : i + _CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+        return [found.get(k) for k in keys]
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        now = time.time()
+        rows = [(self.key(t), array("f", v).tobytes(), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._approx_count += len(rows)
+            if self._approx_count > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._approx_count = total
+        if total <= self.max_entries:
+            return
+        # Trim to 90% so eviction doesn't run on every insert once full
+        excess = total - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+        self._approx_count = total - excess
+        logger.info("Embedding cache evicted %d least recently used entries", excess)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryVectorCache:
+    """Thread-safe LRU of (model, text) -> vector whose entries expire after `ttl_seconds` (0 = never)."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Least recently used first; values are (stored_at, vector)
+        self._entries: OrderedDict[tuple[str, str], tuple[float, list[float]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        key = (model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model: str, text: str, vector: list[float]):
+        with self._lock:
+            self._entries[(model, text)] = (time.monotonic(), vector)
+            self._entries.move_to_end((model, text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,91 @@
+"""
+Micro-batching for query embeddings.
+
+Concurrent /chat and /research requests each need one query vector.
+Instead of one HTTP round-trip per request, embed_query_async parks
+each cache miss on the event loop for up to `query_batch_window_ms` (or
+until `query_batch_max_size` texts are waiting) and embeds the whole
+group with a single model call. Every caller gets back its own vector;
+identical queries are embedded once.
+Each caller waits at most EMBEDDING_TIMEOUT_SECONDS or until its request
+deadline; a caller that gives up leaves the batch running for the rest.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from config import settings
+from services.deadlines import within
+from services.embeddings import cached_query_vector, embed_query, embed_uncached_queries, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCoalescer:
+    """Collects embed requests made on one event loop into batched embed calls."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, window_seconds: float, max_batch: int):
+        self.loop = loop
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks
+        self._running: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> list[float]:
+        text = normalize_query(text)
+        cached = cached_query_vector(text)
+        if cached is not None:
+            return cached
+
+        future = self.loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.window_seconds, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self.loop.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        logger.debug("Embedding query batch | size=%d unique=%d", len(texts), len(set(texts)))
+        try:
+            vectors = await asyncio.wait_for(embed_uncached_queries(texts), settings.embedding_timeout_seconds)
+        except Exception as e:
+            for _, future in batch:
+                # Callers that gave up (e.g. the client disconnected) are already cancelled
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+_coalescer: Optional[QueryCoalescer] = None
+
+
+async def embed_query_async(text: str, deadline: Optional[float] = None) -> list[float]:
+    """
+    embed_query, batched with concurrent calls when QUERY_BATCHING is on and
+    cancelled after EMBEDDING_TIMEOUT_SECONDS or at `deadline`.
+    """
+    global _coalescer
+    loop = asyncio.get_running_loop()
+    if not settings.query_batching:
+        return await within(embed_query(text), settings.embedding_timeout_seconds, deadline)
+    if _coalescer is None or _coalescer.loop is not loop:
+        _coalescer = QueryCoalescer(loop, settings.query_batch_window_ms / 1000, settings.query_batch_max_size)
+    return await within(_coalescer.embed(text), settings.embedding_timeout_seconds, deadline)
@@ -0,0 +1,206 @@
+"""
+Embedding scheduler for bulk ingest.
+
+Keeps several embedding batches in flight at once, retries rate-limited
+and 5xx responses with exponential backoff, and adapts its concurrency
+to the provider: it halves the number of in-flight batches on every 429
+or 5xx and grows back one slot at a time after a run of successes.
+A batch that is still failing transiently once its retries run out goes
+round again, up to MAX_REQUEUES times, before it is reported failed.
+Results come back in submission order so ingest checkpoints stay valid.
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from tenacity import (
+    RetryCallState,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from config import settings
+from services.embeddings import embed_texts
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_ATTEMPTS = 6
+# Extra rounds of MAX_ATTEMPTS for a batch whose last error was still transient
+MAX_REQUEUES = 2
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _status_code(e: BaseException) -> Optional[int]:
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status
+
+
+def _is_rate_limited(e: BaseException) -> bool:
+    return _status_code(e) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _is_retryable(e: BaseException) -> bool:
+    if _is_rate_limited(e):
+        return True
+    status = _status_code(e)
+    if status is not None:
+        return status >= 500
+    # Connection resets and timeouts carry no status code
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _AdaptiveLimit:
+    """A semaphore whose size shrinks on throttling and grows back slowly."""
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = initial
+        self.maximum = maximum
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                logger.info("Embedding concurrency raised to %d", self.limit)
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self._successes = 0
+            if self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                logger.warning("Embedding provider throttled — concurrency lowered to %d", self.limit)
+
+
+class EmbeddingScheduler:
+    def __init__(
+        self,
+        embed_fn: Callable[[list[str]], list[list[float]]] = embed_texts,
+        max_concurrency: int = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        max_requeues: int = MAX_REQUEUES,
+    ):
+        self.embed_fn = embed_fn
+        # A local model already spreads one batch over every core; parallel batches would only contend
+        default_concurrency = 1 if settings.embedding_backend == "local" else settings.embedding_concurrency
+        self.max_concurrency = max_concurrency or default_concurrency
+        self.max_attempts = max_attempts
+        self.max_requeues = max_requeues
+        self._limit = _AdaptiveLimit(self.max_concurrency, self.max_concurrency)
+
+    @property
+    def concurrency(self) -> int:
+        return self._limit.limit
+
+    def map(
+        self,
+        batches: Iterable[T],
+        texts_of: Callable[[T], list[str]],
+    ) -> Iterator[tuple[T, Optional[list[list[float]]], Optional[Exception]]]:
+        """
+        Embed every batch and yield (batch, vectors, error) in input order.
+        `error` is set only once a batch has exhausted its retries and, for
+        transient errors, its requeues.
+        """
+        # (batch, future, rounds already requeued)
+        pending: deque[tuple[T, Future, int]] = deque()
+
+        def submit(batch: T, rounds: int = 0) -> tuple[T, Future, int]:
+            self._limit.acquire()
+            return batch, pool.submit(self._embed, texts_of(batch)), rounds
+
+        def settle_head():
+            """Result of the head batch, or None when it was sent round again."""
+            batch, future, rounds = pending.popleft()
+            try:
+                return batch, future.result(), None
+            except Exception as e:
+                if not _is_retryable(e) or rounds >= self.max_requeues:
+                    return batch, None, e
+                logger.warning("Embedding batch still failing after %d attempts, requeueing (%d/%d): %s",
+                               self.max_attempts, rounds + 1, self.max_requeues, e)
+                # Back at the head, so later batches still come out after it
+                pending.appendleft(submit(batch, rounds + 1))
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as pool:
+            for batch in batches:
+                # Don't let finished results pile up behind a slow head batch
+                while len(pending) >= 2 * self.max_concurrency:
+                    if (result := settle_head()) is not None:
+                        yield result
+                pending.append(submit(batch))
+                while pending and pending[0][1].done():
+                    if (result := settle_head()) is not None:
+                        yield result
+            while pending:
+                if (result := settle_head()) is not None:
+                    yield result
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        try:
+            for attempt in Retrying(
+                retry=retry_if_exception(_is_retryable),
+                wait=self._wait,
+                stop=stop_after_attempt(self.max_attempts),
+                before_sleep=self._before_sleep,
+                reraise=True,
+            ):
+                with attempt:
+                    vectors = self.embed_fn(texts)
+            self._limit.on_success()
+            return vectors
+        finally:
+            self._limit.release()
+
+    @staticmethod
+    def _wait(state: RetryCallState) -> float:
+        backoff = wait_exponential_jitter(initial=1, max=60)(state)
+        retry_after = _retry_after(state.outcome.exception()) if state.outcome else None
+        return max(backoff, retry_after or 0)
+
+    def _before_sleep(self, state: RetryCallState):
+        error = state.outcome.exception()
+        status = _status_code(error)
+        if _is_rate_limited(error) or (status is not None and status >= 500):
+            self._limit.on_throttle()
+        logger.warning(
+            "Embedding batch failed (attempt %d/%d), retrying in %.1fs: %s",
+            state.attempt_number, self.max_attempts, state.next_action.sleep, error,
+        )
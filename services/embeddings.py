@@ -1,16 +1,35 @@
+import asyncio
+import hashlib
 import logging
+import threading
+from typing import Optional
+
 from config import settings
 from langchain_openai import OpenAIEmbeddings
 
-from models.candidate import CandidateProfile
+from models.candidate import CandidateProfile, CandidateRecord
+from services import http_pool
+from services.embedding_cache import EmbeddingCache, QueryVectorCache
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Part of every content hash; bump it when the stored metadata layout changes
+# so the next incremental ingest rewrites every record (vectors come from the cache)
+METADATA_VERSION = 3
 
 _model = None
+_model_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+# Set once opening the on-disk cache has failed, so it isn't retried on every call
+_cache_unavailable = False
+_query_cache = QueryVectorCache(
+    settings.query_cache_max_entries, settings.query_cache_ttl_seconds
+) if settings.query_cache_enabled else None
 
 
-def build_candidate_text(c: CandidateProfile) -> str:
+def build_candidate_text(c: CandidateProfile | CandidateRecord) -> str:
     """
     Combine all candidate fields into one string for embedding.
     """
@@ -43,44 +62,199 @@ def build_candidate_text(c: CandidateProfile) -> str:
     return ". ".join(parts)
 
 
+def candidate_content_hash(c: CandidateProfile | CandidateRecord) -> str:
+    """
+    Fingerprint of every profile field, stored next to the vector so
+    incremental ingest can tell which candidates actually changed.
+    """
+    payload = "\x1f".join(
+        "" if getattr(c, field) is None else str(getattr(c, field))
+        for field in CandidateProfile.model_fields
+    )
+    # The model is part of the hash so switching models re-embeds everything
+    prefix = f"{METADATA_VERSION}\x1e{embedding_model_name()}"
+    return hashlib.sha256(f"{prefix}\x1e{payload}".encode("utf-8")).hexdigest()
+
+
+def embedding_model_name() -> str:
+    """Name of the model `settings.embedding_backend` embeds with, which keys caches and hashes."""
+    if settings.embedding_backend == "local":
+        return settings.local_embedding_model
+    return EMBEDDING_MODEL
+
+
 def get_embedding_model():
-        logger.info("Using OpenRouter embedding model: text-embedding-ada-002")
-        try:
-            return OpenAIEmbeddings(
-                model="text-embedding-ada-002",
-                api_key=settings.openrouter_api_key,
-                base_url="https://openrouter.ai/api/v1",
-            )
-        except Exception as e:
-            logger.error("Failed to initialise OpenRouter embedding client: %s", e)
-            raise
+    if settings.embedding_backend == "local":
+        return _local_embedding_model()
+    if settings.embedding_backend != "openai":
+        raise ValueError(f"Unknown embedding backend {settings.embedding_backend!r} (expected 'openai' or 'local')")
 
+    logger.info("Using OpenRouter embedding model: %s", EMBEDDING_MODEL)
+    try:
+        return OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            api_key=settings.openrouter_api_key,
+            base_url="https://openrouter.ai/api/v1",
+            http_client=http_pool.sync_client(),
+            http_async_client=http_pool.async_client(),
+        )
+    except Exception as e:
+        logger.error("Failed to initialise OpenRouter embedding client: %s", e)
+        raise
 
 
+def _local_embedding_model():
+    """A sentence-transformers model on the CPU, optionally through ONNX Runtime."""
+    # Imported here so the OpenAI backend never loads torch
+    from langchain_huggingface import HuggingFaceEmbeddings
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    global _model
-    if _model is None:
-        _model = get_embedding_model()
+    threads = settings.local_embedding_threads
+    model_kwargs = {"device": "cpu"}
+    if settings.local_embedding_onnx:
+        # Needs `optimum[onnxruntime]`; a quantized export is picked with LOCAL_EMBEDDING_ONNX_FILE
+        onnx_kwargs = {"provider": "CPUExecutionProvider"}
+        if settings.local_embedding_onnx_file:
+            onnx_kwargs["file_name"] = settings.local_embedding_onnx_file
+        if threads:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            onnx_kwargs["session_options"] = options
+        model_kwargs.update(backend="onnx", model_kwargs=onnx_kwargs)
+    elif threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    logger.info(
+        "Using local embedding model: %s | onnx=%s threads=%s batch_size=%d",
+        settings.local_embedding_model, settings.local_embedding_onnx, threads or "auto",
+        settings.local_embedding_batch_size,
+    )
     try:
-        logger.debug("Embedding %d texts", len(texts))
-        vectors = _model.embed_documents(texts)
-        logger.debug("Embedding complete | vectors=%d dims=%d", len(vectors), len(vectors[0]) if vectors else 0)
-        return vectors
+        return HuggingFaceEmbeddings(
+            model_name=settings.local_embedding_model,
+            model_kwargs=model_kwargs,
+            encode_kwargs={"batch_size": settings.local_embedding_batch_size, "normalize_embeddings": True},
+        )
     except Exception as e:
-        logger.error("embed_documents failed: %s", e)
+        logger.error("Failed to load local embedding model %s: %s", settings.local_embedding_model, e)
         raise
 
 
-def embed_query(text: str) -> list[float]:
+def load_model():
+    """Load the embedding model once; concurrent callers wait for the first load."""
     global _model
-    if _model is None:
-        _model = get_embedding_model()
+    with _model_lock:
+        if _model is None:
+            _model = get_embedding_model()
+        return _model
+
+
+def get_embedding_cache():
+    """
+    Open the on-disk embedding cache once, or return None when it is
+    disabled. Concurrent first callers wait for one open.
+    """
+    global _cache, _cache_unavailable
+    if _cache is not None or not settings.embedding_cache_enabled:
+        return _cache
+    with _cache_lock:
+        if _cache is None and not _cache_unavailable:
+            try:
+                _cache = EmbeddingCache(
+                    settings.embedding_cache_path,
+                    model=embedding_model_name(),
+                    max_entries=settings.embedding_cache_max_entries,
+                )
+            except Exception as e:
+                logger.warning("Embedding cache unavailable, embedding without it: %s", e)
+                _cache_unavailable = True
+        return _cache
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    cache = get_embedding_cache()
+    vectors = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if not missing:
+        logger.debug("Embedding cache hit for all %d texts", len(texts))
+        return vectors
+
+    model = load_model()
     try:
-        logger.debug("Embedding query: '%s'", text[:80])
-        vector = _model.embed_query(text)
-        logger.debug("Query embedding complete | dims=%d", len(vector))
-        return vector
+        logger.debug("Embedding %d texts | cached=%d", len(missing), len(texts) - len(missing))
+        fresh = model.embed_documents([texts[i] for i in missing])
+        logger.debug("Embedding complete | vectors=%d dims=%d", len(fresh), len(fresh[0]) if fresh else 0)
     except Exception as e:
-        logger.error("embed_query failed: %s", e)
+        logger.error("embed_documents failed: %s", e)
         raise
+
+    for i, v in zip(missing, fresh):
+        vectors[i] = v
+    if cache is not None:
+        cache.put_many([texts[i] for i in missing], fresh)
+    return vectors
+
+
+def normalize_query(text: str) -> str:
+    """Case and spacing don't change what a search means, so they don't get their own vectors."""
+    return " ".join(text.split()).lower()
+
+
+def query_cache_stats() -> Optional[dict]:
+    """Hit, miss and eviction counters of the in-process query cache, or None when it is off."""
+    return _query_cache.stats() if _query_cache is not None else None
+
+
+async def embed_query(text: str) -> list[float]:
+    text = normalize_query(text)
+    cached = cached_query_vector(text)
+    if cached is not None:
+        return cached
+    return (await embed_uncached_queries([text]))[0]
+
+
+def cached_query_vector(text: str) -> Optional[list[float]]:
+    """The in-process cached vector for an already normalized query, or None."""
+    if _query_cache is None:
+        return None
+    cached = _query_cache.get(embedding_model_name(), text)
+    if cached is not None:
+        logger.debug("Query cache hit: '%s'", text[:80])
+    return cached
+
+
+async def embed_uncached_queries(texts: list[str]) -> list[list[float]]:
+    """
+    Embed normalized queries that missed the in-process cache, with one
+    model call for all of those the on-disk cache doesn't hold either.
+    """
+    model_name = embedding_model_name()
+    unique = list(dict.fromkeys(texts))
+    loop = asyncio.get_running_loop()
+    cache = get_embedding_cache() if settings.query_cache_persist else None
+    # The SQLite cache lock is shared with ingest threads, so wait for it off the event loop
+    found = dict(zip(unique, await loop.run_in_executor(None, cache.get_many, unique))) if cache is not None else {}
+    missing = [t for t in unique if found.get(t) is None]
+
+    if missing:
+        model = load_model()
+        try:
+            logger.debug("Embedding %d queries | first='%s'", len(missing), missing[0][:80])
+            # A single query keeps the provider's query endpoint; a batch goes as documents
+            if len(missing) == 1:
+                fresh = [await model.aembed_query(missing[0])]
+            else:
+                fresh = await model.aembed_documents(missing)
+            logger.debug("Query embedding complete | vectors=%d dims=%d", len(fresh), len(fresh[0]))
+        except Exception as e:
+            logger.error("embed_query failed: %s", e)
+            raise
+        if cache is not None:
+            await loop.run_in_executor(None, cache.put_many, missing, fresh)
+        found.update(zip(missing, fresh))
+
+    if _query_cache is not None:
+        for text in unique:
+            _query_cache.put(model_name, text, found[text])
+    return [found[t] for t in texts]
@@ -0,0 +1,49 @@
+"""
+Shared HTTP connection pools for OpenRouter.
+
+The LLM client and the embedding model send their requests through the
+same pools, so keep-alive connections (and their TLS sessions) are
+reused across requests instead of every client holding its own. Async
+callers share one httpx.AsyncClient; ingest threads share one
+httpx.Client with the same limits. Timeouts are set per request by the
+OpenAI clients on top of them.
+"""
+
+from typing import Optional
+
+import httpx
+
+from config import settings
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_seconds,
+    )
+
+
+def async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(limits=_limits())
+    return _async_client
+
+
+def sync_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(limits=_limits())
+    return _sync_client
+
+
+async def aclose():
+    """Close both pools; called once at shutdown."""
+    if _async_client is not None:
+        await _async_client.aclose()
+    if _sync_client is not None:
+        _sync_client.close()
@@ -0,0 +1,180 @@
+"""
+Offline recall / latency benchmark for vector index parameters.
+
+Builds a throwaway index for every parameter set, then scores it against
+exact brute-force neighbours on held-out queries:
+
+    python -m services.index_benchmark --synthetic 20000 \
+        --hnsw 16:100:10 --hnsw 16:100:100 --hnsw 32:200:200 --numpy exact --numpy int8
+
+    python -m services.index_benchmark --stored --queries 500 --k 10
+
+`--stored` reads the vectors of the active collection through the configured
+backend (needs the usual .env); `--synthetic N` generates clustered vectors
+and needs nothing but numpy and chromadb. HNSW sets are M:ef_construction:ef_search.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+BATCH = 1000
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    build_seconds: float
+    index_mb: float
+    rss_mb: Optional[float]
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.7 * rng.standard_normal((n, dim))
+    return _normalize(vectors.astype(np.float32))
+
+
+def stored_vectors() -> np.ndarray:
+    from database import vectorstore
+
+    pages = [np.asarray(vectors, dtype=np.float32) for _, vectors in vectorstore.vector_pages()]
+    if not pages:
+        raise SystemExit("The active collection is empty — run an ingest first or use --synthetic")
+    return _normalize(np.concatenate(pages))
+
+
+def exact_neighbours(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ base.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def run(
+    name: str,
+    make_store: Callable[[str], object],
+    base: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+) -> BenchmarkResult:
+    workdir = tempfile.mkdtemp(prefix="index-bench-")
+    try:
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        store = make_store(workdir)
+        ids = [str(i) for i in range(len(base))]
+        for start in range(0, len(base), BATCH):
+            chunk = slice(start, start + BATCH)
+            store.upsert(ids[chunk], base[chunk], [{"row": i} for i in range(start, min(start + BATCH, len(base)))], None)
+        store.flush(force=True)
+        build_seconds = time.perf_counter() - started
+        rss_after = _rss_mb()
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = store.query(query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len({int(cid) for cid, _, _ in found} & set(expected.tolist()))
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return BenchmarkResult(
+            name=name,
+            build_seconds=build_seconds,
+            index_mb=_dir_mb(workdir),
+            rss_mb=None if rss_before is None else rss_after - rss_before,
+            recall=hits / (len(queries) * k),
+            p50_ms=p50,
+            p95_ms=p95,
+            p99_ms=p99,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def hnsw_store(m: int, ef_construction: int, ef_search: int) -> Callable[[str], object]:
+    def make(path: str):
+        from database.backends.chroma_backend import ChromaStore
+        return ChromaStore(path, keep_versions=0, m=m, ef_construction=ef_construction, ef_search=ef_search)
+    return make
+
+
+def numpy_store(quantization: str) -> Callable[[str], object]:
+    def make(path: str):
+        from database.backends.numpy_backend import NumpyStore
+        return NumpyStore(path, keep_versions=0, flush_seconds=0, quantization=quantization)
+    return make
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--stored", action="store_true", help="benchmark on the indexed candidate vectors")
+    source.add_argument("--synthetic", type=int, metavar="N", help="benchmark on N synthetic vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="held-out query sample size")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw", action="append", default=[], metavar="M:EFC:EFS")
+    parser.add_argument("--numpy", action="append", default=[], choices=["exact", "int8"])
+    args = parser.parse_args(argv)
+
+    vectors = stored_vectors() if args.stored else synthetic_vectors(args.synthetic, args.dim)
+    if args.queries >= len(vectors):
+        raise SystemExit(f"Need more than {args.queries} vectors, have {len(vectors)}")
+
+    # Hold the queries out of the index so no query finds itself
+    order = np.random.default_rng(1).permutation(len(vectors))
+    queries, base = vectors[order[: args.queries]], vectors[order[args.queries :]]
+    truth = exact_neighbours(base, queries, args.k)
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {len(queries)} queries, k={args.k}\n")
+
+    configs = [(f"hnsw M={m} efC={efc} efS={efs}", hnsw_store(int(m), int(efc), int(efs)))
+               for m, efc, efs in (spec.split(":") for spec in args.hnsw)]
+    configs += [(f"numpy {mode}", numpy_store("none" if mode == "exact" else mode)) for mode in args.numpy]
+    if not configs:
+        configs = [("hnsw M=16 efC=100 efS=100", hnsw_store(16, 100, 100)), ("numpy exact", numpy_store("none"))]
+
+    header = f"{'index':<28}{'recall@' + str(args.k):>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'build s':>9}{'disk MB':>9}{'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, make_store in configs:
+        r = run(name, make_store, base, queries, truth, args.k)
+        rss = "n/a" if r.rss_mb is None else f"{r.rss_mb:.0f}"
+        print(f"{r.name:<28}{r.recall:>10.4f}{r.p50_ms:>9.2f}{r.p95_ms:>9.2f}{r.p99_ms:>9.2f}"
+              f"{r.build_seconds:>9.1f}{r.index_mb:>9.1f}{rss:>8}")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _dir_mb(path: str) -> float:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file()) / 2**20
+
+
+def _rss_mb() -> Optional[float]:
+    """Resident set size from /proc (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
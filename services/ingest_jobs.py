@@ -0,0 +1,417 @@
+"""
+Background ingest jobs.
+
+Each POST /ingest starts a job on its own thread and returns straight
+away. Job state is written to a small JSON file after every committed
+batch, so a crashed or cancelled run can be resumed from its last
+checkpoint instead of re-reading the whole table.
+
+A forced reingest builds a shadow collection and only swaps it in once
+the build has finished and passed validation, so search keeps serving
+the previous index for the whole run.
+
+Only one process may write the index, so a job holds an advisory file
+lock in JOBS_DIR while it runs. With several uvicorn workers, a worker
+that did not start a job reads its state from the job file, and cancels
+it by leaving a marker file that the owning worker picks up.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Optional
+
+from config import settings
+from database.postgres import count_candidates, partition_candidates
+from database import profile_table, vectorstore
+from database.vectorstore import get_content_hashes
+from services.ingest_pipeline import IngestStats, run_ingest
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = Path(settings.ingest_jobs_dir)
+
+WRITER_LOCK = JOBS_DIR / "writer.lock"
+# How often a running job looks for a cancel request from another worker
+CANCEL_POLL_SECONDS = 1.0
+
+ACTIVE = {"queued", "running"}
+# A partial job's checkpoints stop before its failed rows, so resuming retries them
+RESUMABLE = {"cancelled", "interrupted", "failed", "partial"}
+
+
+_RUNTIME_FIELDS = {"run_started_at", "run_start_rows", "cancel"}
+
+
+class JobConflict(Exception):
+    """Raised when a job cannot be started or resumed in its current state."""
+
+
+@dataclass
+class IngestJob:
+    id: str
+    force_reingest: bool
+    incremental: bool
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expected_total: Optional[int] = None
+    # Keyset ranges [after_id, until_id] read in parallel, and the last
+    # committed id in each of them
+    partitions: list[list[Optional[str]]] = field(default_factory=list)
+    checkpoints: list[Optional[str]] = field(default_factory=list)
+    checkpoint_stats: IngestStats = field(default_factory=IngestStats)
+    stats: IngestStats = field(default_factory=IngestStats)
+    target_collection: Optional[str] = None
+    error: Optional[str] = None
+
+    # Runtime-only state, not persisted
+    run_started_at: float = field(default=0.0, repr=False)
+    run_start_rows: int = field(default=0, repr=False)
+    cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.status != "running" or not self.run_started_at:
+            return None
+        elapsed = time.time() - self.run_started_at
+        if elapsed <= 0:
+            return None
+        return round((self.stats.fetched - self.run_start_rows) / elapsed, 1)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.rows_per_second
+        if not rate or self.expected_total is None:
+            return None
+        return round(max(self.expected_total - self.stats.fetched, 0) / rate, 1)
+
+    def to_dict(self) -> dict:
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name not in _RUNTIME_FIELDS}
+        data["stats"] = asdict(self.stats)
+        data["checkpoint_stats"] = asdict(self.checkpoint_stats)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IngestJob":
+        data = dict(data)
+        data["stats"] = IngestStats(**data.get("stats", {}))
+        data["checkpoint_stats"] = IngestStats(**data.get("checkpoint_stats", {}))
+        return cls(**data)
+
+
+class _WriterLock:
+    """Non-blocking flock on WRITER_LOCK; held by at most one process at a time."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+_jobs: dict[str, IngestJob] = {}
+# Jobs launched by this process; any other job is owned by another worker
+_local: set[str] = set()
+_lock = threading.Lock()
+_writer = _WriterLock(WRITER_LOCK)
+
+
+def start_job(force_reingest: bool, incremental: bool) -> IngestJob:
+    with _lock:
+        _ensure_idle()
+        _claim_writer()
+        job = IngestJob(id=str(uuid.uuid4()), force_reingest=force_reingest, incremental=incremental)
+        _jobs[job.id] = job
+        _save(job)
+        _launch(job, resume=False)
+    logger.info("Ingest job queued | job_id=%s force_reingest=%s incremental=%s",
+                job.id, force_reingest, incremental)
+    return job
+
+
+def resume_job(job_id: str) -> Optional[IngestJob]:
+    with _lock:
+        job = _lookup(job_id)
+        if job is None:
+            return None
+        if job.status not in RESUMABLE:
+            raise JobConflict(f"Job {job_id} is {job.status} and cannot be resumed")
+        _ensure_idle()
+        _claim_writer()
+        job.status = "queued"
+        job.error = None
+        job.finished_at = None
+        job.cancel = threading.Event()
+        _save(job)
+        _launch(job, resume=True)
+    logger.info("Ingest job resuming | job_id=%s checkpoints=%s", job.id, job.checkpoints)
+    return job
+
+
+def cancel_job(job_id: str) -> Optional[IngestJob]:
+    with _lock:
+        job = _lookup(job_id)
+    if job is None:
+        return None
+    if job.status not in ACTIVE:
+        raise JobConflict(f"Job {job_id} is already {job.status}")
+    logger.info("Cancelling ingest job | job_id=%s", job_id)
+    if job_id in _local:
+        job.cancel.set()
+    else:
+        # The worker running it polls for this marker
+        _cancel_marker(job_id).touch()
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _lock:
+        return _lookup(job_id)
+
+
+@contextmanager
+def index_writer():
+    """
+    Hold the writer lock for a direct index change (e.g. rollback). Raises
+    JobConflict while an ingest job is running in any worker.
+    """
+    with _lock:
+        _ensure_idle()
+        _claim_writer()
+    try:
+        # Start from whatever the last writer left behind
+        vectorstore.refresh(force=True)
+        yield
+    finally:
+        with _lock:
+            _writer.release()
+
+
+def recover_jobs():
+    """
+    Load persisted jobs on startup. Anything that was still running when
+    the process died is marked interrupted so it can be resumed; jobs
+    another live worker is running (it holds the writer lock) are left alone.
+    """
+    if not JOBS_DIR.exists():
+        return
+    with _lock:
+        idle = _writer.acquire()
+        try:
+            for path in JOBS_DIR.glob("*.json"):
+                try:
+                    job = IngestJob.from_dict(json.loads(path.read_text()))
+                except Exception as e:
+                    logger.warning("Skipping unreadable ingest job file %s: %s", path.name, e)
+                    continue
+                if job.status in ACTIVE and idle:
+                    job.status = "interrupted"
+                    _save(job)
+                    logger.warning("Ingest job %s was interrupted at checkpoints %s", job.id, job.checkpoints)
+                _jobs[job.id] = job
+        finally:
+            if idle:
+                _writer.release()
+    logger.info("Recovered %d ingest jobs", len(_jobs))
+
+
+def shutdown_jobs(timeout: float = 10.0):
+    """Ask running jobs to stop at the next batch and wait for their checkpoints."""
+    for job in [_jobs[job_id] for job_id in list(_local)]:
+        if job.status in ACTIVE:
+            job.cancel.set()
+    for thread in threading.enumerate():
+        if thread.name.startswith("ingest-job-"):
+            thread.join(timeout)
+
+
+def _ensure_idle():
+    running = [job_id for job_id in _local if _jobs[job_id].status in ACTIVE]
+    if running:
+        raise JobConflict(f"Ingest job {running[0]} is already running")
+
+
+def _claim_writer():
+    if not _writer.acquire():
+        raise JobConflict("An ingest job is already running in another worker")
+
+
+def _lookup(job_id: str) -> Optional[IngestJob]:
+    """This process's job, or a fresh read of the job file if another worker owns it."""
+    if job_id in _local:
+        return _jobs[job_id]
+    path = JOBS_DIR / f"{job_id}.json"
+    try:
+        job = IngestJob.from_dict(json.loads(path.read_text()))
+    except FileNotFoundError:
+        return _jobs.get(job_id)
+    _jobs[job_id] = job
+    return job
+
+
+def _cancel_marker(job_id: str) -> Path:
+    return JOBS_DIR / f"{job_id}.cancel"
+
+
+def _launch(job: IngestJob, resume: bool):
+    _local.add(job.id)
+    _cancel_marker(job.id).unlink(missing_ok=True)
+    threading.Thread(
+        target=_run, args=(job, resume), name=f"ingest-job-{job.id[:8]}", daemon=True
+    ).start()
+
+
+def _watch_cancel(job: IngestJob, finished: threading.Event):
+    """Relay a cancel request another worker left on disk to the job's event."""
+    marker = _cancel_marker(job.id)
+    while not finished.wait(CANCEL_POLL_SECONDS):
+        if marker.exists():
+            logger.info("Cancel requested by another worker | job_id=%s", job.id)
+            job.cancel.set()
+            return
+
+
+def _run(job: IngestJob, resume: bool):
+    job.status = "running"
+    job.started_at = job.started_at or time.time()
+
+    if resume:
+        job.stats = IngestStats(**asdict(job.checkpoint_stats))
+    job.run_started_at = time.time()
+    job.run_start_rows = job.stats.fetched
+
+    def on_checkpoint(partition: int, last_id: str, snapshot: IngestStats):
+        job.checkpoints[partition] = last_id
+        job.checkpoint_stats = snapshot
+        _save(job)
+
+    finished = threading.Event()
+    threading.Thread(
+        target=_watch_cancel, args=(job, finished), name=f"ingest-cancel-{job.id[:8]}", daemon=True
+    ).start()
+    try:
+        # Write on top of the latest index, whichever worker flushed it
+        vectorstore.refresh(force=True)
+        if settings.use_profile_table:
+            profile_table.refresh_profiles()
+
+        try:
+            job.expected_total = count_candidates()
+        except Exception as e:
+            logger.warning("Could not count candidates for ETA: %s", e)
+
+        if job.force_reingest and job.target_collection is None:
+            job.target_collection = vectorstore.begin_rebuild()
+            _save(job)
+            logger.info("Rebuilding into shadow collection %s | job_id=%s", job.target_collection, job.id)
+
+        if not resume or not job.partitions:
+            job.partitions = [list(p) for p in partition_candidates(settings.ingest_fetch_workers)]
+            job.checkpoints = [None] * len(job.partitions)
+            _save(job)
+
+        existing = None
+        if job.incremental and not job.force_reingest:
+            existing = get_content_hashes()
+            logger.info("Vector store holds %d candidates | job_id=%s", len(existing), job.id)
+
+        run_ingest(
+            existing,
+            stats=job.stats,
+            partitions=[
+                (checkpoint or after_id, until_id)
+                for (after_id, until_id), checkpoint in zip(job.partitions, job.checkpoints)
+            ],
+            cancel=job.cancel,
+            on_checkpoint=on_checkpoint,
+            collection=job.target_collection,
+        )
+        if job.target_collection and not job.cancel.is_set():
+            _swap_in(job)
+    except Exception as e:
+        logger.error("Ingest job %s failed: %s", job.id, e)
+        job.status = "failed"
+        job.error = str(e)
+    else:
+        if job.cancel.is_set():
+            job.status = "cancelled"
+        elif not job.stats.fetched:
+            job.status = "failed"
+            job.error = "No candidates found in database"
+        else:
+            job.status = "done" if job.stats.failed == 0 else "partial"
+    finally:
+        job.finished_at = time.time()
+        _save(job)
+        finished.set()
+        _cancel_marker(job.id).unlink(missing_ok=True)
+        with _lock:
+            _local.discard(job.id)
+            _writer.release()
+
+    logger.info(
+        "Ingest job %s %s | fetched=%d upserted=%d failed=%d added=%d updated=%d unchanged=%d deleted=%d",
+        job.id, job.status, job.stats.fetched, job.stats.upserted, job.stats.failed,
+        job.stats.added, job.stats.updated, job.stats.unchanged, job.stats.deleted,
+    )
+
+
+def _swap_in(job: IngestJob):
+    """
+    Activate a finished shadow build. A build with failed rows is kept, with
+    its checkpoints, so resuming the job retries them; a build that fails
+    validation is discarded.
+    """
+    if job.stats.failed:
+        raise ValueError(
+            f"{job.stats.failed} candidates failed to index into {job.target_collection}; "
+            "resume the job to retry them"
+        )
+    try:
+        vectorstore.activate(job.target_collection, expected_count=job.stats.upserted)
+    except Exception:
+        logger.error("Shadow collection %s failed validation, keeping the live index", job.target_collection)
+        try:
+            vectorstore.drop_collection(job.target_collection)
+        except Exception as e:
+            logger.error("Could not drop shadow collection %s: %s", job.target_collection, e)
+        job.target_collection = None
+        job.partitions = []
+        job.checkpoints = []
+        job.checkpoint_stats = IngestStats()
+        raise
+
+
+def _save(job: IngestJob):
+    """Write the job file atomically so a crash never leaves it half written."""
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    path = JOBS_DIR / f"{job.id}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(job.to_dict()))
+    os.replace(tmp, path)
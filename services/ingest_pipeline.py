@@ -0,0 +1,292 @@
+"""
+Streaming ingest pipeline.
+
+Postgres rows flow through three stages connected by bounded queues:
+
+    fetch (server-side cursor) → embed → upsert
+
+Each stage runs on its own thread, so embedding batch N+1 overlaps the
+vector store upsert of batch N, and the bounded queues keep memory flat
+no matter how many candidates are in the table. Batches are sized by
+token count and the embed stage keeps several of them in flight through
+the EmbeddingScheduler.
+
+Each keyset partition is read in id order and its batches are committed
+in the same order, so the last id of every committed batch is a safe
+resume point for that partition. Once a batch fails to embed or upsert,
+its partition's checkpoint stops advancing: a resumed job re-reads the
+partition from the last id before the failure, so failed rows are
+retried instead of skipped.
+"""
+
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional
+
+from database.postgres import iter_candidates, fetch_candidate_ids
+from database.vectorstore import upsert_candidates, delete_candidates, flush
+from models.candidate import CandidateRecord
+from config import settings
+from services.embedding_scheduler import EmbeddingScheduler, estimate_tokens
+from services.embeddings import build_candidate_text, candidate_content_hash
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH = 500
+QUEUE_DEPTH = 4
+
+_DONE = object()
+
+
+@dataclass
+class IngestStats:
+    fetched: int = 0
+    embedded: int = 0
+    upserted: int = 0
+    failed: int = 0
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+
+_FETCH_FIELDS = ("fetched", "added", "updated", "unchanged")
+
+
+@dataclass
+class _Batch:
+    partition: int
+    items: list[tuple[CandidateRecord, str]]
+    texts: list[str]
+    last_id: str
+    # This partition's fetch counters at the moment the batch was cut
+    progress: IngestStats
+    vectors: list[list[float]] = field(default_factory=list)
+    # Set when embedding gave up on the batch
+    error: Optional[Exception] = None
+
+
+def run_ingest(
+    existing: dict[str, str] = None,
+    stats: IngestStats = None,
+    partitions: list[tuple[Optional[str], Optional[str]]] = None,
+    cancel: threading.Event = None,
+    on_checkpoint: Optional[Callable[[int, str, IngestStats], None]] = None,
+    collection: str = None,
+    scheduler: EmbeddingScheduler = None,
+    batch_tokens: int = None,
+    queue_depth: int = QUEUE_DEPTH,
+) -> IngestStats:
+    """
+    Run a pass over Postgres and return the counts.
+
+    `existing` maps already-indexed ids to their content hash. When it is
+    given, unchanged candidates are skipped and ids no longer present in
+    Postgres are deleted from the index. Pass None to re-embed everything.
+
+    `partitions` is a list of (after_id, until_id) keyset ranges. Each range
+    is read concurrently on its own pooled connection and batches enter the
+    pipeline in whatever order they arrive; the default is one range over
+    the whole table.
+
+    `stats` is updated in place so callers can watch progress, setting
+    `cancel` stops the run, and `on_checkpoint(partition, last_id, snapshot)`
+    is called once committed batches are durable in the vector store.
+    `collection` names a shadow collection to build instead of the live one.
+    """
+    stats = stats or IngestStats()
+    partitions = partitions or [(None, None)]
+    scheduler = scheduler or EmbeddingScheduler()
+    batch_tokens = batch_tokens or settings.embedding_batch_tokens
+    max_items = settings.embedding_batch_max_items
+    cancel = cancel or threading.Event()
+    stop = threading.Event()
+    embed_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    upsert_q: queue.Queue = queue.Queue(maxsize=queue_depth)
+    errors: list[Exception] = []
+    # Guards every write to `stats`; the fetch, embed and upsert threads all update it
+    stats_lock = threading.Lock()
+    fetchers_left = [len(partitions)]
+
+    def fetch_stage(index: int, after_id: Optional[str], until_id: Optional[str]):
+        progress = IngestStats()
+        pending, texts, tokens = [], [], 0
+        stream = iter_candidates(FETCH_BATCH, after_id, until_id)
+        try:
+            for rows in stream:
+                before = replace(progress)
+                for c in rows:
+                    progress.fetched += 1
+                    content_hash = candidate_content_hash(c)
+                    if existing is not None:
+                        previous = existing.get(c.id)
+                        if previous == content_hash:
+                            progress.unchanged += 1
+                            continue
+                        if previous is None:
+                            progress.added += 1
+                        else:
+                            progress.updated += 1
+                    else:
+                        progress.added += 1
+                    text = build_candidate_text(c)
+                    pending.append((c, content_hash))
+                    texts.append(text)
+                    tokens += estimate_tokens(text)
+                    if tokens >= batch_tokens or len(pending) >= max_items:
+                        if not _put(embed_q, _Batch(index, pending, texts, c.id, replace(progress)), stop):
+                            return
+                        pending, texts, tokens = [], [], 0
+                with stats_lock:
+                    _accumulate(stats, progress, before)
+                if stop.is_set() or cancel.is_set():
+                    return
+            if pending:
+                _put(embed_q, _Batch(index, pending, texts, pending[-1][0].id, replace(progress)), stop)
+        except Exception as e:
+            logger.error("Fetch stage failed for partition %d: %s", index, e)
+            errors.append(e)
+            stop.set()
+        finally:
+            # Hand the pooled connection back straight away on early exit
+            stream.close()
+            with stats_lock:
+                fetchers_left[0] -= 1
+                last = fetchers_left[0] == 0
+            if last:
+                _put(embed_q, _DONE, stop)
+
+    def embed_stage():
+        try:
+            for batch, vectors, error in scheduler.map(_drain(embed_q, stop), lambda b: b.texts):
+                if error is not None:
+                    logger.error("Giving up on batch of %d candidates after retries: %s", len(batch.items), error)
+                    batch.error = error
+                else:
+                    batch.vectors = vectors
+                    with stats_lock:
+                        stats.embedded += len(batch.items)
+                # Failed batches go on too, so the upsert loop holds their partition's checkpoint in order
+                if not _put(upsert_q, batch, stop):
+                    return
+        finally:
+            _put(upsert_q, _DONE, stop)
+
+    # Counters restored from a checkpoint; per-partition progress is added on top
+    base = replace(stats)
+    committed: dict[int, IngestStats] = {}
+    committed_upserts: dict[int, int] = {}
+    # Checkpoints wait here until the vector store reports the batch durable
+    unsaved: dict[int, str] = {}
+    # Partitions with a failed batch; their checkpoint stays before the first failure
+    held: set[int] = set()
+
+    def save_checkpoints(force: bool = False):
+        if not flush(force) or not on_checkpoint or not unsaved:
+            return
+        # Only rows behind the checkpoints count: a resume redoes everything past them
+        upserted = base.upserted + sum(committed_upserts.values())
+        snapshot = replace(base, embedded=upserted, upserted=upserted)
+        for progress in committed.values():
+            _accumulate(snapshot, progress)
+        for partition, last_id in unsaved.items():
+            on_checkpoint(partition, last_id, snapshot)
+        unsaved.clear()
+
+    threads = [
+        threading.Thread(target=fetch_stage, args=(i, lo, hi), name=f"ingest-fetch-{i}", daemon=True)
+        for i, (lo, hi) in enumerate(partitions)
+    ]
+    threads.append(threading.Thread(target=embed_stage, name="ingest-embed", daemon=True))
+    for t in threads:
+        t.start()
+
+    try:
+        for batch in _drain(upsert_q, stop):
+            if cancel.is_set():
+                break
+            if batch.error is None:
+                try:
+                    upsert_candidates(
+                        [c for c, _ in batch.items],
+                        batch.vectors,
+                        [h for _, h in batch.items],
+                        collection=collection,
+                    )
+                    with stats_lock:
+                        stats.upserted += len(batch.items)
+                    logger.info("Ingested %d candidates so far | fetched=%d", stats.upserted, stats.fetched)
+                except Exception as e:
+                    batch.error = e
+                    logger.error("Failed to upsert batch of %d candidates: %s", len(batch.items), e)
+
+            if batch.error is not None:
+                with stats_lock:
+                    stats.failed += len(batch.items)
+                if batch.partition not in held:
+                    held.add(batch.partition)
+                    logger.warning("Holding the checkpoint of partition %d before id %s so resume retries it",
+                                   batch.partition, batch.items[0][0].id)
+            elif batch.partition not in held:
+                committed[batch.partition] = batch.progress
+                committed_upserts[batch.partition] = committed_upserts.get(batch.partition, 0) + len(batch.items)
+                unsaved[batch.partition] = batch.last_id
+            save_checkpoints()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        save_checkpoints(force=True)
+
+    if errors:
+        raise errors[0]
+    if cancel.is_set():
+        logger.info("Ingest cancelled | upserted=%d", stats.upserted)
+        return stats
+
+    if existing is not None and stats.fetched:
+        removed = list(existing.keys() - fetch_candidate_ids())
+        try:
+            delete_candidates(removed)
+            flush(force=True)
+            stats.deleted = len(removed)
+        except Exception as e:
+            # Every stage thread has been joined by now, so no lock is needed
+            stats.failed += len(removed)
+            logger.error("Failed to delete %d removed candidates: %s", len(removed), e)
+
+    return stats
+
+
+def _accumulate(total: IngestStats, progress: IngestStats, before: IngestStats = None):
+    """Add a partition's fetch counters (or their growth since `before`) to `total`."""
+    for name in _FETCH_FIELDS:
+        delta = getattr(progress, name) - (getattr(before, name) if before else 0)
+        setattr(total, name, getattr(total, name) + delta)
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Block until there is room in the queue, giving up if the pipeline stopped."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q: queue.Queue, stop: threading.Event):
+    """Yield queued items until the upstream stage finishes or the pipeline stops."""
+    while True:
+        try:
+            item = q.get(timeout=0.5)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        yield item
@@ -1,17 +1,24 @@
+import asyncio
 import json
 import logging
-from typing import List
+import re
+from typing import AsyncIterator, List, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from config import settings
+from services import http_pool
+from services.deadlines import call_timeout, within
 
 logger = logging.getLogger(__name__)
 
 try:
-    client = OpenAI(
+    client = AsyncOpenAI(
         api_key=settings.openrouter_api_key,
         base_url="https://openrouter.ai/api/v1",
         default_headers={"X-Title": "InfoQuest Assessment"},
+        http_client=http_pool.async_client(),
+        timeout=settings.llm_timeout_seconds,
+        max_retries=settings.llm_max_retries,
     )
     logger.info("OpenRouter LLM client initialised | model=%s", settings.llm_model)
 except Exception as e:
@@ -19,7 +26,35 @@ except Exception as e:
     raise
 
 
-def rewrite_query(query: str, conversation_history: list[dict] = None) -> str:
+async def _complete(deadline: Optional[float], **request) -> str:
+    """
+    Text of one chat completion. The call is cancelled, closing its HTTP
+    request, after LLM_TIMEOUT_SECONDS or at `deadline`, whichever is first.
+    """
+    response = await within(client.chat.completions.create(**request), settings.llm_timeout_seconds, deadline)
+    return response.choices[0].message.content.strip()
+
+
+async def _stream(deadline: Optional[float], **request) -> AsyncIterator[str]:
+    """_complete, yielding text deltas as they arrive; the whole stream shares one timeout."""
+    loop = asyncio.get_running_loop()
+    timeout = call_timeout(settings.llm_timeout_seconds, deadline)
+    ends = loop.time() + timeout
+    stream = await within(client.chat.completions.create(**request, stream=True), timeout, None)
+    try:
+        while True:
+            try:
+                chunk = await within(stream.__anext__(), ends - loop.time(), None)
+            except StopAsyncIteration:
+                return
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    finally:
+        await stream.close()
+
+
+async def rewrite_query(query: str, conversation_history: list[dict] = None, deadline: Optional[float] = None) -> str:
     """
     Expand the user's query with synonyms and domain terms so it
     retrieves more relevant candidates from the vector DB.
@@ -40,7 +75,8 @@ def rewrite_query(query: str, conversation_history: list[dict] = None) -> str:
     logger.debug("Rewriting query: '%s'", query)
 
     try:
-        response = client.chat.completions.create(
+        rewritten = await _complete(
+            deadline,
             model=settings.llm_model,
             messages=[{"role": "user", "content": f"""Rewrite this candidate search query to improve vector search retrieval.
 Add skill synonyms, industry terms, and the location of the candidates, language also you can lookup from the conv history if relevant.
@@ -53,7 +89,6 @@ Rewritten:"""}],
             max_tokens=150,
             temperature=0.2,
         )
-        rewritten = response.choices[0].message.content.strip()
         logger.debug("Query rewritten | original='%s' → rewritten='%s'", query, rewritten)
         return rewritten
     except Exception as e:
@@ -61,7 +96,7 @@ Rewritten:"""}],
         raise
 
 
-def explain_match(query: str, candidate: dict) -> dict:
+async def explain_match(query: str, candidate: dict, deadline: Optional[float] = None) -> dict:
     """
     Given a query and candidate metadata, return a one-sentence explanation
     and 2-3 highlights of why this person matches.
@@ -70,7 +105,8 @@ def explain_match(query: str, candidate: dict) -> dict:
     logger.debug("Generating explanation for candidate %s", candidate_id)
 
     try:
-        response = client.chat.completions.create(
+        raw = await _complete(
+            deadline,
             model=settings.llm_model,
             messages=[{"role": "user", "content": f"""You are writing search results for an expert network.
 
@@ -93,8 +129,6 @@ Return JSON only:
             temperature=0.3,
         )
 
-        raw = response.choices[0].message.content.strip()
-
         if "```" in raw:
             raw = raw.split("```")[1].lstrip("json").strip()
 
@@ -110,18 +144,133 @@ Return JSON only:
         return _fallback_explanation(candidate)
 
 
-def summarise(query: str, candidates: list[dict]) -> str:
-    logger.debug("Generating summary for %d candidates", len(candidates))
-    names = ", ".join(c.get("name", "") for c in candidates[:5])
+async def explain_matches(query: str, candidates: list[dict], deadline: Optional[float] = None) -> list[dict]:
+    """
+    explain_match for every candidate in one LLM call. Entries the model
+    leaves out or gets wrong fall back to _fallback_explanation one by one.
+    """
+    if not candidates:
+        return []
+    logger.debug("Generating explanations for %d candidates in one call", len(candidates))
 
     try:
-        response = client.chat.completions.create(
-            model=settings.llm_model,
-            messages=[{"role": "user", "content": f'Search: "{query}". Top results: {names}. Write 2 sentences summarising why these candidates are relevant. Plain text only.'}],
-            max_tokens=100,
-            temperature=0.4,
-        )
-        summary = response.choices[0].message.content.strip()
+        raw = await _complete(deadline, **_explanations_request(query, candidates))
+    except Exception as e:
+        logger.error("explain_matches LLM call failed for %d candidates: %s", len(candidates), e)
+        return [_fallback_explanation(c) for c in candidates]
+
+    parsed = _parse_explanations(raw, len(candidates))
+    missing = [c.get("id", "unknown") for i, c in enumerate(candidates, start=1) if i not in parsed]
+    if missing:
+        logger.warning("explain_matches returned no usable explanation for candidates %s", missing)
+    return [parsed.get(i) or _fallback_explanation(c) for i, c in enumerate(candidates, start=1)]
+
+
+async def stream_explanations(
+    query: str, candidates: list[dict], deadline: Optional[float] = None
+) -> AsyncIterator[tuple[int, dict]]:
+    """
+    explain_matches, streamed: yields (position, explanation) as soon as
+    each candidate's object is complete in the reply, then fallbacks for
+    the positions the model never delivered.
+    """
+    delivered: set[int] = set()
+    try:
+        raw = ""
+        async for delta in _stream(deadline, **_explanations_request(query, candidates)):
+            raw += delta
+            for number, explanation in _parse_explanations(raw, len(candidates)).items():
+                if number not in delivered:
+                    delivered.add(number)
+                    yield number - 1, explanation
+    except Exception as e:
+        logger.error("stream_explanations LLM call failed after %d of %d candidates: %s",
+                     len(delivered), len(candidates), e)
+    for number, candidate in enumerate(candidates, start=1):
+        if number not in delivered:
+            yield number - 1, _fallback_explanation(candidate)
+
+
+def _explanations_request(query: str, candidates: list[dict]) -> dict:
+    profiles = "\n\n".join(
+        f"""[{i}]
+- Name: {c.get('name')}
+- Title: {c.get('current_title')} at {c.get('current_company')}
+- Location: {c.get('city')}, {c.get('country')}
+- Industry: {c.get('industry')}
+- Years of experience: {c.get('years_of_experience')}
+- Skills: {(c.get('skills') or '')[:200]}
+- Top skills: {c.get('top_skills')}
+- Education: {c.get('education')}
+- Languages: {c.get('languages')}"""
+        for i, c in enumerate(candidates, start=1)
+    )
+    return {
+        "model": settings.llm_model,
+        "messages": [{"role": "user", "content": f"""You are writing search results for an expert network.
+
+Search query: "{query}"
+
+Candidates:
+{profiles}
+
+For EVERY candidate, in order, return one JSON object. Return a JSON array only:
+[{{"candidate": <number>, "why_match": "<one sentence why this person matches the query>", "highlights": ["<fact 1>", "<fact 2>", "<fact 3>"]}}]"""}],
+        "max_tokens": 120 * len(candidates) + 100,
+        "temperature": 0.3,
+    }
+
+
+def _parse_explanations(raw: str, expected: int) -> dict[int, dict]:
+    """
+    Map candidate numbers to explanations. Tries the whole array first,
+    then each {...} object on its own, so one malformed entry (or a
+    truncated tail) costs only that entry.
+    """
+    if "```" in raw:
+        raw = raw.split("```")[1].lstrip("json").strip()
+    try:
+        items = json.loads(raw[raw.index("[") : raw.rindex("]") + 1])
+    except ValueError:
+        items = []
+        for match in re.finditer(r"\{[^{}]*\}", raw):
+            try:
+                items.append(json.loads(match.group(0)))
+            except json.JSONDecodeError:
+                continue
+    if not isinstance(items, list):
+        return {}
+
+    explanations: dict[int, dict] = {}
+    unnumbered: list[tuple[int, dict]] = []
+    for position, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            continue
+        why = item.get("why_match")
+        highlights = item.get("highlights")
+        if not isinstance(why, str) or not why.strip() or not isinstance(highlights, list):
+            continue
+        explanation = {"why_match": why.strip(), "highlights": [str(h) for h in highlights if h][:3]}
+        number = item.get("candidate")
+        if isinstance(number, int) and not isinstance(number, bool) and 0 < number <= expected:
+            explanations.setdefault(number, explanation)
+        else:
+            unnumbered.append((position, explanation))
+
+    # Numbered entries win; unnumbered ones are taken to be in prompt order and
+    # move to the first number nobody gave when their position is already taken
+    for position, explanation in unnumbered:
+        if position in explanations:
+            position = next((n for n in range(1, expected + 1) if n not in explanations), None)
+        if position is not None and position <= expected:
+            explanations[position] = explanation
+    return explanations
+
+
+async def summarise(query: str, candidates: list[dict], deadline: Optional[float] = None) -> str:
+    logger.debug("Generating summary for %d candidates", len(candidates))
+    try:
+        summary = await _complete(deadline, **_summary_request(query, candidates))
         logger.debug("Summary generated: '%s'", summary[:80])
         return summary
     except Exception as e:
@@ -129,6 +278,27 @@ def summarise(query: str, candidates: list[dict]) -> str:
         raise
 
 
+async def stream_summary(query: str, candidates: list[dict], deadline: Optional[float] = None) -> AsyncIterator[str]:
+    """summarise, yielding the text as the model writes it."""
+    logger.debug("Streaming summary for %d candidates", len(candidates))
+    try:
+        async for delta in _stream(deadline, **_summary_request(query, candidates)):
+            yield delta
+    except Exception as e:
+        logger.error("stream_summary LLM call failed: %s", e)
+        raise
+
+
+def _summary_request(query: str, candidates: list[dict]) -> dict:
+    names = ", ".join(c.get("name", "") for c in candidates[:5])
+    return {
+        "model": settings.llm_model,
+        "messages": [{"role": "user", "content": f'Search: "{query}". Top results: {names}. Write 2 sentences summarising why these candidates are relevant. Plain text only.'}],
+        "max_tokens": 100,
+        "temperature": 0.4,
+    }
+
+
 def _fallback_explanation(candidate: dict) -> dict:
     """Return a safe fallback when the LLM fails or returns bad JSON."""
     return {
@@ -140,7 +310,7 @@ def _fallback_explanation(candidate: dict) -> dict:
         ],
     }
 
-def rerank_candidates(query: str, candidates: list[dict], top_k: int) -> list[dict]:
+async def rerank_candidates(query: str, candidates: list[dict], top_k: int, deadline: Optional[float] = None) -> list[dict]:
     summaries = "\n".join(
         f"{i+1}. {c.get('name')} | {c.get('current_title')} | "
         f"{c.get('city')}, {c.get('country')} | "
@@ -151,7 +321,8 @@ def rerank_candidates(query: str, candidates: list[dict], top_k: int) -> list[di
 
 
 
-    response = client.chat.completions.create(
+    raw = await _complete(
+        deadline,
         model=settings.llm_model,
         messages=[{"role": "user", "content": f"""You are ranking candidates for a search query.
 Pick the {top_k} best matches strictly against the user input. Return ONLY a JSON array of their numbers.
@@ -166,7 +337,6 @@ Best {top_k} (as JSON array of numbers):"""}],
         temperature=0.3,
     )
     try:
-        raw = response.choices[0].message.content.strip()
         if "```" in raw:
             raw = raw.split("```")[1].lstrip("json").strip()
         indices = json.loads(raw)
@@ -177,12 +347,13 @@ Best {top_k} (as JSON array of numbers):"""}],
 
 
 #TODO: Modify the Prompt
-def react_agent_step(
+async def react_agent_step(
         original_query: str,
         history: List[dict],
         total: int,
         iteration: int,
-        max_iteration: int
+        max_iteration: int,
+        deadline: Optional[float] = None,
 ) -> dict:
     history_text = ""
     if history:
@@ -191,7 +362,8 @@ def react_agent_step(
             for h in history
         )
 
-    response = client.chat.completions.create(
+    raw = await _complete(
+        deadline,
         model=settings.llm_model,
         messages=[{"role": "user", "content": f"""You are a research agent finding candidates in an expert network.
     You think step by step, then take one action per turn.
@@ -222,7 +394,6 @@ def react_agent_step(
         temperature=0,
     )
     try:
-        raw = response.choices[0].message.content.strip()
         if "```" in raw:
             raw = raw.split("```")[1].lstrip("json").strip()
         return json.loads(raw)
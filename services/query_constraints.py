@@ -0,0 +1,179 @@
+"""
+Query constraint extraction.
+
+Pulls hard constraints (location, spoken languages, industry and years
+of experience) out of a natural-language query and turns them into a
+vector store `where` clause, so mismatches are pruned before vector
+scoring instead of being thrown out by the LLM rerank.
+
+Only values that exist in the index are recognized, and words that are
+easy to misread need a cue: a language must be spoken ("speaks Arabic",
+"Arabic speakers"), and a city or industry must follow "in", "from" or
+"based in" (or, for industries, precede "industry" / "sector").
+"""
+
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from database.vectorstore import (
+    FILTER_CITY,
+    FILTER_COUNTRY,
+    FILTER_INDUSTRY,
+    FILTER_LANGUAGES,
+    FILTER_YEARS,
+    filter_vocabulary,
+    normalize_filter_value,
+)
+
+logger = logging.getLogger(__name__)
+
+# Spellings of the same country; whichever ones the index uses are filtered on
+_COUNTRY_ALIASES = [
+    {"united arab emirates", "uae", "emirates"},
+    {"saudi arabia", "ksa"},
+    {"united states", "united states of america", "usa"},
+    {"united kingdom", "uk", "great britain", "britain"},
+]
+
+_YEARS = r"\s*(?:years?|yrs?)\b"
+# (pattern, builds (min_years, max_years) from the match), most specific first
+_YEAR_PATTERNS = [
+    (re.compile(rf"\bbetween\s+(\d+)\s+and\s+(\d+){_YEARS}"), lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b(\d+)\s*(?:-|–|to)\s*(\d+){_YEARS}"), lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b(?:at least|minimum(?: of)?|min\.?)\s+(\d+)\+?{_YEARS}"), lambda m: (int(m[1]), None)),
+    (re.compile(rf"\b(?:more than|over)\s+(\d+)\+?{_YEARS}"), lambda m: (int(m[1]) + 1, None)),
+    (re.compile(rf"\b(?:less than|fewer than|under)\s+(\d+){_YEARS}"), lambda m: (None, max(int(m[1]) - 1, 0))),
+    (re.compile(rf"\b(?:up to|at most|maximum(?: of)?|max\.?)\s+(\d+){_YEARS}"), lambda m: (None, int(m[1]))),
+    (re.compile(rf"\b(\d+)\s*\+{_YEARS}"), lambda m: (int(m[1]), None)),
+    (re.compile(rf"\b(\d+){_YEARS}"), lambda m: (int(m[1]), None)),
+]
+
+_LIST_SEPARATOR = r"\s*(?:,|/|&|\bor\b|\band\b)\s*"
+_PLACE_CUE = r"\b(?:in|from|based in|located in|living in|near|around)\s+(?:the\s+)?"
+_SPEAK_CUE = r"\b(?:speaks?|speaking|fluent in|proficient in|native)\s+"
+_SPEAKER_SUFFIX = r"(?:\s*-\s*|\s+)(?:speakers?|speaking)\b"
+_INDUSTRY_SUFFIX = r"\s+(?:industry|sector|space|domain)\b"
+
+
+@dataclass
+class QueryConstraints:
+    countries: list[str] = field(default_factory=list)
+    cities: list[str] = field(default_factory=list)
+    languages: list[str] = field(default_factory=list)
+    industries: list[str] = field(default_factory=list)
+    min_years: Optional[int] = None
+    max_years: Optional[int] = None
+
+    def to_where(self) -> Optional[dict]:
+        clauses = []
+        for name, values in ((FILTER_COUNTRY, self.countries), (FILTER_CITY, self.cities), (FILTER_INDUSTRY, self.industries)):
+            if len(values) == 1:
+                clauses.append({name: values[0]})
+            elif values:
+                clauses.append({name: {"$in": values}})
+        # Every requested language must be spoken
+        clauses.extend({FILTER_LANGUAGES: {"$contains": language}} for language in self.languages)
+        if self.min_years is not None:
+            clauses.append({FILTER_YEARS: {"$gte": self.min_years}})
+        if self.max_years is not None:
+            clauses.append({FILTER_YEARS: {"$lte": self.max_years}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class _Patterns:
+    """Regexes compiled from one version of the index vocabulary."""
+
+    def __init__(self, vocabulary: dict[str, frozenset[str]]):
+        countries = set(vocabulary.get(FILTER_COUNTRY, ()))
+        # Any spelling of a country → every spelling of it the index actually holds
+        self.country_forms: dict[str, list[str]] = {c: [c] for c in countries}
+        for group in _COUNTRY_ALIASES:
+            present = sorted(group & countries)
+            if present:
+                for alias in group:
+                    self.country_forms[alias] = present
+        self.country = _compile(_alternation(self.country_forms))
+
+        city = _alternation(vocabulary.get(FILTER_CITY, ()))
+        self.city = _compile(city)
+        self.city_cued = _compile(_cued(city, _PLACE_CUE))
+
+        language = _alternation(vocabulary.get(FILTER_LANGUAGES, ()))
+        self.language = _compile(language)
+        self.language_cued = _compile(_cued(language, _SPEAK_CUE, _SPEAKER_SUFFIX))
+
+        industry = _alternation(vocabulary.get(FILTER_INDUSTRY, ()))
+        self.industry = _compile(industry)
+        self.industry_cued = _compile(_cued(industry, _PLACE_CUE, _INDUSTRY_SUFFIX))
+
+
+_patterns: tuple[int, Optional[_Patterns]] = (-1, None)
+_patterns_lock = threading.Lock()
+
+
+def _current_patterns() -> _Patterns:
+    global _patterns
+    version, vocabulary = filter_vocabulary()
+    with _patterns_lock:
+        if _patterns[0] != version:
+            _patterns = (version, _Patterns(vocabulary))
+        return _patterns[1]
+
+
+def extract_constraints(query: str) -> QueryConstraints:
+    """Find the hard constraints in a query; fields with no constraint stay empty."""
+    text = normalize_filter_value(query)
+    patterns = _current_patterns()
+    constraints = QueryConstraints()
+
+    if patterns.country:
+        forms = (f for match in patterns.country.finditer(text) for f in patterns.country_forms[match[0]])
+        constraints.countries = list(dict.fromkeys(forms))
+    constraints.cities = _find_listed(patterns.city_cued, patterns.city, text)
+    constraints.languages = _find_listed(patterns.language_cued, patterns.language, text)
+    constraints.industries = _find_listed(patterns.industry_cued, patterns.industry, text)
+
+    for pattern, bounds in _YEAR_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            constraints.min_years, constraints.max_years = bounds(match)
+            break
+
+    logger.debug("Query constraints | query='%s' constraints=%s", query, constraints)
+    return constraints
+
+
+def _alternation(values) -> Optional[str]:
+    if not values:
+        return None
+    # Longest first so "abu dhabi" wins over "abu"; lookarounds instead of \b so "c++" works
+    options = "|".join(re.escape(v) for v in sorted(values, key=len, reverse=True))
+    return rf"(?<!\w)(?:{options})(?!\w)"
+
+
+def _cued(alternation: Optional[str], prefix: str, suffix: str = None) -> Optional[str]:
+    """A list of values ("dubai, abu dhabi or doha") introduced by `prefix` or followed by `suffix`."""
+    if alternation is None:
+        return None
+    listed = f"{alternation}(?:{_LIST_SEPARATOR}{alternation})*"
+    pattern = f"{prefix}({listed})"
+    if suffix:
+        pattern += f"|({listed}){suffix}"
+    return pattern
+
+
+def _compile(pattern: Optional[str]) -> Optional[re.Pattern]:
+    return re.compile(pattern) if pattern else None
+
+
+def _find_listed(cued: Optional[re.Pattern], value: Optional[re.Pattern], text: str) -> list[str]:
+    if cued is None:
+        return []
+    found = [v for match in cued.finditer(text) for group in match.groups() if group for v in value.findall(group)]
+    return list(dict.fromkeys(found))
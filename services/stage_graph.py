@@ -0,0 +1,99 @@
+"""
+Dependency-driven execution of the stages of one request.
+
+A stage is an async function plus the names of the stages whose results
+it receives as keyword arguments. StageGraph.run starts each stage as
+soon as its inputs are done, so independent LLM calls, embeddings and
+searches overlap instead of queueing behind each other:
+
+    graph = StageGraph()
+    graph.add("rewrite", rewrite)
+    graph.add("search", search, after=("rewrite",))
+    graph.add("explain", explain, after=("search",))
+    graph.add("summary", summarise, after=("search",))
+    results = await graph.run()
+
+A speculative stage does work that may turn out to be unneeded, such as
+searching with the raw query while the rewrite is still running. When it
+fails its dependents receive None instead of the request failing. The
+start offset and duration of every stage are kept in `timings`.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageTiming:
+    started_ms: float  # since the graph started
+    elapsed_ms: float
+
+
+@dataclass
+class _Stage:
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    after: tuple[str, ...]
+    speculative: bool
+
+
+class StageGraph:
+    def __init__(self):
+        self._stages: dict[str, _Stage] = {}
+        self.timings: dict[str, StageTiming] = {}
+
+    def add(self, name: str, run: Callable[..., Awaitable[Any]], after: tuple[str, ...] = (), speculative: bool = False):
+        """Add a stage. Its inputs must be added first, which also keeps the graph acyclic."""
+        if name in self._stages:
+            raise ValueError(f"Stage {name!r} is already defined")
+        missing = [dependency for dependency in after if dependency not in self._stages]
+        if missing:
+            raise ValueError(f"Stage {name!r} depends on undefined stages {missing}")
+        self._stages[name] = _Stage(name, run, tuple(after), speculative)
+
+    async def run(self) -> dict[str, Any]:
+        """
+        Run every stage and return their results by name. The first failure
+        of a non-speculative stage cancels the stages still running and is
+        raised.
+        """
+        started = time.perf_counter()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def execute(stage: _Stage):
+            inputs = {dependency: await tasks[dependency] for dependency in stage.after}
+            began = time.perf_counter()
+            try:
+                return await stage.run(**inputs)
+            except Exception as e:
+                if not stage.speculative:
+                    raise
+                logger.warning("Speculative stage %s failed: %s", stage.name, e)
+                return None
+            finally:
+                self.timings[stage.name] = StageTiming(
+                    started_ms=round((began - started) * 1000, 1),
+                    elapsed_ms=round((time.perf_counter() - began) * 1000, 1),
+                )
+
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(execute(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # Also reached when the request itself is cancelled, e.g. the client disconnected
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    def format_timings(self) -> str:
+        """One `name=elapsed@start` entry per finished stage, in start order, for logs."""
+        ordered = sorted(self.timings.items(), key=lambda item: item[1].started_ms)
+        return " ".join(f"{name}={t.elapsed_ms:.0f}ms@{t.started_ms:.0f}" for name, t in ordered)
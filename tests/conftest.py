@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.Settings needs these at import time; nothing here connects to them
+os.environ.setdefault("POSTGRES_URL", "postgresql://localhost/test")
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+# Modules that import the vector store open it on import; keep it away from real data
+_data = tempfile.mkdtemp(prefix="infoquest-tests-")
+os.environ.setdefault("VECTOR_BACKEND", "numpy")
+os.environ.setdefault("NUMPY_INDEX_PATH", os.path.join(_data, "numpy_index"))
+os.environ.setdefault("PROFILE_STORE_PATH", os.path.join(_data, "profile_store"))
+os.environ.setdefault("INGEST_JOBS_DIR", os.path.join(_data, "ingest_jobs"))
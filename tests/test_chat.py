@@ -0,0 +1,91 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from config import settings
+from models.chat import ChatRequest
+from routes import chat
+
+
+def run_retrieval(monkeypatch, search, rewritten=None, similarity=None):
+    """Run the retrieval stages of a first turn with the LLM, embeddings and search replaced."""
+    async def rewrite_query(query, history, deadline):
+        return rewritten or query
+
+    async def embed(query, deadline):
+        return [1.0, 0.0]
+
+    async def rerank_candidates(query, candidates, top_k, deadline):
+        return candidates[:top_k]
+
+    monkeypatch.setattr(settings, "speculative_search", True)
+    monkeypatch.setattr(settings, "query_filters", False)
+    monkeypatch.setattr(chat.llm, "rewrite_query", rewrite_query)
+    monkeypatch.setattr(chat.llm, "rerank_candidates", rerank_candidates)
+    monkeypatch.setattr(chat, "hydrate", lambda results, fields=None: results)
+    monkeypatch.setattr(chat, "_search", search)
+    monkeypatch.setattr(chat, "_embed", embed)
+    monkeypatch.setattr(chat, "similarities", lambda vector, ids: {cid: similarity[cid] for cid in ids})
+    request = ChatRequest(query="python engineers in dubai", top_k=2)
+    return asyncio.run(chat._retrieval_graph(request, [], deadline=None).run())
+
+
+def test_pick_searches_again_when_speculative_search_failed(monkeypatch):
+    calls = []
+
+    async def search(query, top_k, where, deadline, query_vector=None):
+        calls.append(query)
+        if len(calls) == 1:
+            raise HTTPException(status_code=504, detail="Embedding timed out")
+        return [{"id": "c1", "score": 0.9}]
+
+    stages = run_retrieval(monkeypatch, search)
+    # The rewrite matched the query, so only the failed speculative search and the retry ran
+    assert calls == ["python engineers in dubai"] * 2
+    assert stages["search_raw"] is None
+    assert stages["search_rewritten"] is None
+    assert stages["pick"] == [{"id": "c1", "score": 0.9}]
+
+
+def test_pick_uses_speculative_results_when_rewrite_matches(monkeypatch):
+    calls = []
+
+    async def search(query, top_k, where, deadline, query_vector=None):
+        calls.append(query)
+        return [{"id": "c1", "score": 0.9}]
+
+    stages = run_retrieval(monkeypatch, search)
+    assert len(calls) == 1
+    assert stages["rerank"] == [{"id": "c1", "score": 0.9}]
+
+
+def test_pick_compares_both_lists_against_the_rewritten_query(monkeypatch):
+    # Each list's own scores are against its own query: the raw list looks stronger on
+    # them, but the rewritten list holds the rows closer to the rewritten query
+    lists = {
+        "python engineers in dubai": [{"id": "r1", "score": 0.99}, {"id": "r2", "score": 0.98}],
+        "python developers dubai uae": [{"id": "w1", "score": 0.80}, {"id": "w2", "score": 0.79}],
+    }
+
+    async def search(query, top_k, where, deadline, query_vector=None):
+        return lists[query]
+
+    similarity = {"r1": 0.70, "r2": 0.69, "w1": 0.80, "w2": 0.79}
+    stages = run_retrieval(monkeypatch, search, rewritten="python developers dubai uae", similarity=similarity)
+    assert [r["id"] for r in stages["pick"]] == ["w1", "w2"]
+
+
+def test_better_ranks_each_list_by_cosine_not_fused_order(monkeypatch):
+    similarity = {"r1": 0.20, "r2": 0.95, "r3": 0.94, "w1": 0.90, "w2": 0.90}
+    monkeypatch.setattr(chat, "similarities", lambda vector, ids: {cid: similarity[cid] for cid in ids})
+    # BM25 fusion put a weak row first; the raw list's best two still beat the rewrite's
+    raw = [{"id": "r1", "score": 0.6}, {"id": "r2", "score": 0.6}, {"id": "r3", "score": 0.6}]
+    rewritten = [{"id": "w1", "score": 0.9}, {"id": "w2", "score": 0.9}]
+    assert chat._better(raw, rewritten, 2, [1.0, 0.0]) is raw
+
+
+def test_better_ties_go_to_the_rewrite(monkeypatch):
+    monkeypatch.setattr(chat, "similarities", lambda vector, ids: {cid: 0.5 for cid in ids})
+    raw = [{"id": "a", "score": 0.9}]
+    rewritten = [{"id": "b", "score": 0.1}]
+    assert chat._better(raw, rewritten, 1, [1.0, 0.0]) is rewritten
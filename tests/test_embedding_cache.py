@@ -0,0 +1,94 @@
+import itertools
+import threading
+
+import pytest
+
+from config import settings
+from services import embedding_cache, embeddings
+from services.embedding_cache import EmbeddingCache, QueryVectorCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Give every cache write and lookup its own timestamp so LRU order is exact."""
+    ticks = itertools.count()
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+def open_cache(tmp_path, max_entries=100, model="model-a"):
+    return EmbeddingCache(str(tmp_path / "cache.sqlite"), model=model, max_entries=max_entries)
+
+
+def test_vectors_survive_reopen_and_are_keyed_by_model(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    cache.close()
+
+    assert open_cache(tmp_path).get_many(["a", "b", "c"]) == [[1.0, 2.0], [3.0, 4.0], None]
+    assert open_cache(tmp_path, model="model-b").get_many(["a"]) == [None]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = open_cache(tmp_path, max_entries=10)
+    cache.put_many([f"t{i}" for i in range(10)], [[float(i)] for i in range(10)])
+    # Reading t0..t2 makes t3 and t4 the least recently used
+    cache.get_many(["t0", "t1", "t2"])
+    for i in range(5, 10):
+        cache.put_many([f"t{i}"], [[float(i)]])
+    cache.put_many(["new"], [[99.0]])
+
+    # Over the limit, the cache trims itself to 90% of it
+    assert len(cache) == 9
+    found = cache.get_many([f"t{i}" for i in range(10)] + ["new"])
+    assert [v is not None for v in found] == [True, True, True, False, False] + [True] * 6
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryVectorCache(max_entries=2, ttl_seconds=0)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_query_cache_entries_expire(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    cache = QueryVectorCache(max_entries=10, ttl_seconds=60)
+    cache.put("m", "a", [1.0])
+    now[0] = 61
+    assert cache.get("m", "a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_cache_is_opened_once_by_concurrent_callers(tmp_path, monkeypatch):
+    opened = []
+
+    class CountingCache(EmbeddingCache):
+        def __init__(self, *args, **kwargs):
+            opened.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(embeddings, "EmbeddingCache", CountingCache)
+    monkeypatch.setattr(embeddings, "_cache", None)
+    monkeypatch.setattr(embeddings, "_cache_unavailable", False)
+    monkeypatch.setattr(settings, "embedding_cache_enabled", True)
+    monkeypatch.setattr(settings, "embedding_cache_path", str(tmp_path / "cache.sqlite"))
+
+    start = threading.Barrier(8)
+    caches = []
+
+    def open_it():
+        start.wait()
+        caches.append(embeddings.get_embedding_cache())
+
+    threads = [threading.Thread(target=open_it) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(opened) == 1
+    assert all(cache is opened[0] for cache in caches)
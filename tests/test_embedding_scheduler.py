@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from services.embedding_scheduler import EmbeddingScheduler
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(EmbeddingScheduler, "_wait", staticmethod(lambda state: 0))
+
+
+def flaky(failures: dict[str, int], error=ServerError):
+    """An embed function that fails for each text the given number of times first."""
+    calls: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def embed(texts):
+        with lock:
+            calls[texts[0]] = calls.get(texts[0], 0) + 1
+            if calls[texts[0]] <= failures.get(texts[0], 0):
+                raise error("provider error")
+        return [[float(len(t))] for t in texts]
+
+    embed.calls = calls
+    return embed
+
+
+def run(scheduler, batches):
+    return [(batch, vectors, error) for batch, vectors, error in scheduler.map(batches, lambda b: b)]
+
+
+def test_results_come_back_in_submission_order():
+    scheduler = EmbeddingScheduler(flaky({"b": 1}), max_concurrency=4, max_attempts=3)
+    results = run(scheduler, [["a"], ["b"], ["cc"]])
+    assert [(batch, vectors) for batch, vectors, _ in results] == [(["a"], [[1.0]]), (["b"], [[1.0]]), (["cc"], [[2.0]])]
+    assert all(error is None for _, _, error in results)
+
+
+def test_batch_that_exhausts_its_retries_is_requeued():
+    embed = flaky({"b": 4})
+    scheduler = EmbeddingScheduler(embed, max_concurrency=2, max_attempts=2, max_requeues=2)
+    results = run(scheduler, [["a"], ["b"], ["c"]])
+    assert [error for _, _, error in results] == [None, None, None]
+    # Two rounds of two attempts failed, the third round succeeded
+    assert embed.calls["b"] == 5
+    assert [batch for batch, _, _ in results] == [["a"], ["b"], ["c"]]
+
+
+def test_batch_is_reported_failed_once_its_requeues_run_out():
+    embed = flaky({"b": 100})
+    scheduler = EmbeddingScheduler(embed, max_concurrency=2, max_attempts=2, max_requeues=1)
+    (_, _, first), (_, vectors, error), (_, _, last) = run(scheduler, [["a"], ["b"], ["c"]])
+    assert first is None and last is None
+    assert vectors is None and isinstance(error, ServerError)
+    assert embed.calls["b"] == 4
+
+
+def test_client_errors_are_not_retried_or_requeued():
+    embed = flaky({"a": 1}, error=BadRequest)
+    scheduler = EmbeddingScheduler(embed, max_concurrency=1, max_attempts=3, max_requeues=2)
+    [(_, _, error)] = run(scheduler, [["a"]])
+    assert isinstance(error, BadRequest)
+    assert embed.calls["a"] == 1
+
+
+def test_server_errors_lower_concurrency():
+    scheduler = EmbeddingScheduler(flaky({"a": 1}), max_concurrency=4, max_attempts=2)
+    run(scheduler, [["a"]])
+    assert scheduler.concurrency == 2
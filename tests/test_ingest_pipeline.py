@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import settings
+from services import ingest_pipeline
+from services.embedding_scheduler import EmbeddingScheduler
+
+ROWS = [SimpleNamespace(id=f"{i:03d}") for i in range(12)]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Ingest over ROWS in batches of two, with Postgres and the vector store replaced."""
+    state = SimpleNamespace(upserted=[], checkpoints=[], fail_upsert=set(), durable=True)
+
+    def iter_candidates(batch_size, after_id, until_id):
+        yield [r for r in ROWS if (after_id is None or r.id > after_id) and (until_id is None or r.id <= until_id)]
+
+    def upsert_candidates(candidates, vectors, hashes, collection=None):
+        if candidates[0].id in state.fail_upsert:
+            raise RuntimeError("store unavailable")
+        state.upserted.extend(c.id for c in candidates)
+
+    monkeypatch.setattr(ingest_pipeline, "iter_candidates", iter_candidates)
+    monkeypatch.setattr(ingest_pipeline, "upsert_candidates", upsert_candidates)
+    monkeypatch.setattr(ingest_pipeline, "flush", lambda force=False: force or state.durable)
+    monkeypatch.setattr(ingest_pipeline, "candidate_content_hash", lambda c: "hash")
+    monkeypatch.setattr(ingest_pipeline, "build_candidate_text", lambda c: c.id)
+    monkeypatch.setattr(settings, "embedding_batch_max_items", 2)
+
+    def run(embed=lambda texts: [[0.0]] * len(texts), concurrency=1):
+        def on_checkpoint(partition, last_id, snapshot):
+            state.checkpoints.append((partition, last_id, snapshot.upserted))
+
+        return ingest_pipeline.run_ingest(
+            partitions=[(None, "005"), ("005", None)],
+            scheduler=EmbeddingScheduler(embed, max_concurrency=concurrency, max_attempts=1),
+            on_checkpoint=on_checkpoint,
+            batch_tokens=10**9,
+        )
+
+    state.run = run
+    return state
+
+
+def last_checkpoints(checkpoints):
+    return {partition: last_id for partition, last_id, _ in checkpoints}
+
+
+def test_every_batch_is_checkpointed(pipeline):
+    stats = pipeline.run()
+    assert (stats.fetched, stats.embedded, stats.upserted, stats.failed) == (12, 12, 12, 0)
+    assert last_checkpoints(pipeline.checkpoints) == {0: "005", 1: "011"}
+    assert pipeline.checkpoints[-1][2] == 12
+
+
+def test_failed_embedding_holds_its_partition_checkpoint(pipeline):
+    def embed(texts):
+        if "002" in texts:
+            raise ValueError("bad request")
+        return [[0.0]] * len(texts)
+
+    stats = pipeline.run(embed)
+    assert stats.failed == 2
+    assert "002" not in pipeline.upserted
+    # Partition 0 stays before the failed batch even though later batches went in
+    assert "004" in pipeline.upserted
+    assert last_checkpoints(pipeline.checkpoints) == {0: "001", 1: "011"}
+    # The snapshot only counts rows behind the checkpoints: 2 in partition 0, 6 in partition 1
+    assert pipeline.checkpoints[-1][2] == 8
+
+
+def test_failed_upsert_holds_its_partition_checkpoint(pipeline):
+    pipeline.fail_upsert = {"008"}
+    stats = pipeline.run()
+    assert (stats.upserted, stats.failed) == (10, 2)
+    assert last_checkpoints(pipeline.checkpoints) == {0: "005", 1: "007"}
+
+
+def test_checkpoints_wait_until_the_store_is_durable(pipeline):
+    pipeline.durable = False
+    pipeline.run()
+    # Nothing is saved until the final forced flush, which saves each partition once
+    assert last_checkpoints(pipeline.checkpoints) == {0: "005", 1: "011"}
+    assert len(pipeline.checkpoints) == 2
+
+
+def test_counters_add_up_with_concurrent_embedding(pipeline):
+    stats = pipeline.run(concurrency=4)
+    assert (stats.fetched, stats.added, stats.embedded, stats.upserted) == (12, 12, 12, 12)
@@ -0,0 +1,70 @@
+import json
+
+from services.llm import _parse_explanations
+
+
+def entry(number=None, why="Fits the query", highlights=("a", "b")):
+    item = {"why_match": why, "highlights": list(highlights)}
+    if number is not None:
+        item["candidate"] = number
+    return item
+
+
+def test_numbered_entries_map_to_their_candidates():
+    raw = json.dumps([entry(2, why="second"), entry(1, why="first")])
+    parsed = _parse_explanations(raw, 2)
+    assert parsed[1]["why_match"] == "first"
+    assert parsed[2]["why_match"] == "second"
+
+
+def test_code_fence_is_stripped():
+    raw = "Here you go:\n```json\n" + json.dumps([entry(1)]) + "\n```\nHope that helps."
+    assert set(_parse_explanations(raw, 1)) == {1}
+
+
+def test_truncated_tail_keeps_complete_entries():
+    raw = json.dumps([entry(1), entry(2)])[:-1] + ', {"candidate": 3, "why_match": "cut o'
+    assert set(_parse_explanations(raw, 3)) == {1, 2}
+
+
+def test_truncated_tail_inside_unclosed_code_fence():
+    raw = "```json\n" + json.dumps([entry(1)])[:-1] + ', {"candidate": 2'
+    assert set(_parse_explanations(raw, 2)) == {1}
+
+
+def test_bad_entries_are_skipped():
+    raw = json.dumps([
+        entry(1, why=""),
+        {"candidate": 2, "why_match": "Fits", "highlights": "not a list"},
+        "not an object",
+        entry(3),
+    ])
+    assert set(_parse_explanations(raw, 3)) == {3}
+
+
+def test_out_of_range_numbers_fall_back_to_position():
+    raw = json.dumps([entry(7), entry(True)])
+    assert set(_parse_explanations(raw, 2)) == {1, 2}
+
+
+def test_duplicate_numbers_keep_the_first():
+    raw = json.dumps([entry(1, why="first"), entry(1, why="again")])
+    assert _parse_explanations(raw, 2) == {1: {"why_match": "first", "highlights": ["a", "b"]}}
+
+
+def test_numbered_entry_wins_over_unnumbered_at_its_position():
+    raw = json.dumps([entry(why="unnumbered"), entry(1, why="numbered")])
+    parsed = _parse_explanations(raw, 2)
+    assert parsed[1]["why_match"] == "numbered"
+    assert parsed[2]["why_match"] == "unnumbered"
+
+
+def test_unnumbered_entries_fill_in_prompt_order():
+    raw = json.dumps([entry(why="one"), entry(3, why="three"), entry(why="two")])
+    parsed = _parse_explanations(raw, 3)
+    assert {n: e["why_match"] for n, e in parsed.items()} == {1: "one", 2: "two", 3: "three"}
+
+
+def test_highlights_are_capped_at_three():
+    raw = json.dumps([entry(1, highlights=["a", "", "b", "c", "d"])])
+    assert _parse_explanations(raw, 1)[1]["highlights"] == ["a", "b", "c"]
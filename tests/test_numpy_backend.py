@@ -0,0 +1,177 @@
+import json
+
+import numpy as np
+import pytest
+
+from database.backends import base
+from database.backends.numpy_backend import NumpyStore
+
+COLLECTION = "candidates"
+
+
+def open_store(path, **kwargs):
+    return NumpyStore(str(path), keep_versions=2, flush_seconds=0, **kwargs)
+
+
+def vectors(*rows):
+    return [list(row) for row in rows]
+
+
+def current(path):
+    return json.loads((path / COLLECTION / "CURRENT").read_text())
+
+
+@pytest.fixture(params=["none", "int8"])
+def quantization(request):
+    return request.param
+
+
+def test_flush_appends_new_rows_and_reopens(tmp_path, quantization):
+    store = open_store(tmp_path, quantization=quantization)
+    store.upsert(["a", "b"], vectors((1, 0, 0), (0, 1, 0)), [{"k": 1}, {"k": "two\nlines"}], None)
+    assert store.flush(force=True)
+    store.upsert(["c"], vectors((0, 0, 1)), [{"k": 3}], None)
+    assert store.flush(force=True)
+
+    # Both flushes went into the same generation
+    pointer = current(tmp_path)
+    assert (pointer["generation"], pointer["rows"], pointer["dim"]) == ("g1", 3, 3)
+    reopened = open_store(tmp_path, quantization=quantization)
+    assert reopened.count() == 3
+    assert [cid for cid, _, _ in reopened.query([0, 0, 1], 1)] == ["c"]
+    assert [m for _, _, m in reopened.fetch(["b"])] == [{"k": "two\nlines"}]
+
+
+def test_changing_or_deleting_flushed_rows_writes_a_new_generation(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert(["a", "b", "c"], vectors((1, 0, 0), (0, 1, 0), (0, 0, 1)), [{}, {}, {}], None)
+    store.flush(force=True)
+
+    # Rows added and removed again before a flush leave the generation appendable
+    store.upsert(["d"], vectors((1, 1, 0)), [{}], None)
+    store.delete(["d"])
+    store.flush(force=True)
+    assert current(tmp_path)["generation"] == "g1"
+
+    store.delete(["b"])
+    store.flush(force=True)
+    assert current(tmp_path)["generation"] == "g2"
+    assert not (tmp_path / COLLECTION / "g1").exists()
+
+    store.upsert(["a"], vectors((0, 1, 1)), [{"k": "new"}], None)
+    store.flush(force=True)
+    assert current(tmp_path)["generation"] == "g3"
+
+    reopened = open_store(tmp_path)
+    assert sorted(cid for cid, _, _ in reopened.fetch(["a", "b", "c"])) == ["a", "c"]
+    assert [m for _, _, m in reopened.fetch(["a"])] == [{"k": "new"}]
+
+
+def test_torn_append_is_ignored_and_overwritten(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert(["a"], vectors((1, 0)), [{}], None)
+    store.flush(force=True)
+
+    # An append that crashed before CURRENT was replaced
+    generation = tmp_path / COLLECTION / "g1"
+    with open(generation / "vectors.f32", "ab") as f:
+        f.write(np.ones(2, dtype=np.float32).tobytes())
+    with open(generation / "records.jsonl", "ab") as f:
+        f.write(b'["torn", {}]\n["tor')
+
+    reopened = open_store(tmp_path)
+    assert reopened.count() == 1
+    reopened.upsert(["b"], vectors((0, 1)), [{"k": "b"}], None)
+    reopened.flush(force=True)
+
+    again = open_store(tmp_path)
+    assert again.count() == 2
+    assert [cid for cid, _, _ in again.query([0, 1], 2)] == ["b", "a"]
+    assert (generation / "vectors.f32").stat().st_size == 2 * 2 * 4
+
+
+def test_reader_picks_up_another_process_flush(tmp_path):
+    writer = open_store(tmp_path)
+    writer.upsert(["a"], vectors((1, 0)), [{}], None)
+    writer.flush(force=True)
+    reader = open_store(tmp_path, reload_seconds=0)
+    assert reader.count() == 1
+
+    writer.upsert(["b"], vectors((0, 1)), [{}], None)
+    writer.flush(force=True)
+    assert reader.refresh(force=True)
+    assert reader.count() == 2
+    assert not reader.refresh(force=True)
+
+
+def test_old_records_json_layout_loads_and_is_rewritten(tmp_path):
+    generation = tmp_path / COLLECTION / "g4"
+    generation.mkdir(parents=True)
+    np.array([[1, 0], [0, 1]], dtype=np.float32).tofile(generation / "vectors.f32")
+    (generation / "records.json").write_text(json.dumps({"dim": 2, "ids": ["a", "b"], "metadatas": [{}, {}]}))
+    (tmp_path / COLLECTION / "CURRENT").write_text("g4")
+
+    store = open_store(tmp_path)
+    assert store.count() == 2
+    store.upsert(["c"], vectors((1, 1)), [{}], None)
+    store.flush(force=True)
+    assert current(tmp_path)["generation"] == "g5"
+    assert open_store(tmp_path).count() == 3
+
+
+def test_where_and_exclude_filter_results(tmp_path, quantization):
+    store = open_store(tmp_path, quantization=quantization)
+    store.upsert(
+        ["a", "b", "c", "d"],
+        vectors((1, 0), (0.9, 0.1), (0.8, 0.2), (0, 1)),
+        [
+            {"country": "uae", "years": 3, "languages": ["arabic", "english"]},
+            {"country": "uae", "years": 10, "languages": ["english"]},
+            {"country": "qatar", "years": 7, "languages": ["arabic"]},
+            {"country": "uae", "years": 1, "languages": []},
+        ],
+        None,
+    )
+    store.flush(force=True)
+
+    def ids(where=None, exclude=None):
+        return [cid for cid, _, _ in store.query_many([[1, 0]], 4, [where], exclude)[0]]
+
+    assert ids({"country": "uae"}) == ["a", "b", "d"]
+    assert ids({"$and": [{"country": "uae"}, {"years": {"$gte": 3}}]}) == ["a", "b"]
+    assert ids({"$or": [{"country": "qatar"}, {"years": {"$lt": 2}}]}) == ["c", "d"]
+    assert ids({"languages": {"$contains": "arabic"}}) == ["a", "c"]
+    assert ids({"country": {"$in": ["qatar"]}}) == ["c"]
+    assert ids(exclude={"a", "c"}) == ["b", "d"]
+    assert ids({"country": "uae"}, exclude={"b"}) == ["a", "d"]
+
+
+def test_activated_collection_is_the_one_reopened(tmp_path):
+    store = open_store(tmp_path)
+    shadow = store.begin_rebuild()
+    store.upsert(["a"], vectors((1, 0)), [{}], None, collection=shadow)
+    store.activate(shadow, expected_count=1)
+
+    assert json.loads((tmp_path / "active_collection.json").read_text())["collection"] == shadow
+    assert not list(tmp_path.glob("*.tmp"))
+    assert open_store(tmp_path).active_collection() == shadow
+
+
+def test_count_is_cached_briefly(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(base.time, "monotonic", lambda: now[0])
+    store = open_store(tmp_path)
+    store.upsert(["a"], vectors((1, 0)), [{}], None)
+    counted = []
+    monkeypatch.setattr(store, "_count", lambda handle: counted.append(handle.name) or handle.size)
+
+    assert store.count() == store.count() == 1
+    assert len(counted) == 1
+    # Writes by other processes only show up once the cached count expires
+    now[0] += base.COUNT_TTL_SECONDS
+    store.count()
+    assert len(counted) == 2
+    # This process's writes drop it straight away
+    store.upsert(["b"], vectors((0, 1)), [{}], None)
+    assert store.count() == 2
+    assert len(counted) == 3
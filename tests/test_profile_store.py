@@ -0,0 +1,39 @@
+import random
+
+from database.profile_store import ProfileStore
+
+
+def test_flushed_profiles_survive_reopen(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.upsert("c", ["a", "b"], [{"name": "Ada"}, {"name": "Bo"}])
+    store.flush()
+    store.delete("c", ["b"])
+    store.flush()
+
+    reopened = ProfileStore(str(tmp_path))
+    assert reopened.get("c", ["a", "b"], ["name"]) == {"a": {"name": "Ada"}}
+
+
+def test_many_small_flushes_merge_the_newest_segments(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    rng = random.Random(0)
+    expected = {}
+    for batch in range(200):
+        ids = [f"c{rng.randrange(300)}" for _ in range(5)]
+        store.upsert("c", ids, [{"name": f"{cid}@{batch}"} for cid in ids])
+        expected.update({cid: f"{cid}@{batch}" for cid in ids})
+        if batch % 5 == 0:
+            gone = rng.sample(sorted(expected), 2)
+            store.delete("c", gone)
+            for cid in gone:
+                del expected[cid]
+        store.flush()
+
+    segments = store._collection("c").segments
+    assert len(segments) <= 9
+    # The oldest segment holds most rows, so it is not rewritten by every merge
+    assert len(segments[0].ids) > sum(len(s.ids) for s in segments[1:])
+
+    reopened = ProfileStore(str(tmp_path))
+    found = reopened.get("c", [f"c{i}" for i in range(300)], ["name"])
+    assert {cid: p["name"] for cid, p in found.items()} == expected
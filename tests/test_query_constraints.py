@@ -0,0 +1,82 @@
+import pytest
+
+from database.vectorstore import FILTER_CITY, FILTER_COUNTRY, FILTER_INDUSTRY, FILTER_LANGUAGES, FILTER_YEARS
+from services import query_constraints
+from services.query_constraints import QueryConstraints, extract_constraints
+
+VOCABULARY = {
+    FILTER_COUNTRY: frozenset({"united arab emirates", "uae", "qatar", "egypt"}),
+    FILTER_CITY: frozenset({"dubai", "abu dhabi", "doha", "cairo"}),
+    FILTER_LANGUAGES: frozenset({"arabic", "english", "french"}),
+    FILTER_INDUSTRY: frozenset({"fintech", "oil & gas", "healthcare"}),
+}
+
+
+@pytest.fixture(autouse=True)
+def vocabulary(monkeypatch):
+    version = [0]
+    monkeypatch.setattr(query_constraints, "filter_vocabulary", lambda: (version[0], VOCABULARY))
+    monkeypatch.setattr(query_constraints, "_patterns", (-1, None))
+    return version
+
+
+def test_every_spelling_of_a_country_the_index_holds_is_matched():
+    assert extract_constraints("Engineers in the Emirates").countries == ["uae", "united arab emirates"]
+
+
+def test_cities_need_a_place_cue():
+    assert extract_constraints("Bankers based in Dubai, Abu Dhabi or Doha").cities == ["dubai", "abu dhabi", "doha"]
+    assert extract_constraints("Dubai Holding alumni").cities == []
+
+
+def test_languages_need_to_be_spoken():
+    assert extract_constraints("Analysts who speak French and Arabic").languages == ["french", "arabic"]
+    assert extract_constraints("Arabic-speaking lawyers").languages == ["arabic"]
+    assert extract_constraints("Arabic calligraphy experts").languages == []
+
+
+def test_industries_need_a_cue():
+    assert extract_constraints("Experts in oil & gas").industries == ["oil & gas"]
+    assert extract_constraints("People from the healthcare sector").industries == ["healthcare"]
+    assert extract_constraints("Fintech founders").industries == []
+
+
+@pytest.mark.parametrize("query, bounds", [
+    ("between 3 and 5 years", (3, 5)),
+    ("5-10 years of experience", (5, 10)),
+    ("at least 7 years", (7, None)),
+    ("more than 4 yrs", (5, None)),
+    ("under 2 years", (None, 1)),
+    ("up to 6 years", (None, 6)),
+    ("10+ years", (10, None)),
+    ("8 years", (8, None)),
+    ("senior engineers", (None, None)),
+])
+def test_years_of_experience(query, bounds):
+    constraints = extract_constraints(query)
+    assert (constraints.min_years, constraints.max_years) == bounds
+
+
+def test_to_where_combines_every_constraint():
+    where = extract_constraints(
+        "French and Arabic speakers in Dubai or Doha from the fintech industry with at least 5 years"
+    ).to_where()
+    assert where == {"$and": [
+        {FILTER_CITY: {"$in": ["dubai", "doha"]}},
+        {FILTER_INDUSTRY: "fintech"},
+        {FILTER_LANGUAGES: {"$contains": "french"}},
+        {FILTER_LANGUAGES: {"$contains": "arabic"}},
+        {FILTER_YEARS: {"$gte": 5}},
+    ]}
+
+
+def test_to_where_is_none_without_constraints():
+    assert QueryConstraints().to_where() is None
+    assert extract_constraints("great communicators").to_where() is None
+
+
+def test_patterns_follow_vocabulary_changes(vocabulary, monkeypatch):
+    assert extract_constraints("Engineers in Riyadh").cities == []
+    vocabulary[0] += 1
+    monkeypatch.setitem(VOCABULARY, FILTER_CITY, VOCABULARY[FILTER_CITY] | {"riyadh"})
+    assert extract_constraints("Engineers in Riyadh").cities == ["riyadh"]
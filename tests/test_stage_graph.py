@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from services.stage_graph import StageGraph
+
+
+def test_stages_receive_their_inputs():
+    async def rewrite():
+        return "python"
+
+    async def search(rewrite):
+        return [rewrite, "results"]
+
+    graph = StageGraph()
+    graph.add("rewrite", rewrite)
+    graph.add("search", search, after=("rewrite",))
+    results = asyncio.run(graph.run())
+    assert results == {"rewrite": "python", "search": ["python", "results"]}
+    assert set(graph.timings) == {"rewrite", "search"}
+
+
+def test_inputs_must_be_added_first():
+    async def stage():
+        return None
+
+    graph = StageGraph()
+    with pytest.raises(ValueError):
+        graph.add("search", stage, after=("rewrite",))
+    graph.add("rewrite", stage)
+    with pytest.raises(ValueError):
+        graph.add("rewrite", stage)
+
+
+def test_failed_speculative_stage_passes_none_to_dependents():
+    async def guess():
+        raise RuntimeError("speculation failed")
+
+    async def pick(guess):
+        return guess
+
+    graph = StageGraph()
+    graph.add("guess", guess, speculative=True)
+    graph.add("pick", pick, after=("guess",))
+    assert asyncio.run(graph.run()) == {"guess": None, "pick": None}
+
+
+def test_failed_stage_cancels_running_siblings():
+    cancelled = []
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("search failed")
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def dependent(slow):
+        cancelled.append("dependent ran")
+
+    graph = StageGraph()
+    graph.add("fail", fail)
+    graph.add("slow", slow)
+    graph.add("dependent", dependent, after=("slow",))
+    with pytest.raises(ValueError, match="search failed"):
+        asyncio.run(graph.run())
+    assert cancelled == ["slow"]
+
+
+def test_cancelling_the_caller_cancels_every_stage():
+    cancelled = []
+
+    async def main():
+        running = asyncio.Event()
+
+        async def slow(name):
+            running.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+
+        graph = StageGraph()
+        graph.add("a", lambda: slow("a"))
+        graph.add("b", lambda: slow("b"))
+        task = asyncio.ensure_future(graph.run())
+        await running.wait()
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert sorted(cancelled) == ["a", "b"]
@@ -0,0 +1,31 @@
+from database import vectorstore
+from models.candidate import CandidateProfile
+
+
+def test_hydrate_recovers_profiles_missing_from_the_store(monkeypatch):
+    requested = []
+
+    def fetch_profiles(ids):
+        requested.extend(ids)
+        return [CandidateProfile(id="lost", name="Lina", city="Dubai")]
+
+    monkeypatch.setattr(vectorstore, "fetch_profiles", fetch_profiles)
+    collection = vectorstore._store.active_collection()
+    vectorstore._profiles.upsert(collection, ["kept"], [{"name": "Kai", "city": "Doha"}])
+
+    results = [{"id": "kept", "score": 0.9}, {"id": "lost", "score": 0.8}, {"id": "old", "score": 0.7, "name": "Ola"}]
+    hydrated = vectorstore.hydrate(results, ("name", "city"))
+
+    # Rows from indexes built before the profile store carry their fields already
+    assert requested == ["lost"]
+    assert [(r["name"], r.get("city")) for r in hydrated] == [("Kai", "Doha"), ("Lina", "Dubai"), ("Ola", None)]
+    # The recovered profile is back in the store for the next lookup
+    assert vectorstore._profiles.get(collection, ["lost"], ["name"]) == {"lost": {"name": "Lina"}}
+
+
+def test_hydrate_keeps_results_when_recovery_fails(monkeypatch):
+    def fetch_profiles(ids):
+        raise ConnectionError("database down")
+
+    monkeypatch.setattr(vectorstore, "fetch_profiles", fetch_profiles)
+    assert vectorstore.hydrate([{"id": "gone", "score": 0.5}], ("name",)) == [{"id": "gone", "score": 0.5}]